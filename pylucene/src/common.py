@@ -1,8 +1,13 @@
+import argparse
 from ast import literal_eval
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import lucene
 import json
+import numpy as np
 import pandas
 import os
+import zlib
 from tqdm import tqdm
 import pandas as pd
 
@@ -23,19 +28,93 @@ def get_config(path):
         return json.load(conf_file)
 
 
-def create_wiki_mapping():
-    conf = get_config("conf.json")
+# sorted by title hash, one 24 byte row per title, the check columns tell titles with the same hash apart
+WIKI_MAPPING_DTYPE = np.dtype([("title_hash", "<u8"), ("title_crc", "<u4"), ("title_length", "<u4"),
+                               ("part", "<u4"), ("row", "<u4")])
+
+
+def title_hash(title):
+    """
+    64 bit hash of a title, collisions are unlikely for a few million titles.
+    """
+    return int.from_bytes(hashlib.blake2b(title.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def title_check(title):
+    """
+    CRC32 and UTF-8 length of a title, stored next to its hash to verify a lookup without reading the part.
+    """
+    encoded = title.encode("utf-8")
+    return zlib.crc32(encoded), len(encoded)
+
+
+def _part_mapping(part_id, part_path):
+    titles = pd.read_csv(part_path, encoding="utf-8", usecols=["title"])["title"].astype(str)
+    mapping = np.empty(len(titles), dtype=WIKI_MAPPING_DTYPE)
+    mapping["title_hash"] = [title_hash(title) for title in titles]
+    checks = [title_check(title) for title in titles]
+    mapping["title_crc"] = [crc for crc, _ in checks]
+    mapping["title_length"] = [length for _, length in checks]
+    mapping["part"] = part_id
+    mapping["row"] = np.arange(len(titles))
+    return mapping
+
+
+def wiki_mapping_parts_path(wiki_mapping_path):
+    return f"{wiki_mapping_path}.parts.json"
+
+
+def create_wiki_mapping(config_path="conf.json", workers=4):
+    """
+    Writes the title -> (part, row) table as a .npy file sorted by title hash, part file names are written
+    next to it. Parts are read in parallel, only their title column.
+    """
+    conf = get_config(config_path)
     wiki_parts_path = conf["wiki_parts_path"]
-    wiki_parts = os.listdir(wiki_parts_path)
-    wiki_mapping = {}
-    for part in tqdm(wiki_parts):
-        df = pandas.read_csv(os.path.join(wiki_parts_path, part), encoding="utf-8")
-        for idx, row in df.iterrows():
-            wiki_mapping[row["title"]] = part
-    # save mapping as json
+    wiki_mapping_path = conf["wiki_mapping_path"]
+    wiki_parts = sorted(os.listdir(wiki_parts_path))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_part_mapping, part_id, os.path.join(wiki_parts_path, part))
+                   for part_id, part in enumerate(wiki_parts)]
+        mappings = [future.result() for future in tqdm(futures)]
+
+    mapping = np.concatenate(mappings) if mappings else np.empty(0, dtype=WIKI_MAPPING_DTYPE)
+    mapping.sort(order="title_hash")
+    np.save(wiki_mapping_path, mapping)
+    with open(wiki_mapping_parts_path(wiki_mapping_path), "w", encoding="utf-8") as parts_file:
+        json.dump(wiki_parts, parts_file)
+
 
-    with open("wiki_mapping.json", "w") as f:
-        json.dump(wiki_mapping, f)
+class WikiMapping:
+    """
+    Memory mapped title -> (part file, row) table, opening it reads only the part names. An offline tool for
+    finding the source row of a page, the search engine shows results from stored fields and does not use it.
+    """
+
+    def __init__(self, wiki_mapping_path, wiki_parts_path):
+        self.mapping = np.load(wiki_mapping_path, mmap_mode="r")
+        self.title_hashes = self.mapping["title_hash"]
+        self.wiki_parts_path = wiki_parts_path
+        with open(wiki_mapping_parts_path(wiki_mapping_path), encoding="utf-8") as parts_file:
+            self.parts = json.load(parts_file)
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def get(self, title):
+        """
+        Part file name and row of the title in it, None for unknown titles. Rows with the hash of the title are
+        checked against its CRC32 and length, so a hash collision does not return another page and no part file
+        is read.
+        """
+        hashed = np.uint64(title_hash(title))
+        crc, length = title_check(title)
+        start = int(np.searchsorted(self.title_hashes, hashed, side="left"))
+        end = int(np.searchsorted(self.title_hashes, hashed, side="right"))
+        for entry in self.mapping[start:end]:
+            if int(entry["title_crc"]) == crc and int(entry["title_length"]) == length:
+                return self.parts[int(entry["part"])], int(entry["row"])
+        return None
 
 
 def read_infobox_from_infobox_string(infobox_string):
@@ -57,4 +136,14 @@ def read_infobox_from_infobox_string(infobox_string):
 
 
 if __name__ == '__main__':
-    create_wiki_mapping()
+    cli_parser = argparse.ArgumentParser(description='Create or query the title mapping of the wiki parts.')
+    cli_parser.add_argument('--conf', default='conf.json', help='Path to the configuration file.')
+    cli_parser.add_argument('--lookup', nargs='+', metavar='TITLE', help='Print the part and row of the titles.')
+    cli_args = cli_parser.parse_args()
+    if cli_args.lookup:
+        conf = get_config(cli_args.conf)
+        wiki_mapping = WikiMapping(conf["wiki_mapping_path"], conf["wiki_parts_path"])
+        for title in cli_args.lookup:
+            print(title, wiki_mapping.get(title))
+    else:
+        create_wiki_mapping(cli_args.conf)
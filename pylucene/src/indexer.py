@@ -1,71 +1,174 @@
+import argparse
+import json
 import os
-from ast import literal_eval
+import queue
+import threading
 from timeit import default_timer as timer
 
 import lucene
 import pandas as pd
 from java.nio.file import Paths
-from org.apache.lucene.document import Document, Field, TextField
-from org.apache.lucene.index import IndexWriter, IndexWriterConfig
+from org.apache.lucene.document import Document, Field, StoredField, TextField
+from org.apache.lucene.index import IndexWriter, IndexWriterConfig, TieredMergePolicy
 from org.apache.lucene.store import NIOFSDirectory
 from tqdm import tqdm
 
 from common import get_analyzer, get_config, read_infobox_from_infobox_string
 
+DEFAULT_INDEXER_CONF = {
+    "threads": 4,
+    "ram_buffer_mb": 256,
+    "max_merged_segment_mb": 5120,
+    "segments_per_tier": 10,
+    "commit_every_parts": 100,
+}
 
-def add_doc_to_index(row):
+
+def create_document(title, terms, infobox):
     doc = Document()
-    doc.add(Field("title", row["title"], TextField.TYPE_STORED))
-    doc.add(Field("terms", row["terms"], TextField.TYPE_STORED))
-    if not pd.isna(row["infobox"]):
-        infobox_data = read_infobox_from_infobox_string(row)
+    doc.add(Field("title", title, TextField.TYPE_STORED))
+    doc.add(Field("terms", terms, TextField.TYPE_STORED))
+    if not pd.isna(infobox):
+        infobox_data = read_infobox_from_infobox_string(infobox)
         if "infobox_name" in infobox_data:
             doc.add(Field("infobox_name", infobox_data["infobox_name"], TextField.TYPE_STORED))
         if "infobox_dict" in infobox_data:
             for key, value in infobox_data["infobox_dict"].items():
                 doc.add(Field("infobox_key", key, TextField.TYPE_STORED))
                 doc.add(Field("infobox_value", value, TextField.TYPE_STORED))
+            # parsed properties for showing results, the search engine does not read the wiki parts
+            doc.add(StoredField("infobox", json.dumps(infobox_data["infobox_dict"], ensure_ascii=False)))
     return doc
 
+
+def read_part_documents(part_path):
+    """
+    Lucene documents of one wiki part. Columns are read as whole, rows are not materialized as Series.
+    """
+    df = pd.read_csv(part_path, encoding="utf-8", usecols=["title", "terms", "infobox"])
+    return [create_document(title, terms, infobox)
+            for title, terms, infobox in zip(df["title"].values, df["terms"].values, df["infobox"].values)]
+
+
 class PyLuceneIndexer:
     def __init__(self, config_path):
         self.conf = get_config(config_path)
         self.wiki_parts_path = self.conf["wiki_parts_path"]
+        self.indexer_conf = {**DEFAULT_INDEXER_CONF, **self.conf.get("indexer", {})}
 
-    def create_index(self):
+    def create_index_writer(self, tuned=True):
+        """
+        Writer of the index. Without `tuned` it keeps the Lucene defaults, like the sequential baseline.
+        """
         store = NIOFSDirectory(Paths.get(self.conf.get("index_path", "skwiki_pylucene_index")))
-        analyzer = get_analyzer()
-        index_writer_config = IndexWriterConfig(analyzer)
+        index_writer_config = IndexWriterConfig(get_analyzer())
         index_writer_config.setOpenMode(IndexWriterConfig.OpenMode.APPEND)
-        index_writer = IndexWriter(store, index_writer_config)
+        if not tuned:
+            return IndexWriter(store, index_writer_config)
+        # documents are flushed to a new segment once the buffer is full, not after a fixed number of them
+        index_writer_config.setRAMBufferSizeMB(float(self.indexer_conf["ram_buffer_mb"]))
+        index_writer_config.setMaxBufferedDocs(IndexWriterConfig.DISABLE_AUTO_FLUSH)
+        merge_policy = TieredMergePolicy()
+        merge_policy.setMaxMergedSegmentMB(float(self.indexer_conf["max_merged_segment_mb"]))
+        merge_policy.setSegmentsPerTier(float(self.indexer_conf["segments_per_tier"]))
+        index_writer_config.setMergePolicy(merge_policy)
+        return IndexWriter(store, index_writer_config)
 
-        start_timer = timer()
-        documents = 0
+    def _index_parts(self, index_writer, parts, progress, state):
+        """
+        Worker thread. Builds the documents of a whole part and adds them to the shared writer,
+        IndexWriter is thread safe and analyzes documents of different threads concurrently.
+        An exception is kept in the state for the main thread and stops the other workers.
+        """
+        lucene.getVMEnv().attachCurrentThread()
+        while not state["errors"]:
+            try:
+                part = parts.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                documents = read_part_documents(os.path.join(self.wiki_parts_path, part))
+                for doc in documents:
+                    index_writer.addDocument(doc)
+            except Exception as e:
+                with state["lock"]:
+                    state["errors"].append((part, e))
+                return
+            with state["lock"]:
+                state["documents"] += len(documents)
+                state["parts"] += 1
+                if state["parts"] % self.indexer_conf["commit_every_parts"] == 0:
+                    index_writer.commit()
+                progress.update(1)
+                progress.set_postfix({"docs": state["documents"], "current_doc_size": len(documents)})
 
-        doc_id = 0
+    def create_index(self, threads=None):
+        threads = threads or self.indexer_conf["threads"]
+        index_writer = self.create_index_writer()
 
+        start_timer = timer()
+        wiki_parts = os.listdir(self.wiki_parts_path)
+        parts = queue.Queue()
+        for part in wiki_parts:
+            parts.put(part)
+        state = {"documents": 0, "parts": 0, "lock": threading.Lock(), "errors": []}
+        progress = tqdm(total=len(wiki_parts), desc="Indexing")
+        workers = [threading.Thread(target=self._index_parts, args=(index_writer, parts, progress, state))
+                   for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        progress.close()
+        if state["errors"]:
+            # changes since the last commit are dropped, the index is not reported as complete
+            index_writer.rollback()
+            part, error = state["errors"][0]
+            raise RuntimeError(f"Indexing of part {part} failed, {len(state['errors'])} parts failed") from error
+        index_writer.commit()
+        index_writer.close()
+        return self._report(state["documents"], timer() - start_timer, f"Threads: {threads}")
+
+    def create_index_baseline(self):
+        """
+        The sequential indexer before threads were added: rows of a part are read with iterrows and added one by
+        one to a writer with the default configuration. Kept for the docs/sec comparison.
+        """
+        index_writer = self.create_index_writer(tuned=False)
+        start_timer = timer()
+        documents = 0
         wiki_parts = os.listdir(self.wiki_parts_path)
         progress = tqdm(wiki_parts, total=len(wiki_parts), desc="Indexing")
-        for part in progress:
+        for part_idx, part in enumerate(progress, start=1):
             df = pd.read_csv(os.path.join(self.wiki_parts_path, part), encoding="utf-8")
-
             documents += df.shape[0]
-            for row_idx, row in df.iterrows():
-                doc = add_doc_to_index(row)
-                index_writer.addDocument(doc)
-
-            doc_id += 1
-            if doc_id % 100 == 0:
+            for _, row in df.iterrows():
+                index_writer.addDocument(create_document(row["title"], row["terms"], row["infobox"]))
+            if part_idx % 100 == 0:
                 index_writer.commit()
             progress.set_postfix({"docs": documents, "current_doc_size": df.shape[0]})
         index_writer.commit()
         index_writer.close()
+        return self._report(documents, timer() - start_timer, "Baseline")
 
-        print("Indexing took: ", timer() - start_timer)
+    @staticmethod
+    def _report(documents, run_time, name):
+        print("Indexing took: ", run_time)
         print("Indexed documents: ", documents)
+        print(f"{name}, docs/sec: {documents / run_time:.2f}")
+        return documents, run_time
 
 
 if __name__ == '__main__':
+    cli_parser = argparse.ArgumentParser(description='Create the PyLucene index of the wiki parts.')
+    cli_parser.add_argument('--conf', default='data/conf.json', help='Path to the configuration file.')
+    cli_parser.add_argument('--threads', type=int, help='Indexing threads.')
+    cli_parser.add_argument('--baseline', action='store_true',
+                            help='Index with the previous sequential implementation, to compare docs/sec.')
+    cli_args = cli_parser.parse_args()
     lucene.initVM(vmargs=['-Djava.awt.headless=true'])
-    indexer = PyLuceneIndexer("data/conf.json")
-    indexer.create_index()
+    indexer = PyLuceneIndexer(cli_args.conf)
+    if cli_args.baseline:
+        indexer.create_index_baseline()
+    else:
+        indexer.create_index(cli_args.threads)
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+from org.apache.lucene.analysis.tokenattributes import CharTermAttribute
+from org.apache.lucene.index import Term
+from org.apache.lucene.search import BooleanClause, BooleanQuery, BoostQuery, TermQuery
+
+DEFAULT_QUERY_CACHE_SIZE = 1024
+
+
+def analyze(analyzer, field, text):
+    """
+    Tokens of `text` as the analyzer of `field` indexes them. The analyzer reuses its token stream
+    components per thread, so only the attribute lookup is repeated.
+    """
+    tokens = []
+    token_stream = analyzer.tokenStream(field, text)
+    term_attribute = token_stream.addAttribute(CharTermAttribute.class_)
+    try:
+        token_stream.reset()
+        while token_stream.incrementToken():
+            tokens.append(term_attribute.toString())
+        token_stream.end()
+    finally:
+        token_stream.close()
+    return tokens
+
+
+class QueryBuilder:
+    """
+    Builds the query objects directly: every tokenized query term is a boosted optional clause of every boost
+    field and every preprocessed term is a required clause of the terms field. Terms are never parsed,
+    so Lucene syntax characters in them have no meaning. Built queries are immutable and cached.
+    """
+
+    def __init__(self, analyzer, boosts, cache_size=DEFAULT_QUERY_CACHE_SIZE):
+        self.analyzer = analyzer
+        self.boosts = boosts
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build(self, query_terms, parsed_terms_query):
+        builder = BooleanQuery.Builder()
+        for term in query_terms:
+            for field, boost in self.boosts.items():
+                for token in analyze(self.analyzer, field, term):
+                    builder.add(BoostQuery(TermQuery(Term(field, token)), float(boost)), BooleanClause.Occur.SHOULD)
+        for term in parsed_terms_query:
+            builder.add(TermQuery(Term("terms", term)), BooleanClause.Occur.MUST)
+        return builder.build()
+
+    def build(self, query_terms, parsed_terms_query):
+        key = (tuple(query_terms), tuple(parsed_terms_query))
+        with self._lock:
+            query = self._cache.get(key)
+            if query is not None:
+                self._cache.move_to_end(key)
+                return query
+        query = self._build(query_terms, parsed_terms_query)
+        with self._lock:
+            self._cache[key] = query
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return query
@@ -1,17 +1,16 @@
-from collections import defaultdict
-import os
+import argparse
 import json
 import logging
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
 
 import lucene
 from java.nio.file import Paths
-from org.apache.lucene.index import DirectoryReader
-from org.apache.lucene.queryparser.classic import QueryParser
-from org.apache.lucene.search import IndexSearcher
-from org.apache.lucene.store import NIOFSDirectory
+from org.apache.lucene.search import SearcherManager, TopScoreDocCollector
+from org.apache.lucene.store import MMapDirectory, NIOFSDirectory
 
-from common import get_analyzer, get_config, read_infobox_from_infobox_string
+from common import get_analyzer, get_config
+from query_builder import DEFAULT_QUERY_CACHE_SIZE, QueryBuilder
 from text_preprocessor import TextPreprocessor, Tokenizer
 import arg_parser
 
@@ -37,59 +36,83 @@ logger = logging.getLogger(__name__)
 
 
 class PyLuceneSearchEngine:
-    def __init__(self, config_path):
+    def __init__(self, config_path, directory=None, text_preprocessor=None):
+        """
+        `directory` is "mmap" (default) or "niofs". `text_preprocessor` can be shared between engines,
+        loading the lemmatizer is slow.
+        """
         self.conf = get_config(config_path)
 
-        with open(self.conf["stop_words_path"], encoding="UTF-8") as stopwords_file:
-            stopwords = [line.strip() for line in stopwords_file]
-        self.text_preprocessor = TextPreprocessor(self.conf["preprocessor_components"], stopwords)
-
-        with open(self.conf["wiki_mapping_path"], encoding="UTF-8") as wiki_mapping_file:
-            self.wiki_mapping = json.load(wiki_mapping_file)
-
-        self.wiki_parts_path = self.conf["wiki_parts_path"]
-
-        store = NIOFSDirectory(Paths.get(self.conf["index_path"]))
-        self.searcher = IndexSearcher(DirectoryReader.open(store))
+        if text_preprocessor is None:
+            with open(self.conf["stop_words_path"], encoding="UTF-8") as stopwords_file:
+                stopwords = [line.strip() for line in stopwords_file]
+            text_preprocessor = TextPreprocessor(self.conf["preprocessor_components"], stopwords)
+        self.text_preprocessor = text_preprocessor
+
+        directory = directory or self.conf.get("directory", "mmap")
+        index_path = Paths.get(self.conf["index_path"])
+        store = MMapDirectory(index_path) if directory == "mmap" else NIOFSDirectory(index_path)
+        # hands out searchers over the latest commit, reopened when the index changes
+        self.searcher_manager = SearcherManager(store, None)
+        self.vm_env = lucene.getVMEnv()
         self.boosts = self.conf.get("boosts", {})
         self.analyzer = get_analyzer()
-        self.query_parser = QueryParser("<default field>", self.analyzer)
+        self.query_builder = QueryBuilder(self.analyzer, self.boosts,
+                                          self.conf.get("query_cache_size", DEFAULT_QUERY_CACHE_SIZE))
+        # hits are counted exactly only up to this number, so top-k search can skip blocks of documents
+        # which can not enter the results (block-max WAND)
+        self.total_hits_threshold = self.conf.get("total_hits_threshold", 1000)
         self.tokenizer = Tokenizer()
 
-    def load_full_results(self, documents):
-        wiki_parts = defaultdict(list)
-        for idx, document in enumerate(documents):
-            title = document.get("title")
-            wiki_parts[self.wiki_mapping[title]].append((title, len(documents) - idx))
-
-        full_results = [None] * len(documents)
-        for wiki_part, docs in wiki_parts.items():
-            df = pd.read_csv(os.path.join(self.wiki_parts_path, wiki_part), encoding="utf-8")
-            full_docs = df.loc[df["title"].isin([doc[0] for doc in docs])]
-            full_docs = full_docs.set_index("title").to_dict(orient="index")
-            for doc in docs:
-                title, idx = doc
-                full_results[idx - 1] = full_docs[title]
-
+    def _attach_thread(self):
+        self.vm_env.attachCurrentThread()
+
+    def refresh(self):
+        """
+        Picks up commits of a running indexer, searches in progress keep their searcher.
+        """
+        self.searcher_manager.maybeRefresh()
+
+    @staticmethod
+    def load_full_results(documents):
+        """
+        Infobox name and properties of the documents, read from their stored fields.
+        Indexes created before the infobox field was stored have to be rebuilt.
+        """
+        full_results = []
+        for document in documents:
+            infobox = document.get("infobox")
+            full_results.append({
+                "title": document.get("title"),
+                "infobox_name": document.get("infobox_name"),
+                "infobox_dict": json.loads(infobox) if infobox is not None else None,
+            })
         return full_results
 
-    def show_results(self, score_docs):
-        score_docs = list(reversed(score_docs))
-        docs = []
-        results_full = self.load_full_results([self.searcher.doc(score_doc.doc) for score_doc in score_docs])
-
-        for idx, score_doc_and_full_results in enumerate(zip(score_docs, results_full[::-1])):
-            score_doc, full_result = score_doc_and_full_results
-            doc = self.searcher.doc(score_doc.doc)
-            docs.append(doc)
-            score = score_doc.score
-            title = doc.get("title")
-            idx = len(score_docs) - idx
+    def top_results(self, query, results_count):
+        """
+        Top hits as (full result, score). Stored fields are read once per hit with the searcher which found it.
+        """
+        searcher = self.searcher_manager.acquire()
+        try:
+            collector = TopScoreDocCollector.create(results_count, self.total_hits_threshold)
+            searcher.search(query, collector)
+            score_docs = collector.topDocs().scoreDocs
+            documents = [searcher.doc(score_doc.doc) for score_doc in score_docs]
+        finally:
+            self.searcher_manager.release(searcher)
+        return list(zip(self.load_full_results(documents), [score_doc.score for score_doc in score_docs]))
+
+    @staticmethod
+    def show_results(results):
+        for idx, (full_result, score) in reversed(list(enumerate(results, start=1))):
+            title = full_result["title"]
             logger.info(f"Result {idx}: {title} - {score}")
             logger.info(f"URL: https://sk.wikipedia.org/wiki/{title.replace(' ', '_')}")
-            if not pd.isna(full_result["infobox"]):
-                logger.info(f"Infobox: {read_infobox_from_infobox_string(full_result['infobox']).get('infobox_name', 'Not found :(')}")
+            if full_result["infobox_dict"] is not None:
+                logger.info(f"Infobox: {full_result['infobox_name'] or 'Not found :('}")
             logger.info("-" * 100)
+        results_full = [full_result for full_result, _ in results]
 
         prompt = "\nEnter result number to learn more about the document. [Q] to go back.: "
         msg = "-" * 100 + prompt
@@ -107,57 +130,110 @@ class PyLuceneSearchEngine:
                 continue
 
             result_to_show = results_full[num_to_show - 1]
-            if not pd.isna(result_to_show["infobox"]):
-                infobox = read_infobox_from_infobox_string(result_to_show['infobox'])
-                print("\n".join("{}: {}".format(k, v) for k, v in infobox['infobox_dict'].items()))
-                print("Infobox name: ", infobox.get("infobox_name", "Infobox Name not found"))
+            if result_to_show["infobox_dict"] is not None:
+                print("\n".join("{}: {}".format(k, v) for k, v in result_to_show["infobox_dict"].items()))
+                print("Infobox name: ", result_to_show["infobox_name"] or "Infobox Name not found")
             else:
                 print("Sorry this Article doesn't have a infobox.")
 
+    def build_query(self, user_query, parsed_terms_query):
+        return self.query_builder.build(self.tokenizer.process(user_query), parsed_terms_query)
+
     def search(self, user_query, results_count):
+        self.refresh()
         parsed_terms_query = self.text_preprocessor.preprocess(user_query)
-        query_string = ""
-
-        for term in self.tokenizer.process(user_query):
-            for key, value in self.boosts.items():
-                query_string += f"{key}:{term}^{value} "
-
-        for term in parsed_terms_query:
-            query_string += f"+terms:{term} "
-
-        query = self.query_parser.parse(query_string)
-
-        score_docs = self.searcher.search(query, results_count).scoreDocs
-        print(f"{len(score_docs)} total matching documents.")
-
-        self.show_results(score_docs)
-
-def calculate_metrics(retrieved, relevant):
-    retrieved = set(retrieved)
-    relevant = set(relevant)
-    precision = len(retrieved.intersection(relevant)) / len(retrieved)
-    recall = len(retrieved.intersection(relevant)) / len(relevant)
-    f1 = 2 * precision * recall / (precision + recall)
-    return precision, recall, f1
-
-def calculate_map(retrieved, relevant):
-    ap = 0
-    for idx, doc in enumerate(retrieved):
-        if doc in relevant:
-            ap += calculate_metrics(retrieved[:idx + 1], relevant)[0]
-    return ap / len(relevant)
-
-def calculate_precision_at_k(retrieved, relevant, k):
-    return calculate_metrics(retrieved[:k], relevant)[0]
+        results = self.top_results(self.build_query(user_query, parsed_terms_query), results_count)
+        print(f"{len(results)} total matching documents.")
+
+        self.show_results(results)
+
+    def preprocess_queries(self, queries):
+        return [(query, self.text_preprocessor.preprocess(query)) for query in queries]
+
+    def search_many(self, preprocessed_queries, results_count, threads=4):
+        """
+        Searches preprocessed queries with a pool of JVM attached threads sharing the searcher manager.
+        Results are returned in the order of the queries.
+        """
+        self.refresh()
+
+        def search_one(preprocessed_query):
+            user_query, parsed_terms_query = preprocessed_query
+            return self.top_results(self.build_query(user_query, parsed_terms_query), results_count)
+
+        if threads == 1:
+            return [search_one(preprocessed_query) for preprocessed_query in preprocessed_queries]
+        with ThreadPoolExecutor(max_workers=threads, initializer=self._attach_thread) as executor:
+            return list(executor.map(search_one, preprocessed_queries))
+
+    def close(self):
+        self.searcher_manager.close()
+
+
+def benchmark(config_path, queries, results_count=10, threads=4):
+    """
+    Compares the previous path, one NIOFSDirectory searcher serving queries one by one, with MMapDirectory
+    and concurrent query threads on the same index. Queries are preprocessed once, only searching is timed.
+    """
+    text_preprocessor = None
+    preprocessed_queries = None
+    for directory, run_threads in (("niofs", 1), ("mmap", 1), ("mmap", threads)):
+        search_engine = PyLuceneSearchEngine(config_path, directory, text_preprocessor)
+        text_preprocessor = search_engine.text_preprocessor
+        if preprocessed_queries is None:
+            preprocessed_queries = search_engine.preprocess_queries(queries)
+        start = timer()
+        search_engine.search_many(preprocessed_queries, results_count, run_threads)
+        run_time = timer() - start
+        logger.info(f"{directory}, {run_threads} threads: {len(queries) / run_time:.2f} queries/s")
+        search_engine.close()
+
+
+def write_run(config_path, queries, results_path, results_count=10, threads=4):
+    """
+    Searches all queries and writes the results as JSONL in the format of the native search engine,
+    so `skwiki_evaluate.py` can compare both engines on the same relevance judgments.
+    """
+    search_engine = PyLuceneSearchEngine(config_path)
+    results = search_engine.search_many(search_engine.preprocess_queries(queries), results_count, threads)
+    search_engine.close()
+    with open(results_path, "w", encoding="utf-8") as results_file:
+        for query, query_results in zip(queries, results):
+            record = {
+                "query": query,
+                "results": [
+                    {"rank": rank, "title": full_result["title"], "score": float(score)}
+                    for rank, (full_result, score) in enumerate(query_results, start=1)
+                ],
+            }
+            results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    logger.info(f"Results for {len(queries)} queries written to {results_path}")
 
 
 if __name__ == "__main__":
+    cli_parser = argparse.ArgumentParser(description="Search Slovak wikipedia with PyLucene.")
+    cli_parser.add_argument("--conf", default="conf.json", help="Path to the configuration file.")
+    cli_parser.add_argument("--benchmark", help="File with one query per line, compares the search modes.")
+    cli_parser.add_argument("--threads", type=int, default=4, help="Query threads of the benchmark.")
+    cli_parser.add_argument("--queries", help="File with one query per line, writes their results to --output.")
+    cli_parser.add_argument("--output", default="pylucene_results.jsonl", help="JSONL file for the results.")
+    cli_parser.add_argument("-n", type=int, default=10, help="Number of results per query.")
+    cli_args = cli_parser.parse_args()
     lucene.initVM(vmargs=["-Djava.awt.headless=true"])
-    search_engine = PyLuceneSearchEngine("conf.json")
-    arg_parser = arg_parser.ArgParser()
-    while True:
-        args = input("Enter the program arguments. [Q] to quit: ")
-        if args.lower() == "q":
-            break
-        params = arg_parser.parse(args)
-        search_engine.search(params["query"], params['results_count'])
+    if cli_args.benchmark:
+        with open(cli_args.benchmark, encoding="UTF-8") as queries_file:
+            benchmark_queries = [line.strip() for line in queries_file if line.strip()]
+        benchmark(cli_args.conf, benchmark_queries, threads=cli_args.threads)
+    elif cli_args.queries:
+        with open(cli_args.queries, encoding="UTF-8") as queries_file:
+            run_queries = [line.strip() for line in queries_file if line.strip()]
+        write_run(cli_args.conf, run_queries, cli_args.output, cli_args.n, cli_args.threads)
+    else:
+        search_engine = PyLuceneSearchEngine(cli_args.conf)
+        arg_parser = arg_parser.ArgParser()
+        while True:
+            args = input("Enter the program arguments. [Q] to quit: ")
+            if args.lower() == "q":
+                break
+            params = arg_parser.parse(args)
+            search_engine.search(params["query"], params['results_count'])
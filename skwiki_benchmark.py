@@ -0,0 +1,61 @@
+import argparse
+import json
+import sys
+
+import slovak_wiki_search_engine as swse
+from slovak_wiki_search_engine import benchmark, postings_codecs
+
+
+def parse_cli_args():
+    cli_parser = argparse.ArgumentParser(description='Benchmarks of the Slovak wikipedia search engine.')
+    cli_parser.add_argument('--conf', default='data/conf.json', help='Path to the configuration file.')
+    cli_parser.add_argument('--size', default='100k', choices=list(benchmark.BENCHMARK_DUMPS),
+                            help='Sample dump to benchmark on.')
+    cli_parser.add_argument('--output', default='bench_output.json', help='Where to save the JSON report.')
+    cli_parser.add_argument('--baseline', help='JSON report of a previous run to compare against.')
+    cli_parser.add_argument('--threshold', type=float, default=benchmark.DEFAULT_REGRESSION_THRESHOLD,
+                            help='Relative change reported as a regression.')
+    subparsers = cli_parser.add_subparsers(dest='benchmark', required=True)
+
+    search_parser = subparsers.add_parser('search', help='Query latency and throughput.')
+    search_parser.add_argument('--queries', default=benchmark.DEFAULT_BENCHMARK_QUERIES_PATH)
+    search_parser.add_argument('--repeat', type=int, default=3)
+    search_parser.add_argument('--warmup', type=int, default=1)
+    search_parser.add_argument('-n', type=int, default=swse.arg_parser.DEFAULT_RESULTS_COUNT)
+
+    index_parser = subparsers.add_parser('index', help='Per-stage indexing throughput and memory.')
+    index_parser.add_argument('--workers', type=int, help='Defaults to workers from the configuration.')
+
+    codecs_parser = subparsers.add_parser('codecs', help='Size and decode speed of the postings codecs.')
+    codecs_parser.add_argument('--codecs', nargs='+', choices=list(postings_codecs.POSTINGS_CODECS),
+                               help='Codecs to compare, all by default.')
+    codecs_parser.add_argument('--repeat', type=int, default=3)
+    return cli_parser.parse_args()
+
+
+if __name__ == '__main__':
+    cli_args = parse_cli_args()
+    conf = swse.utils.get_conf(cli_args.conf)
+    swse.utils.setup_logging(verbose=conf.get('verbose', True))
+    swse.instrumentation.configure(conf.get('instrumentation'))
+
+    if cli_args.benchmark == 'search':
+        report = benchmark.search_benchmark(conf, cli_args.size, cli_args.queries, cli_args.n,
+                                            cli_args.repeat, cli_args.warmup)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    elif cli_args.benchmark == 'codecs':
+        report = benchmark.codec_benchmark(conf, cli_args.size, cli_args.codecs, cli_args.repeat)
+        print(benchmark.format_codec_summary(report))
+    else:
+        report = benchmark.indexing_benchmark(conf, cli_args.size, cli_args.workers or conf.get('workers'))
+        print(benchmark.format_indexing_summary(report))
+    benchmark.save_report(report, cli_args.output)
+
+    if cli_args.baseline:
+        with open(cli_args.baseline, encoding='utf-8') as baseline_file:
+            regressions = benchmark.compare_reports(report, json.load(baseline_file), cli_args.threshold)
+        for metric, change in regressions.items():
+            print(f"Regression {metric}: {change['baseline']:.4f} -> {change['current']:.4f} "
+                  f"({change['change'] * 100:+.1f}%)")
+        if regressions:
+            sys.exit(1)
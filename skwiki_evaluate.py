@@ -0,0 +1,38 @@
+import argparse
+import json
+
+from slovak_wiki_search_engine import evaluation
+
+
+def parse_cli_args():
+    cli_parser = argparse.ArgumentParser(description='Evaluates search results against relevance judgments.')
+    cli_parser.add_argument('--qrels', required=True, help='JSONL file with the relevant titles of every query.')
+    cli_parser.add_argument('--run', action='append', default=[], metavar='NAME=PATH',
+                            help='JSONL results of an engine, e.g. native=results.jsonl. Can be repeated.')
+    cli_parser.add_argument('-k', type=int, nargs='+', default=list(evaluation.DEFAULT_CUTOFFS),
+                            help='Cutoffs of precision, recall, F1 and nDCG.')
+    cli_parser.add_argument('--output', help='Where to save the JSON report.')
+    cli_parser.add_argument('--export-queries', help='Writes the judged queries one per line and exits.')
+    cli_args = cli_parser.parse_args()
+    if not cli_args.export_queries and not cli_args.run:
+        cli_parser.error('at least one --run is required, unless --export-queries is given')
+    if min(cli_args.k) < 1:
+        cli_parser.error('cutoffs -k have to be at least 1')
+    return cli_args
+
+
+if __name__ == '__main__':
+    cli_args = parse_cli_args()
+    qrels = evaluation.read_qrels(cli_args.qrels)
+    if cli_args.export_queries:
+        with open(cli_args.export_queries, 'w', encoding='utf-8') as queries_file:
+            queries_file.write(''.join(f'{query}\n' for query in qrels))
+    else:
+        reports = {}
+        for run in cli_args.run:
+            name, _, path = run.rpartition('=')
+            reports[name or path] = evaluation.evaluate(qrels, evaluation.read_run(path), cli_args.k)
+        print(evaluation.compare(reports))
+        if cli_args.output:
+            with open(cli_args.output, 'w', encoding='utf-8') as output_file:
+                json.dump(reports, output_file, indent=2, ensure_ascii=False)
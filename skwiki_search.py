@@ -1,26 +1,103 @@
+from timeit import default_timer as timer
+
+START = timer()
+
+import argparse
+import gc
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import slovak_wiki_search_engine as swse
 
-if __name__ == '__main__':
-    conf = swse.utils.get_conf('data/conf.json')
+
+def parse_cli_args():
+    cli_parser = argparse.ArgumentParser(description='Search Slovak wikipedia.')
+    cli_parser.add_argument('--conf', default='data/conf.json', help='Path to the configuration file.')
+    cli_parser.add_argument('--queries', help='File with one query per line. Runs all queries in batch mode.')
+    cli_parser.add_argument('--output', default='results.jsonl', help='JSONL file for batch mode results.')
+    cli_parser.add_argument('-o', action='store_true', help='Use OR instead of AND in batch mode.')
+    cli_parser.add_argument('-n', type=int, default=swse.arg_parser.DEFAULT_RESULTS_COUNT,
+                            help='Number of results per query in batch mode.')
+    cli_parser.add_argument('--ranking', choices=swse.ranking.RANKING_MODES,
+                            help='Ranking function, overrides the configuration.')
+    cli_parser.add_argument('--fast-start', action='store_true',
+                            help='Show the prompt at once, the index is loaded while the first query is typed.')
+    return cli_parser.parse_args()
+
+
+def create_search_engine(conf, warmup=False):
     inverted_index_path = conf.get('inverted_index_path')
-    preprocessor_components = conf.get('preprocessor_components')
     workers = conf.get('workers')
-    arg_parser = swse.arg_parser.ArgParser()
+    shards = conf.get('shards')
+    if shards and shards > 1:
+        if not os.path.exists(swse.sharding.statistics_path(inverted_index_path)):
+            if conf.get('spark_index_path'):
+                swse.spark_index.import_shards(conf, conf['spark_index_path'], workers)
+            else:
+                swse.sharding.create_shards(conf, shards, workers)
+        search_engine = swse.sharding.ShardedSearchEngine(conf, shards)
+    else:
+        if os.path.exists(inverted_index_path):
+            inverted_index = swse.segments.load(inverted_index_path)
+        else:
+            inverted_index = swse.indexer.InvertedIndex()
+            inverted_index.create(conf, workers)
+        search_engine = swse.search_engine.SearchEngine(inverted_index, conf)
+    if warmup:
+        # the lemmatizer is loaded before the first query, not by it
+        search_engine.query_analyzer.warmup()
+    # the index lives as long as the process, later collections do not have to traverse it
+    gc.freeze()
+    return search_engine
+
+
+if __name__ == '__main__':
+    cli_args = parse_cli_args()
+    conf = swse.utils.get_conf(cli_args.conf)
+    swse.utils.setup_logging(verbose=conf.get('verbose', True))
+    if cli_args.ranking:
+        conf['ranking'] = cli_args.ranking
+    swse.instrumentation.configure(conf.get('instrumentation'))
+    store_path = swse.document_store.store_path(conf.get('inverted_index_path'))
+    store = swse.document_store.DocumentStore(store_path) if os.path.exists(store_path) else None
 
-    if os.path.exists(inverted_index_path):
-        inverted_index = swse.indexer.load(inverted_index_path)
+    if cli_args.queries:
+        search_engine = create_search_engine(conf)
+        queries = swse.utils.read_lines(cli_args.queries)
+        boolean_operator = swse.QueryBooleanOperator.OR if cli_args.o else swse.QueryBooleanOperator.AND
+        results = search_engine.search_many(queries, boolean_operator, cli_args.n, workers=conf.get('workers'))
+        swse.utils.write_results_jsonl(cli_args.output, queries, results)
     else:
-        inverted_index = swse.indexer.InvertedIndex()
-        inverted_index.create(conf, workers)
-
-    search_engine = swse.search_engine.SearchEngine(inverted_index, conf)
-
-    while True:
-        args = input("Enter the program arguments. [Q] to quit: ")
-        if args.lower() == "q":
-            break
-        params = arg_parser.parse(args)
-        results = search_engine.search(params['query'], params['boolean_operator'], params['results_count'])
-        swse.utils.format_results(results)
+        if cli_args.fast_start:
+            loader = ThreadPoolExecutor(max_workers=1)
+            loading = loader.submit(create_search_engine, conf, True)
+        else:
+            loading = None
+            search_engine = create_search_engine(conf, warmup=True)
+        print(f'Ready for queries in {timer() - START:.2f}s')
+        arg_parser = swse.arg_parser.ArgParser()
+        first_query = True
+        while True:
+            args = input("Enter the program arguments. [Q] to quit: ")
+            if args.lower() == "q":
+                if loading is not None:
+                    # the executor joins its worker at exit, which would wait for the whole index to load
+                    loader.shutdown(wait=False, cancel_futures=True)
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(0)
+                break
+            params = arg_parser.parse(args)
+            query_start = timer()
+            if loading is not None:
+                search_engine = loading.result()
+                loading = None
+                loader.shutdown()
+            results = search_engine.search(params['query'], params['boolean_operator'], params['results_count'],
+                                           params['phrases'])
+            if first_query:
+                first_query = False
+                # waiting for the index is part of the first query in fast start mode
+                print(f'First query answered in {timer() - query_start:.2f}s')
+            swse.utils.format_results(results, store)
@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+
+import slovak_wiki_search_engine as swse
+
+
+def parse_cli_args():
+    cli_parser = argparse.ArgumentParser(description='Apply an incremental Slovak wikipedia dump to the index.')
+    cli_parser.add_argument('--conf', default='data/conf.json', help='Path to the configuration file.')
+    cli_parser.add_argument('--dump', help='Incremental dump with added and changed pages.')
+    cli_parser.add_argument('--deleted', help='File with titles of deleted pages, one per line.')
+    cli_parser.add_argument('--merge', choices=['auto', 'segments', 'full'], default='auto',
+                            help='auto merges incremental segments when there are too many of them, '
+                                 'full also rewrites the base segment and drops all tombstones.')
+    return cli_parser.parse_args()
+
+
+if __name__ == '__main__':
+    cli_args = parse_cli_args()
+    conf = swse.utils.get_conf(cli_args.conf)
+    swse.utils.setup_logging(verbose=conf.get('verbose', True))
+    swse.instrumentation.configure(conf.get('instrumentation'))
+    inverted_index_path = conf.get('inverted_index_path')
+    if not os.path.exists(inverted_index_path):
+        print(f'{inverted_index_path} does not exist, build the index with skwiki_search.py first.')
+        sys.exit(1)
+
+    inverted_index = swse.segments.load(inverted_index_path)
+    if not isinstance(inverted_index, swse.segments.SegmentedIndex):
+        inverted_index = swse.segments.SegmentedIndex(inverted_index, conf.get('max_segments'))
+
+    deleted_titles = swse.utils.read_lines(cli_args.deleted) if cli_args.deleted else []
+    if cli_args.dump:
+        inverted_index.update(conf, cli_args.dump, deleted_titles, conf.get('workers'))
+    else:
+        for title in deleted_titles:
+            inverted_index.delete(title)
+
+    if cli_args.merge == 'auto':
+        inverted_index.maybe_merge()
+    elif cli_args.merge == 'full':
+        terms = swse.utils.load_or_create_csv(conf['already_processed_path'], ['doc_id', 'title', 'terms'])
+        inverted_index.merge_in_background(full=True, terms=terms.set_index('title')['terms'].to_dict())
+    else:
+        inverted_index.merge_in_background()
+    inverted_index.wait_for_merge()
+    inverted_index.save(inverted_index_path)
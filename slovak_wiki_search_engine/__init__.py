@@ -1,12 +1,17 @@
+import os
 import sys
 # insert to sys path slovak_wiki_search_engine directory
-sys.path.insert(0, 'slovak_wiki_search_engine')
+_package_path = os.path.dirname(os.path.abspath(__file__))
+if _package_path not in sys.path:
+    sys.path.insert(0, _package_path)
+# modules import each other by top-level name, share the same instrumentation registry with them
+import instrumentation
 from .utils import *
 from .arg_parser import *
 from .indexer import *
 from .search_engine import *
-
-
-
-
-setup_logging()
+from . import segments
+from . import sharding
+from . import spark_index
+from . import ranking
+from . import document_store
@@ -15,6 +15,12 @@ class QueryBooleanOperator(Enum):
 DEFAULT_BOOLEAN_OPERATOR = QueryBooleanOperator.AND
 DEFAULT_RESULTS_COUNT = 10
 DEFAULT_RELEAVNT_DOCS_COUNT = 1000
+# "vladimir putin" is a phrase, "vladimir putin"~2 allows two other terms between them
+PHRASE_PATTERN = re.compile(r'"([^"]+)"(?:~(\d+))?')
+
+
+def parse_phrases(query: str) -> list[tuple[str, int]]:
+    return [(match.group(1), int(match.group(2) or 0)) for match in PHRASE_PATTERN.finditer(query or '')]
 
 
 class ArgParser:
@@ -23,6 +29,7 @@ class ArgParser:
         self.boolean_operator = DEFAULT_BOOLEAN_OPERATOR
         self.results_count = DEFAULT_RESULTS_COUNT
         self.relevant_documents_count = DEFAULT_RELEAVNT_DOCS_COUNT
+        self.phrases: list[tuple[str, int]] = []
 
     def parse(self, args, validate=True):
         if isinstance(args, list):
@@ -31,6 +38,7 @@ class ArgParser:
         query_match = re.search('^([^-]*)', args)
         if query_match:
             self.query = query_match.group(1).strip()
+        self.phrases = parse_phrases(self.query)
 
         self.boolean_operator = QueryBooleanOperator.OR if re.search('-o', args) else QueryBooleanOperator.AND
         number_of_results_match = re.search(r'-n (\d+)', args)
@@ -0,0 +1,405 @@
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime
+from timeit import default_timer as timer
+from typing import Optional, Union
+
+import numpy as np
+
+import indexer
+import postings_codecs
+import segments
+import utils
+from arg_parser import QueryBooleanOperator
+from search_engine import SearchEngine
+from text_preprocessor import PIPELINE_COMPONENTS, create_component
+from vectorizer import TfIdfVectorizer
+from wiki_parser import WikiPage, WikiParser
+
+logger = logging.getLogger(__name__)
+
+# sample dumps referenced by the tests
+BENCHMARK_DUMPS = {
+    '100k': {
+        'sk_wikipedia_dump_path': 'data/sk_wikipedia_dump_small_100k.xml',
+        'inverted_index_path': 'data/inverted_index_100k.pickle',
+    },
+    '1m': {
+        'sk_wikipedia_dump_path': 'data/sk_wikipedia_dump_small_1m.xml',
+        'inverted_index_path': 'data/inverted_index_1m.pickle',
+    },
+}
+DEFAULT_BENCHMARK_QUERIES_PATH = 'data/benchmark_queries.json'
+LATENCY_PERCENTILES = (50, 95, 99)
+# relative increase of a lower-is-better metric reported as a regression
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+
+
+def peak_rss_mb() -> dict[str, float]:
+    """
+    Peak resident set size of this process and of its finished children (worker pools), in MB.
+    """
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    unit = 1024 * 1024 if platform.system() == 'Darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def benchmark_conf(conf: dict[str, Union[str, int, list[str]]], dump_size: str) -> dict:
+    if dump_size not in BENCHMARK_DUMPS:
+        raise ValueError(f'Unknown dump size {dump_size}, expected one of {list(BENCHMARK_DUMPS)}')
+    conf = dict(conf)
+    conf.update(BENCHMARK_DUMPS[dump_size])
+    return conf
+
+
+def load_benchmark_queries(queries_path=DEFAULT_BENCHMARK_QUERIES_PATH) -> list[dict[str, str]]:
+    with open(queries_path, encoding='utf-8') as queries_file:
+        return json.load(queries_file)
+
+
+def load_or_build_index(conf: dict, workers: int) -> tuple['indexer.InvertedIndex', dict[str, float]]:
+    inverted_index_path = conf['inverted_index_path']
+    start = timer()
+    if os.path.exists(inverted_index_path):
+        inverted_index = segments.load(inverted_index_path)
+        return inverted_index, {'index_load_s': timer() - start}
+    if not os.path.exists(conf['sk_wikipedia_dump_path']):
+        raise FileNotFoundError(f"Neither {inverted_index_path} nor {conf['sk_wikipedia_dump_path']} exists.")
+    inverted_index = indexer.InvertedIndex()
+    inverted_index.create(conf, workers)
+    build_time = timer() - start
+    start = timer()
+    inverted_index = indexer.load(inverted_index_path)
+    return inverted_index, {'index_build_s': build_time, 'index_load_s': timer() - start}
+
+
+def latency_summary(latencies: list[float]) -> dict[str, float]:
+    latencies_ms = np.array(latencies) * 1000
+    summary = {f'p{p}_ms': float(np.percentile(latencies_ms, p)) for p in LATENCY_PERCENTILES}
+    summary['mean_ms'] = float(latencies_ms.mean())
+    summary['max_ms'] = float(latencies_ms.max())
+    return summary
+
+
+def run_search_benchmark(search_engine: SearchEngine, queries: list[dict[str, str]],
+                         results_count=10, repeat=3, warmup=1) -> dict:
+    """
+    Replays the query set `repeat` times after `warmup` untimed rounds and reports latency percentiles
+    over all runs, per query medians and sequential throughput.
+    """
+    for _ in range(warmup):
+        for query in queries:
+            search_engine.search(query['query'], QueryBooleanOperator[query['boolean_operator']], results_count)
+
+    latencies = []
+    per_query = {query['name']: [] for query in queries}
+    start = timer()
+    for _ in range(repeat):
+        for query in queries:
+            query_start = timer()
+            search_engine.search(query['query'], QueryBooleanOperator[query['boolean_operator']], results_count)
+            latency = timer() - query_start
+            latencies.append(latency)
+            per_query[query['name']].append(latency)
+    total_time = timer() - start
+
+    return {
+        'queries': len(queries),
+        'runs': len(latencies),
+        'latency': latency_summary(latencies),
+        'throughput_qps': len(latencies) / total_time,
+        'per_query_p50_ms': {name: float(np.median(values) * 1000) for name, values in per_query.items()},
+    }
+
+
+def search_benchmark(conf: dict, dump_size='100k', queries_path=DEFAULT_BENCHMARK_QUERIES_PATH,
+                     results_count=10, repeat=3, warmup=1) -> dict:
+    conf = benchmark_conf(conf, dump_size)
+    inverted_index, index_times = load_or_build_index(conf, conf.get('workers', 4))
+
+    start = timer()
+    search_engine = SearchEngine(inverted_index, conf)
+    engine_init_time = timer() - start
+
+    queries = load_benchmark_queries(queries_path)
+    report = {
+        'benchmark': 'search',
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dump_size': dump_size,
+        'documents': inverted_index.documents_count,
+        'terms': len(inverted_index.vocabulary),
+        **index_times,
+        'engine_init_s': engine_init_time,
+    }
+    report.update(run_search_benchmark(search_engine, queries, results_count, repeat, warmup))
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def _count_tokens(documents: list[WikiPage]) -> int:
+    tokens = 0
+    for document in documents:
+        terms = document.terms if document.terms else document.raw_text
+        if isinstance(terms, str):
+            tokens += len(terms.split())
+        elif terms:
+            tokens += len(terms)
+    return tokens
+
+
+def _worker_stats(wall_start: float, cpu_start: float, items: int) -> dict[str, float]:
+    wall_time = timer() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    return {
+        'pid': os.getpid(),
+        'items': items,
+        'wall_s': wall_time,
+        'cpu_s': cpu_time,
+        'cpu_utilization': cpu_time / wall_time if wall_time else 0.0,
+        'peak_rss_mb': peak_rss_mb()['self'],
+    }
+
+
+def _parse_stage(pages: list[tuple[str, int]], pbar_position=0) -> tuple[list[WikiPage], dict]:
+    wall_start, cpu_start = timer(), time.process_time()
+    parsed_pages, _ = WikiParser().parse_pages(pages, pbar_position)
+    stats = _worker_stats(wall_start, cpu_start, len(pages))
+    stats['tokens_out'] = _count_tokens(parsed_pages)
+    return parsed_pages, stats
+
+
+def _component_stage(documents: list[WikiPage], component_name: str, conf: dict,
+                     pbar_position=0) -> tuple[list[WikiPage], dict]:
+    tokens_in = _count_tokens(documents)
+    # model loading is part of the stage, it is paid by every worker
+    wall_start, cpu_start = timer(), time.process_time()
+    component = create_component(component_name, conf)
+    for document in documents:
+        component.process(document)
+    stats = _worker_stats(wall_start, cpu_start, len(documents))
+    stats.update({'tokens_in': tokens_in, 'tokens_out': _count_tokens(documents)})
+    return documents, stats
+
+
+def _stage_summary(stage_wall: float, worker_stats: list[dict]) -> dict:
+    documents = sum(stats['items'] for stats in worker_stats)
+    tokens = sum(stats.get('tokens_in', stats.get('tokens_out', 0)) for stats in worker_stats)
+    return {
+        'wall_s': stage_wall,
+        'docs_per_s': documents / stage_wall if stage_wall else 0.0,
+        'tokens_per_s': tokens / stage_wall if stage_wall else 0.0,
+        'documents': documents,
+        'tokens': tokens,
+        'peak_rss_mb': max(stats['peak_rss_mb'] for stats in worker_stats),
+        'workers': worker_stats,
+    }
+
+
+def _run_parallel_stage(data: list, func, *args, workers=4) -> tuple[list, dict]:
+    start = timer()
+    if workers == 1:
+        results = [func(data, *args)]
+    else:
+        results = utils.generic_parallel_execution(data, func, *args, workers=workers, executor='process')
+    stage_wall = timer() - start
+    documents = [document for worker_documents, _ in results for document in worker_documents]
+    return documents, _stage_summary(stage_wall, [stats for _, stats in results])
+
+
+def _run_local_stage(documents: list[WikiPage], func) -> dict:
+    tokens = _count_tokens(documents)
+    wall_start, cpu_start = timer(), time.process_time()
+    func()
+    stats = _worker_stats(wall_start, cpu_start, len(documents))
+    stats['tokens_in'] = tokens
+    return _stage_summary(stats['wall_s'], [stats])
+
+
+def indexing_benchmark(conf: dict, dump_size='100k', workers=4) -> dict:
+    """
+    Runs the indexing pipeline stage by stage on a sample dump. Each preprocessing component runs as its own
+    parallel stage, so the report shows docs/s, tokens/s, peak RSS and CPU utilization of every worker per stage.
+    Stage wall time includes sending documents to and from the workers. The already processed documents cache
+    is neither read nor written, the index is saved to a temporary path and removed afterwards.
+    """
+    conf = benchmark_conf(conf, dump_size)
+    stages = {}
+    total_start = timer()
+
+    pages = WikiParser().get_pages(conf['sk_wikipedia_dump_path'])
+    documents, stages['parse'] = _run_parallel_stage(pages, _parse_stage, workers=workers)
+    del pages
+
+    for component_name in PIPELINE_COMPONENTS:
+        if component_name not in conf['preprocessor_components'] or component_name == 'document_saver':
+            continue
+        documents, stages[component_name] = _run_parallel_stage(
+            documents, _component_stage, component_name, conf, workers=workers
+        )
+    for document in documents:
+        document.raw_text = None
+
+    inverted_index = indexer.InvertedIndex()
+    stages['index'] = _run_local_stage(documents, lambda: inverted_index._create_index(documents))
+    tfidf_vectorizer = TfIdfVectorizer(inverted_index)
+    stages['vectorize'] = _run_local_stage(documents, lambda: tfidf_vectorizer.vectorize_documents(documents))
+
+    index_path = f"{conf['inverted_index_path']}.benchmark"
+    stages['save'] = _run_local_stage(documents, lambda: inverted_index.save(index_path))
+    stages['save']['index_size_mb'] = os.path.getsize(index_path) / (1024 * 1024)
+    os.remove(index_path)
+
+    total_time = timer() - total_start
+    for stage in stages.values():
+        stage['share'] = stage['wall_s'] / total_time
+    return {
+        'benchmark': 'index',
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dump_size': dump_size,
+        'workers': workers,
+        'documents': len(documents),
+        'terms': len(inverted_index._index),
+        'total_s': total_time,
+        'slowest_stage': max(stages, key=lambda name: stages[name]['wall_s']),
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def format_indexing_summary(report: dict) -> str:
+    lines = [f"{'stage':<20}{'wall s':>10}{'share':>8}{'docs/s':>12}{'tokens/s':>14}{'RSS MB':>10}{'CPU':>8}"]
+    for name, stage in report['stages'].items():
+        cpu = np.mean([worker['cpu_utilization'] for worker in stage['workers']])
+        lines.append(f"{name:<20}{stage['wall_s']:>10.2f}{stage['share'] * 100:>7.1f}%{stage['docs_per_s']:>12.1f}"
+                     f"{stage['tokens_per_s']:>14.1f}{stage['peak_rss_mb']:>10.1f}{cpu * 100:>7.0f}%")
+    lines.append(f"Total {report['total_s']:.2f}s, slowest stage: {report['slowest_stage']}")
+    return '\n'.join(lines)
+
+
+def run_codec_benchmark(inverted_index: 'indexer.InvertedIndex', codec_names: Optional[list[str]] = None,
+                        repeat=3) -> dict:
+    """
+    Encodes the postings of all terms with every codec and reports size against speed. Decoding is the best of
+    `repeat` rounds over all terms. Intersection looks up every 256th document of the terms with more than one block,
+    which shows how much the skip table saves.
+    """
+    postings_lists = []
+    for _, index_record in inverted_index.items():
+        postings = sorted(index_record._postings())
+        # every document of the term was deleted from a segment
+        if not postings:
+            continue
+        doc_ids, term_frequencies = zip(*postings)
+        postings_lists.append((doc_ids, term_frequencies))
+    postings_count = sum(len(doc_ids) for doc_ids, _ in postings_lists)
+    lookups = [set(doc_ids[::256]) for doc_ids, _ in postings_lists if len(doc_ids) > postings_codecs.BLOCK_SIZE]
+
+    codecs = {}
+    for codec_name in codec_names or list(postings_codecs.POSTINGS_CODECS):
+        codec = postings_codecs.get_codec(codec_name)
+        start = timer()
+        encoded = [codec.encode(doc_ids, term_frequencies) for doc_ids, term_frequencies in postings_lists]
+        encode_time = timer() - start
+        decode_times, intersect_times = [], []
+        for _ in range(repeat):
+            start = timer()
+            for encoded_postings in encoded:
+                codec.decode(encoded_postings)
+            decode_times.append(timer() - start)
+            start = timer()
+            long_postings = (encoded_postings for encoded_postings in encoded
+                             if encoded_postings.count > postings_codecs.BLOCK_SIZE)
+            for encoded_postings, doc_ids in zip(long_postings, lookups):
+                codec.intersect(encoded_postings, doc_ids)
+            intersect_times.append(timer() - start)
+        size = sum(encoded_postings.size for encoded_postings in encoded)
+        codecs[codec_name] = {
+            'size_mb': size / (1024 * 1024),
+            'bytes_per_posting': size / postings_count if postings_count else 0.0,
+            'encode_s': encode_time,
+            'decode_s': min(decode_times),
+            'decode_postings_per_s': postings_count / min(decode_times) if min(decode_times) else 0.0,
+            'intersect_s': min(intersect_times),
+        }
+    return {'terms': len(postings_lists), 'postings': postings_count, 'codecs': codecs}
+
+
+def codec_benchmark(conf: dict, dump_size='100k', codec_names: Optional[list[str]] = None, repeat=3) -> dict:
+    conf = benchmark_conf(conf, dump_size)
+    inverted_index, index_times = load_or_build_index(conf, conf.get('workers', 4))
+    report = {
+        'benchmark': 'codecs',
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dump_size': dump_size,
+        'documents': inverted_index.documents_count,
+        **index_times,
+    }
+    report.update(run_codec_benchmark(inverted_index, codec_names, repeat))
+    return report
+
+
+def format_codec_summary(report: dict) -> str:
+    lines = [f"{'codec':<12}{'size MB':>10}{'B/posting':>11}{'encode s':>10}{'decode s':>10}"
+             f"{'postings/s':>14}{'intersect s':>13}"]
+    for name, codec in report['codecs'].items():
+        lines.append(f"{name:<12}{codec['size_mb']:>10.2f}{codec['bytes_per_posting']:>11.2f}"
+                     f"{codec['encode_s']:>10.2f}{codec['decode_s']:>10.3f}{codec['decode_postings_per_s']:>14.0f}"
+                     f"{codec['intersect_s']:>13.4f}")
+    lines.append(f"{report['postings']} postings of {report['terms']} terms")
+    return '\n'.join(lines)
+
+
+def _flatten(report: dict, prefix='') -> dict[str, float]:
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare_reports(current: dict, baseline: dict,
+                    threshold=DEFAULT_REGRESSION_THRESHOLD) -> dict[str, dict[str, float]]:
+    """
+    Compares numeric metrics of two reports. Throughput metrics are higher-is-better, everything else
+    (latency, time, memory) is lower-is-better. Returns metrics which got worse by more than `threshold`.
+    """
+    current_flat, baseline_flat = _flatten(current), _flatten(baseline)
+    regressions = {}
+    for metric, value in current_flat.items():
+        old_value = baseline_flat.get(metric)
+        if not old_value or metric in ('queries', 'runs', 'documents', 'terms', 'workers', 'postings') \
+                or metric.endswith(('.documents', '.tokens', '.share')):
+            continue
+        change = (value - old_value) / old_value
+        if 'throughput' in metric or metric.endswith('_per_s'):
+            change = -change
+        if change > threshold:
+            regressions[metric] = {'baseline': old_value, 'current': value, 'change': change}
+    return regressions
+
+
+def save_report(report: dict, output_path: str):
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2, ensure_ascii=False)
+    logger.info(f'Benchmark report saved to {output_path}')
@@ -0,0 +1,69 @@
+import hashlib
+import logging
+import math
+import pickle
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TERM_FILTER_CONF = {
+    "enabled": True,
+    "false_positive_rate": 0.01,
+}
+
+
+def filter_path(inverted_index_path: str) -> str:
+    return f'{inverted_index_path}.bloom'
+
+
+class BloomFilter:
+    """
+    Probabilistic set of terms. A term which was added is always reported as present, a term which was not
+    is reported as present with probability `false_positive_rate`, so a miss can be rejected without
+    a dictionary lookup. Uses double hashing of one blake2b digest for all bit positions.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def from_terms(cls, terms: Iterable[str], capacity: int, false_positive_rate=0.01) -> 'BloomFilter':
+        bloom_filter = cls(capacity, false_positive_rate)
+        for term in terms:
+            bloom_filter.add(term)
+        return bloom_filter
+
+    def _positions(self, term: str) -> Iterable[int]:
+        digest = hashlib.blake2b(term.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + idx * second) % self.size for idx in range(self.hashes))
+
+    def add(self, term: str):
+        for position in self._positions(term):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, term: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(term))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def memory_size(self) -> int:
+        return len(self.bits)
+
+    def save(self, path: str):
+        logger.info(f'Saving term filter to {path}')
+        with open(path, 'wb') as filter_file:
+            pickle.dump(self, filter_file)
+
+    @staticmethod
+    def load(path: str) -> 'BloomFilter':
+        with open(path, 'rb') as filter_file:
+            return pickle.load(filter_file)
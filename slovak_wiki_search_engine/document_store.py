@@ -0,0 +1,149 @@
+import json
+import logging
+import mmap
+import struct
+import zlib
+from bisect import bisect_right
+from typing import Iterable, Optional
+
+from postings import read_varint, write_varint
+from wiki_parser import Infobox, WikiPage
+
+logger = logging.getLogger(__name__)
+
+# uncompressed bytes of records per block, a lookup decompresses one block
+DEFAULT_BLOCK_SIZE = 16 * 1024
+_MAGIC = b'SKDS'
+# magic, offset of the offset table, documents count, blocks count
+_TRAILER = struct.Struct('<4sQQQ')
+
+
+def store_path(inverted_index_path: str) -> str:
+    return f'{inverted_index_path}.docs'
+
+
+def _encode_record(document: WikiPage) -> bytes:
+    return json.dumps({
+        'title': document.title,
+        'text': document.raw_text,
+        'infobox_title': document.infobox_title,
+        'infobox': document.infobox.properties if document.infobox else None,
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def _decode_record(doc_id: int, data: bytes) -> WikiPage:
+    record = json.loads(data)
+    infobox = None
+    if record['infobox'] is not None:
+        infobox = Infobox(record['infobox_title'])
+        infobox.properties = record['infobox']
+    return WikiPage(doc_id, record['title'], record['text'], infobox)
+
+
+def write(path: str, documents: Iterable[WikiPage], block_size=DEFAULT_BLOCK_SIZE) -> int:
+    """
+    Writes title, text and infobox of the documents to `path`. Records are grouped into zlib compressed blocks
+    of about `block_size` bytes, followed by the offset table: sorted doc ids, the first record of every block
+    and the block offsets. Returns the number of blocks.
+    """
+    documents = sorted(documents, key=lambda document: document.doc_id)
+    doc_ids = []
+    block_first = []
+    block_offsets = [0]
+    block = bytearray()
+    with open(path, 'wb') as store_file:
+        def flush():
+            compressed = zlib.compress(bytes(block))
+            store_file.write(compressed)
+            block_offsets.append(block_offsets[-1] + len(compressed))
+            block.clear()
+
+        for position, document in enumerate(documents):
+            if not block:
+                block_first.append(position)
+            record = _encode_record(document)
+            write_varint(block, len(record))
+            block += record
+            doc_ids.append(document.doc_id)
+            if len(block) >= block_size:
+                flush()
+        if block:
+            flush()
+
+        # the table is 8 byte aligned, so it can be read in place from the mapped file
+        padding = -block_offsets[-1] % 8
+        store_file.write(b'\0' * padding)
+        table_offset = block_offsets[-1] + padding
+        store_file.write(struct.pack(f'<{len(block_offsets)}Q', *block_offsets))
+        store_file.write(struct.pack(f'<{len(doc_ids)}I', *doc_ids))
+        store_file.write(struct.pack(f'<{len(block_first)}I', *block_first))
+        store_file.write(_TRAILER.pack(_MAGIC, table_offset, len(doc_ids), len(block_first)))
+    logger.info(f'Document store written to {path}, {len(doc_ids)} documents in {len(block_first)} blocks')
+    return len(block_first)
+
+
+class DocumentStore:
+    """
+    Read side of the document store. The file is memory mapped and the offset table is used in place,
+    so opening the store reads only the trailer and fetching a document reads and decompresses one block.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, table_offset, documents_count, blocks_count = _TRAILER.unpack_from(
+            self._mmap, len(self._mmap) - _TRAILER.size)
+        if magic != _MAGIC:
+            raise ValueError(f'{path} is not a document store.')
+        view = memoryview(self._mmap)
+        offset = table_offset
+        self._block_offsets = view[offset:offset + 8 * (blocks_count + 1)].cast('Q')
+        offset += 8 * (blocks_count + 1)
+        self._doc_ids = view[offset:offset + 4 * documents_count].cast('I')
+        offset += 4 * documents_count
+        self._block_first = view[offset:offset + 4 * blocks_count].cast('I')
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def _position(self, doc_id: int) -> Optional[int]:
+        position = bisect_right(self._doc_ids, doc_id) - 1
+        if position < 0 or self._doc_ids[position] != doc_id:
+            return None
+        return position
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self._position(doc_id) is not None
+
+    def _read_block(self, block: int) -> bytes:
+        return zlib.decompress(self._mmap[self._block_offsets[block]:self._block_offsets[block + 1]])
+
+    def get(self, doc_id: int) -> Optional[WikiPage]:
+        """
+        Stored document with its text and infobox, None if the store does not hold it.
+        """
+        position = self._position(doc_id)
+        if position is None:
+            return None
+        block = bisect_right(self._block_first, position) - 1
+        data = self._read_block(block)
+        offset = 0
+        for _ in range(position - self._block_first[block]):
+            length, offset = read_varint(data, offset)
+            offset += length
+        length, offset = read_varint(data, offset)
+        return _decode_record(doc_id, data[offset:offset + length])
+
+    def close(self):
+        # views into the mapped file have to be released before it is closed
+        for view in (self._block_offsets, self._doc_ids, self._block_first):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> 'DocumentStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
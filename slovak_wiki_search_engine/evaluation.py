@@ -0,0 +1,132 @@
+import json
+import logging
+from typing import Iterable, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CUTOFFS = (1, 5, 10)
+
+# query -> title -> graded relevance, 0 is not relevant
+Qrels = dict[str, dict[str, int]]
+# query -> ranked titles
+Run = dict[str, list[str]]
+
+
+def read_qrels(qrels_path: str) -> Qrels:
+    """
+    Relevance judgments, one JSON object per line: {"query": ..., "relevant": {"title": grade, ...}}.
+    `relevant` can also be a list of titles, each with grade 1.
+    """
+    qrels = {}
+    with open(qrels_path, encoding='utf-8') as qrels_file:
+        for line in qrels_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            relevant = record['relevant']
+            if isinstance(relevant, list):
+                relevant = dict.fromkeys(relevant, 1)
+            qrels.setdefault(record['query'], {}).update({title: int(grade) for title, grade in relevant.items()})
+    return qrels
+
+
+def read_run(run_path: str) -> Run:
+    """
+    Ranked results in the format of `utils.write_results_jsonl`, documents are matched to qrels by title,
+    which is the same in every engine.
+    """
+    run = {}
+    with open(run_path, encoding='utf-8') as run_file:
+        for line in run_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            results = sorted(record['results'], key=lambda result: result['rank'])
+            run[record['query']] = [result['title'] for result in results]
+    return run
+
+
+def relevance_matrix(qrels: Qrels, run: Run, queries: list[str], depth: int) -> np.ndarray:
+    """
+    Grades of the first `depth` results of every query, one row per query padded with zeros.
+    Queries missing in the run have no results.
+    """
+    grades = np.zeros((len(queries), depth), dtype=np.int32)
+    for row, query in enumerate(queries):
+        judgments = qrels[query]
+        ranked = run.get(query, [])[:depth]
+        grades[row, :len(ranked)] = [judgments.get(title, 0) for title in ranked]
+    return grades
+
+
+def ideal_matrix(qrels: Qrels, queries: list[str], depth: int) -> np.ndarray:
+    grades = np.zeros((len(queries), depth), dtype=np.int32)
+    for row, query in enumerate(queries):
+        ideal = sorted((grade for grade in qrels[query].values() if grade > 0), reverse=True)[:depth]
+        grades[row, :len(ideal)] = ideal
+    return grades
+
+
+def _dcg(grades: np.ndarray) -> np.ndarray:
+    discounts = 1 / np.log2(np.arange(2, grades.shape[1] + 2))
+    return np.cumsum((2.0 ** grades - 1) * discounts, axis=1)
+
+
+def evaluate(qrels: Qrels, run: Run, cutoffs: Iterable[int] = DEFAULT_CUTOFFS) -> dict[str, Union[int, float]]:
+    """
+    MAP, and precision, recall, F1 and nDCG at every cutoff, averaged over the queries of `qrels` with at least
+    one relevant document. All queries are scored at once on a matrix of grades, average precision is
+    the sum of precisions at relevant ranks, computed from the cumulative sum of hits.
+    """
+    cutoffs = sorted(cutoffs)
+    if not cutoffs or cutoffs[0] < 1:
+        raise ValueError(f'Cutoffs have to be at least 1, got {cutoffs}.')
+    queries = [query for query, judgments in qrels.items() if any(grade > 0 for grade in judgments.values())]
+    if not queries:
+        raise ValueError('Qrels do not contain any relevant document.')
+    depth = max(max(cutoffs), max((len(run.get(query, [])) for query in queries), default=0))
+    grades = relevance_matrix(qrels, run, queries, depth)
+    hits = grades > 0
+    relevant_counts = np.array([sum(grade > 0 for grade in qrels[query].values()) for query in queries])
+    cumulative_hits = np.cumsum(hits, axis=1)
+    ranks = np.arange(1, depth + 1)
+
+    average_precision = (cumulative_hits / ranks * hits).sum(axis=1) / relevant_counts
+    dcg = _dcg(grades)
+    ideal_dcg = _dcg(ideal_matrix(qrels, queries, depth))
+    report = {'queries': len(queries), 'map': float(average_precision.mean())}
+    for k in cutoffs:
+        precision = cumulative_hits[:, k - 1] / k
+        recall = cumulative_hits[:, k - 1] / relevant_counts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        report[f'p@{k}'] = float(precision.mean())
+        report[f'recall@{k}'] = float(recall.mean())
+        report[f'f1@{k}'] = float(f1.mean())
+        report[f'ndcg@{k}'] = float((dcg[:, k - 1] / ideal_dcg[:, k - 1]).mean())
+    missing = sum(query not in run for query in queries)
+    if missing:
+        logger.warning(f'{missing} of {len(queries)} judged queries are missing in the run.')
+    return report
+
+
+def compare(reports: dict[str, dict[str, Union[int, float]]]) -> str:
+    """
+    Table of the metrics of several runs, e.g. both engines or a ranking before and after a change.
+    The last column is the change of the last run against the first one.
+    """
+    names = list(reports)
+    metrics = [metric for metric in reports[names[0]] if metric != 'queries']
+    header = f"{'metric':<12}" + ''.join(f'{name:>14}' for name in names)
+    if len(names) > 1:
+        header += f"{'change':>10}"
+    lines = [header]
+    for metric in metrics:
+        values = [reports[name][metric] for name in names]
+        line = f'{metric:<12}' + ''.join(f'{value:>14.4f}' for value in values)
+        if len(names) > 1:
+            line += f'{values[-1] - values[0]:>+10.4f}'
+        lines.append(line)
+    return '\n'.join(lines)
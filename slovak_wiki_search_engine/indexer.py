@@ -1,40 +1,249 @@
+import gc
 import logging
 import pickle
-from typing import Optional, Union
-
-from tqdm import tqdm
+from array import array
+from typing import TYPE_CHECKING, Iterable, Iterator, KeysView, Optional, Union
 
+import bloom
+import document_store
+import instrumentation
+import postings
+import ranking
+import utils
 import vectorizer
 from text_preprocessor import TextPreprocessor
+from vocabulary import Vocabulary
 from wiki_parser import WikiPage, WikiParser
 
+if TYPE_CHECKING:
+    import postings_codecs
+
 logger = logging.getLogger(__name__)
 
+# version of the pickled index, bumped when indexes saved before can not be searched any more
+INDEX_FORMAT_VERSION = 3
+
 
 class IndexRecord:
     def __init__(self):
         self.document_frequency = 0
         self.corpus_frequency = 0
-        self.documents: set[WikiPage] = set()
+        # postings, doc_id -> number of occurrences of the term in the document, None while they are compressed
+        self._term_frequencies: Optional[dict[int, int]] = {}
+        # postings compressed by a codec of postings_codecs, see `compress`
+        self.encoded: Optional['postings_codecs.EncodedPostings'] = None
+        # block -> postings of the block decoded by a view, see `term_frequency`
+        self._decoded_blocks: Optional[dict[int, dict[int, int]]] = None
+        # doc_id -> delta coded positions of the term in the document, only in positional indexes
+        self.positions: Optional[dict[int, bytes]] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.encoded is not None:
+            state['_term_frequencies'] = None
+        state['_decoded_blocks'] = None
+        return state
+
+    @property
+    def term_frequencies(self) -> dict[int, int]:
+        """
+        Postings, doc_id -> number of occurrences of the term in the document. Compressed postings are decoded
+        on the first access and kept, search decodes them on a copy which lives for one query, see `view`.
+        """
+        if self._term_frequencies is None:
+            doc_ids, term_frequencies = self.encoded.decode()
+            self._term_frequencies = dict(zip(doc_ids.tolist(), term_frequencies.tolist()))
+        return self._term_frequencies
+
+    @property
+    def documents(self) -> KeysView[int]:
+        return self.term_frequencies.keys()
+
+    def _postings(self) -> Iterator[tuple[int, int]]:
+        """
+        (doc_id, term frequency) pairs, compressed postings are decoded without being kept.
+        """
+        if self._term_frequencies is not None:
+            return iter(self._term_frequencies.items())
+        doc_ids, term_frequencies = self.encoded.decode()
+        return zip(doc_ids.tolist(), term_frequencies.tolist())
+
+    def term_frequency(self, doc_id: int) -> int:
+        """
+        Number of occurrences of the term in the document. A view of compressed postings decodes only
+        the block which can hold the document and keeps it for the query.
+        """
+        if self._term_frequencies is not None:
+            return self._term_frequencies.get(doc_id, 0)
+        if self._decoded_blocks is None:
+            return self.term_frequencies.get(doc_id, 0)
+        block = int(self.encoded.blocks([doc_id])[0])
+        if block not in self._decoded_blocks:
+            self._decoded_blocks[block] = self.encoded.block_term_frequencies(block)
+        return self._decoded_blocks[block].get(doc_id, 0)
+
+    def max_term_frequencies(self, doc_ids: list[int]) -> list[int]:
+        """
+        Upper bounds of the term frequencies of the documents. Compressed postings give the largest term frequency
+        of the block which can hold the document, from the skip table, other postings the term frequency itself.
+        """
+        if self._term_frequencies is not None:
+            return [self._term_frequencies.get(doc_id, 0) for doc_id in doc_ids]
+        return self.encoded.max_term_frequencies(doc_ids).tolist()
+
+    def intersect(self, doc_ids: set[int]) -> set[int]:
+        """
+        Documents of `doc_ids` containing the term. Compressed postings decode only the blocks which can hold them.
+        """
+        if self._term_frequencies is None:
+            return self.encoded.intersect(doc_ids)
+        return doc_ids & self._term_frequencies.keys()
 
-    def add_document(self, document: WikiPage):
-        if document not in self.documents:
+    def compress(self, codec: 'postings_codecs.PostingsCodec'):
+        """
+        Replaces the postings by their encoding, they are decoded again when they are read.
+        """
+        doc_ids = sorted(self.term_frequencies)
+        self.encoded = codec.encode(doc_ids, [self._term_frequencies[doc_id] for doc_id in doc_ids])
+        self._term_frequencies = None
+
+    def decompress(self):
+        self._term_frequencies = self.term_frequencies
+        self.encoded = None
+
+    def view(self) -> 'IndexRecord':
+        """
+        Copy sharing the compressed postings and positions, the postings and blocks decoded by it are dropped with it.
+        Records which are not compressed are returned as they are.
+        """
+        if self.encoded is None:
+            return self
+        record = IndexRecord()
+        record.__dict__.update(self.__dict__)
+        record._term_frequencies = None
+        record._decoded_blocks = {}
+        return record
+
+    def add_document(self, doc_id: int):
+        if self.encoded is not None:
+            self.decompress()
+        if doc_id not in self._term_frequencies:
             self.document_frequency += 1
-            self.documents.add(document)
+            self._term_frequencies[doc_id] = 0
         self.corpus_frequency += 1
+        self._term_frequencies[doc_id] += 1
+
+    def set_positions(self, doc_id: int, positions: list[int]):
+        if self.positions is None:
+            self.positions = {}
+        self.positions[doc_id] = postings.encode_positions(positions)
+
+    def get_positions(self, doc_id: int) -> Optional[list[int]]:
+        """
+        Decoded positions of the term in the document, None if the index is not positional.
+        """
+        if self.positions is None:
+            return None
+        return postings.decode_positions(self.positions.get(doc_id, b''))
+
+    def merge(self, other: 'IndexRecord', tombstones: Optional[set[int]] = None):
+        """
+        Adds postings of `other` to this record, skipping deleted documents.
+        The records have to hold different documents, e.g. partial indexes or segments.
+        """
+        if self.encoded is not None:
+            self.decompress()
+        if other.positions is not None and self.positions is None:
+            self.positions = {}
+        if not tombstones:
+            self._term_frequencies.update(other._postings())
+            self.document_frequency += other.document_frequency
+            self.corpus_frequency += other.corpus_frequency
+            if other.positions is not None:
+                self.positions.update(other.positions)
+            return
+
+        for doc_id, term_frequency in other._postings():
+            if doc_id in tombstones:
+                continue
+            self._term_frequencies[doc_id] = term_frequency
+            self.document_frequency += 1
+            self.corpus_frequency += term_frequency
+            if other.positions is not None:
+                self.positions[doc_id] = other.positions[doc_id]
+
+
+def _index_slice(documents: list[WikiPage], text_preprocessor: TextPreprocessor, positional=False,
+                 pbar_position=0) -> 'InvertedIndex':
+    """
+    Preprocesses documents which were not processed before and builds a partial index of the slice.
+    Runs in a worker process, documents travel back to the parent inside the partial index.
+    """
+    to_parse = [document for document in documents if text_preprocessor.needs_preprocessing(document)]
+    text_preprocessor._preprocess(to_parse, pbar_position)
+    partial_index = InvertedIndex(positional=positional)
+    partial_index._create_index(documents)
+    return partial_index
+
+
+def release_terms(documents: list[WikiPage]):
+    """
+    Drops the texts and terms of documents which are not vectorized, postings and term ids replace them.
+    """
+    for document in documents:
+        document.raw_text = None
+        document.terms = None
+
+
+def release_infoboxes(documents: Iterable[WikiPage]):
+    """
+    Drops the infobox properties of documents kept in the document store, the infobox name stays for the listing.
+    """
+    for document in documents:
+        document.infobox = None
 
 
 def load(inverted_index_path: str):
     logger.info(f'Loading inverted index from {inverted_index_path}')
-    with open(inverted_index_path, 'rb') as inverted_index_file:
-        return pickle.load(inverted_index_file)
+    # the index is millions of small objects, collections triggered while they are created find no garbage
+    # and only slow the load down
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(inverted_index_path, 'rb') as inverted_index_file:
+            inverted_index = pickle.load(inverted_index_file)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    format_version = getattr(inverted_index, 'format_version', 0)
+    if format_version != INDEX_FORMAT_VERSION:
+        raise ValueError(f'Inverted index {inverted_index_path} has format {format_version}, this version reads '
+                         f'format {INDEX_FORMAT_VERSION}. Rebuild the index: delete it and run skwiki_search.py again.')
+    return inverted_index
 
 
 class InvertedIndex:
-    def __init__(self):
+    def __init__(self, vocabulary: Optional[Vocabulary] = None, positional=False):
+        self.format_version = INDEX_FORMAT_VERSION
         self.inverted_index_path: Optional[str] = None
-        self._index: dict[str, IndexRecord] = None
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        # records positions of terms for phrase queries and proximity ranking
+        self.positional = positional
+        # term id -> postings
+        self._index: dict[int, IndexRecord] = None
+        self.documents: dict[int, WikiPage] = {}
         self.documents_count: int = 0
+        # number of terms of each document and summed lengths of the fields, used by BM25
+        self.document_lengths: dict[int, int] = {}
+        self.total_lengths: dict[str, int] = dict.fromkeys(ranking.FIELDS, 0)
+        # documents have tf-idf vectors, BM25 ranking does not need them
+        self.vectorized = True
+        # documents have infobox properties, with the document store only the rankings of INFOBOX_RANKINGS keep them
+        self.infoboxes = True
+        # rejects most missing terms before the vocabulary lookup
+        self.term_filter: Optional[bloom.BloomFilter] = None
+        # codec of the compressed postings, None keeps them as dicts
+        self.postings_codec: Optional[str] = None
 
     def save(self, inverted_index_path: str):
         logger.info(f'Saving inverted index to {inverted_index_path}')
@@ -45,39 +254,186 @@ class InvertedIndex:
     def get(self, term: str) -> Optional[IndexRecord]:
         if self._index is None:
             raise Exception('Inverted index does not exist.')
-        indexrecord = self._index.get(term)
+        if self.term_filter is not None and term not in self.term_filter:
+            raise AttributeError(f'Inverted index does not contain term {term}.')
+        term_id = self.vocabulary.get(term)
+        indexrecord = self._index.get(term_id) if term_id is not None else None
         if not indexrecord:
             raise AttributeError(f'Inverted index does not contain term {term}.')
         return indexrecord
 
+    def document(self, doc_id: int) -> WikiPage:
+        return self.documents[doc_id]
+
+    def document_length(self, doc_id: int) -> int:
+        return self.document_lengths[doc_id]
+
+    def average_length(self, field: str) -> float:
+        return self.total_lengths[field] / self.documents_count if self.documents_count else 0.0
+
+    def compress_postings(self, codec_name: str):
+        """
+        Compresses the postings of all terms with the codec `codec_name` of postings_codecs.
+        """
+        import postings_codecs
+
+        codec = postings_codecs.get_codec(codec_name)
+        for index_record in self._index.values():
+            index_record.compress(codec)
+        self.postings_codec = codec_name
+        logger.info(f'Postings compressed by {codec_name}, '
+                    f'{sum(record.encoded.size for record in self._index.values())} bytes')
+
+    def build_term_filter(self, false_positive_rate=0.01) -> bloom.BloomFilter:
+        self.term_filter = bloom.BloomFilter.from_terms((term for term, _ in self.items()), len(self._index),
+                                                        false_positive_rate)
+        logger.info(f'Term filter built, {self.term_filter.memory_size()} bytes for {len(self.term_filter)} terms')
+        return self.term_filter
+
+    def _add_lengths(self, document: WikiPage, length: int):
+        self.document_lengths[document.doc_id] = length
+        self.total_lengths['body'] += length
+        for field, field_length in ranking.field_lengths(document).items():
+            self.total_lengths[field] += field_length
+
+    def items(self) -> Iterator[tuple[str, IndexRecord]]:
+        """
+        Yields (term, index record) pairs. The vocabulary may be shared with other segments,
+        terms without postings in this index are skipped.
+        """
+        for term, term_id in self.vocabulary:
+            index_record = self._index.get(term_id)
+            if index_record:
+                yield term, index_record
+
     def _create_index(self, parsed_documents: list[WikiPage]):
+        """
+        Assigns term ids to the terms of the documents. `document.term_ids` keeps the terms as ids,
+        aligned with the document vector. Positions are indexes into the preprocessed terms.
+        """
+        from tqdm import tqdm
+
         self._index = {}
-        for document in tqdm(parsed_documents, desc='Adding terms to inverted index'):
-            for term in document.terms:
-                if term not in self._index:
-                    self._index[term] = IndexRecord()
-                self._index[term].add_document(document)
+        self.documents = {}
+        self.document_lengths = {}
+        self.total_lengths = dict.fromkeys(ranking.FIELDS, 0)
+        term_ids: dict[str, int] = {}
+        for document in tqdm(parsed_documents, desc='Adding terms to inverted index',
+                             disable=not utils.show_progress()):
+            document_term_ids = array('I')
+            term_positions: dict[int, list[int]] = {}
+            for position, term in enumerate(document.terms):
+                term_id = term_ids.get(term)
+                if term_id is None:
+                    term_id = term_ids[term] = self.vocabulary.add(term)
+                index_record = self._index.get(term_id)
+                if index_record is None:
+                    index_record = self._index[term_id] = IndexRecord()
+                index_record.add_document(document.doc_id)
+                document_term_ids.append(term_id)
+                if self.positional:
+                    term_positions.setdefault(term_id, []).append(position)
+            for term_id, positions in term_positions.items():
+                self._index[term_id].set_positions(document.doc_id, positions)
+            document.term_ids = document_term_ids
+            self.documents[document.doc_id] = document
+            self._add_lengths(document, len(document_term_ids))
+        self.vocabulary.compact()
         self.documents_count = len(parsed_documents)
         logger.info(f"Index created. Total terms in index: {len(self._index)}")
 
+    def merge_partial_indexes(self, partial_indexes: list['InvertedIndex']):
+        """
+        Merges partial indexes of disjoint document slices. Doc ids are assigned before the slices are
+        distributed, so postings are only concatenated. The largest partial index keeps its term ids,
+        term ids of the others are mapped to the merged vocabulary.
+        """
+        partial_indexes = sorted(partial_indexes, key=lambda index: len(index._index), reverse=True)
+        self.vocabulary = partial_indexes[0].vocabulary
+        self.positional = partial_indexes[0].positional
+        self._index = {}
+        self.documents = {}
+        self.documents_count = 0
+        self.document_lengths = {}
+        self.total_lengths = dict.fromkeys(ranking.FIELDS, 0)
+        for partial_index in partial_indexes:
+            if partial_index.vocabulary is self.vocabulary:
+                term_id_map = None
+            else:
+                term_id_map = array('I', [0]) * len(partial_index.vocabulary)
+                for term, term_id in partial_index.vocabulary:
+                    term_id_map[term_id] = self.vocabulary.add(term)
+                for document in partial_index.documents.values():
+                    document.term_ids = array('I', map(term_id_map.__getitem__, document.term_ids))
+
+            for term_id, index_record in partial_index._index.items():
+                if term_id_map is not None:
+                    term_id = term_id_map[term_id]
+                if term_id not in self._index:
+                    self._index[term_id] = index_record
+                else:
+                    self._index[term_id].merge(index_record)
+            self.documents.update(partial_index.documents)
+            self.documents_count += partial_index.documents_count
+            self.document_lengths.update(partial_index.document_lengths)
+            for field, length in partial_index.total_lengths.items():
+                self.total_lengths[field] += length
+        self.vocabulary.compact()
+        logger.info(f"Merged {len(partial_indexes)} partial indexes. Total terms in index: {len(self._index)}")
+
     def create(self, conf: dict[str, Union[str, int, list[str]]], workers=4):
         wikipedia_data_path: str = conf['sk_wikipedia_dump_path']
         inverted_index_path: str = conf['inverted_index_path']
         preprocessor_components: list[str] = conf['preprocessor_components']
+        self.positional = conf.get('positional_postings', utils.DEFAULT_CONF['positional_postings'])
+        self.vectorized = conf.get('ranking', ranking.DEFAULT_RANKING) == 'tfidf'
 
         logger.info(
             f'Creating inverted index. {wikipedia_data_path=}, {inverted_index_path=}')
 
         wiki_parser = WikiParser()
-        parsed_documents = wiki_parser.parse_wiki(wikipedia_data_path, workers)
+        with instrumentation.span('index.parse'):
+            parsed_documents = wiki_parser.parse_wiki(wikipedia_data_path, workers)
+        # dense doc ids, every worker gets a contiguous range
+        for doc_id, document in enumerate(parsed_documents):
+            document.doc_id = doc_id
+        if conf.get('document_store'):
+            # raw texts are dropped by the preprocessing, results are rendered from the store
+            with instrumentation.span('index.document_store'):
+                document_store.write(document_store.store_path(inverted_index_path), parsed_documents)
 
         text_preprocessor = TextPreprocessor(preprocessor_components, conf)
-        parsed_documents = text_preprocessor.preprocess(parsed_documents, workers)
-
-        self._create_index(parsed_documents)
+        text_preprocessor.load_already_processed(parsed_documents)
+        with instrumentation.span('index.preprocess_and_index'):
+            if workers == 1 or len(parsed_documents) < 100:
+                partial_indexes = [_index_slice(parsed_documents, text_preprocessor, self.positional)]
+            else:
+                partial_indexes = utils.generic_parallel_execution(
+                    parsed_documents, _index_slice, text_preprocessor, self.positional, workers=workers,
+                    executor='process'
+                )
+        with instrumentation.span('index.merge'):
+            self.merge_partial_indexes(partial_indexes)
+        instrumentation.count('index.documents', self.documents_count)
+        term_filter_conf = conf.get('term_filter') or {}
+        if term_filter_conf.get('enabled'):
+            self.build_term_filter(term_filter_conf.get('false_positive_rate', 0.01))
 
-        tfidf_vectorizer = vectorizer.TfIdfVectorizer(self)
-        tfidf_vectorizer.vectorize_documents(parsed_documents)
+        if self.vectorized:
+            with instrumentation.span('index.vectorize'):
+                # documents returned by the workers are the ones referenced by the postings
+                tfidf_vectorizer = vectorizer.TfIdfVectorizer(self)
+                tfidf_vectorizer.vectorize_documents(list(self.documents.values()), workers)
+        else:
+            release_terms(list(self.documents.values()))
+        if conf.get('document_store') and conf.get('ranking', ranking.DEFAULT_RANKING) not in ranking.INFOBOX_RANKINGS:
+            # field lengths are counted, results show infoboxes from the store
+            release_infoboxes(self.documents.values())
+            self.infoboxes = False
+        if conf.get('postings_codec'):
+            with instrumentation.span('index.compress'):
+                self.compress_postings(conf['postings_codec'])
 
-        self.save(inverted_index_path)
+        with instrumentation.span('index.save'):
+            self.save(inverted_index_path)
         logger.info("Inverted index created.")
@@ -0,0 +1,275 @@
+"""
+Named spans and counters around pipeline and query stages.
+
+Disabled by default: `span` then returns a shared no-op context manager and `count` returns immediately,
+so instrumented hot paths pay one attribute lookup. Enable it with the `instrumentation` section of the
+configuration, e.g. {"enabled": true, "exporters": ["log", "json", "prometheus"]}.
+Measurements are kept per process, spans inside worker processes are not collected by the parent.
+"""
+import atexit
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer as timer
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INSTRUMENTATION_CONF = {
+    "enabled": False,
+    "exporters": ["log"],
+    "json_path": "data/metrics.json",
+    "prometheus_port": 9464,
+    # the metrics endpoint is only reachable locally unless a public interface is configured
+    "prometheus_host": "127.0.0.1",
+}
+
+
+class SpanStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.min = min(self.min, elapsed)
+        self.max = max(self.max, elapsed)
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_s': self.total / self.count if self.count else 0.0,
+            'min_s': self.min if self.count else 0.0,
+            'max_s': self.max,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self.spans: dict[str, SpanStats] = {}
+        self.counters: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, elapsed: float):
+        with self.lock:
+            if name not in self.spans:
+                self.spans[name] = SpanStats()
+            self.spans[name].add(elapsed)
+
+    def increment(self, name: str, value: float):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict[str, dict]:
+        with self.lock:
+            return {
+                'spans': {name: stats.to_dict() for name, stats in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+
+
+registry = Registry()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        registry.record(self.name, timer() - self.start)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str):
+    if not registry.enabled:
+        return _NOOP_SPAN
+    return _Span(name)
+
+
+def count(name: str, value: float = 1):
+    if registry.enabled:
+        registry.increment(name, value)
+
+
+def observe(name: str, elapsed: float):
+    """
+    Records a duration measured by the caller under the span `name`.
+    """
+    if registry.enabled:
+        registry.record(name, elapsed)
+
+
+def timed(name: str):
+    """
+    Decorator version of `span`.
+    """
+
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Exporter:
+    def export(self, snapshot: dict[str, dict]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LogExporter(Exporter):
+    def export(self, snapshot: dict[str, dict]):
+        for name, stats in sorted(snapshot['spans'].items()):
+            logger.info(f"Span {name}: count={stats['count']} total={stats['total_s']:.4f}s "
+                        f"mean={stats['mean_s'] * 1000:.2f}ms max={stats['max_s'] * 1000:.2f}ms")
+        for name, value in sorted(snapshot['counters'].items()):
+            logger.info(f"Counter {name}: {value}")
+
+
+class JsonExporter(Exporter):
+    def __init__(self, json_path: str):
+        self.json_path = json_path
+
+    def export(self, snapshot: dict[str, dict]):
+        with open(self.json_path, 'w', encoding='utf-8') as json_file:
+            json.dump(snapshot, json_file, indent=2)
+        logger.info(f"Metrics saved to {self.json_path}")
+
+
+def prometheus_text(snapshot: dict[str, dict]) -> str:
+    """
+    Renders the snapshot in the Prometheus text exposition format.
+    """
+
+    def metric_name(name):
+        return 'skwiki_' + ''.join(char if char.isalnum() else '_' for char in name)
+
+    lines = []
+    for name, stats in sorted(snapshot['spans'].items()):
+        metric = metric_name(name) + '_seconds'
+        lines.append(f"# TYPE {metric} summary")
+        lines.append(f"{metric}_count {stats['count']}")
+        lines.append(f"{metric}_sum {stats['total_s']}")
+        lines.append(f"# TYPE {metric}_max gauge")
+        lines.append(f"{metric}_max {stats['max_s']}")
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = metric_name(name) + '_total'
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter(Exporter):
+    """
+    Serves the live registry on http://<host>:<port>/metrics from a daemon thread.
+    """
+
+    def __init__(self, port: int, host='127.0.0.1'):
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(registry.snapshot()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+    def export(self, snapshot: dict[str, dict]):
+        # scraped on demand
+        pass
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_exporters: list[Exporter] = []
+
+
+def configure(instrumentation_conf: Optional[dict] = None):
+    """
+    Enables or disables instrumentation and sets up exporters. Exporters run on `export` and at exit.
+    """
+    conf = dict(DEFAULT_INSTRUMENTATION_CONF)
+    conf.update(instrumentation_conf or {})
+    shutdown()
+    registry.enabled = bool(conf['enabled'])
+    if not registry.enabled:
+        return
+
+    for exporter_name in conf['exporters']:
+        if exporter_name == 'log':
+            _exporters.append(LogExporter())
+        elif exporter_name == 'json':
+            _exporters.append(JsonExporter(conf['json_path']))
+        elif exporter_name == 'prometheus':
+            _exporters.append(PrometheusExporter(conf['prometheus_port'], conf['prometheus_host']))
+        else:
+            raise ValueError(f"Unknown exporter {exporter_name}")
+    atexit.register(export)
+
+
+def export():
+    if not registry.enabled:
+        return
+    snapshot = registry.snapshot()
+    for exporter in _exporters:
+        try:
+            exporter.export(snapshot)
+        except OSError as e:
+            logger.error(f"Exporter {type(exporter).__name__} failed: {e}")
+
+
+def shutdown():
+    atexit.unregister(export)
+    for exporter in _exporters:
+        exporter.close()
+    _exporters.clear()
+    registry.enabled = False
@@ -0,0 +1,81 @@
+from bisect import bisect_right
+
+
+def write_varint(buffer: bytearray, value: int):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_positions(positions: list[int]) -> bytes:
+    """
+    Sorted positions as varint gaps, most gaps fit in one byte.
+    """
+    buffer = bytearray()
+    previous = 0
+    for position in positions:
+        write_varint(buffer, position - previous)
+        previous = position
+    return bytes(buffer)
+
+
+def decode_positions(data: bytes) -> list[int]:
+    positions = []
+    position = 0
+    offset = 0
+    while offset < len(data):
+        gap, offset = read_varint(data, offset)
+        position += gap
+        positions.append(position)
+    return positions
+
+
+def phrase_match(term_positions: list[list[int]], slop=0) -> bool:
+    """
+    Whether the terms occur in order with at most `slop` other terms between the first and the last one.
+    For every occurrence of the first term the nearest following occurrence of each next term is taken,
+    which gives the shortest window starting there.
+    """
+    if not term_positions or not all(term_positions):
+        return False
+    max_span = len(term_positions) - 1 + slop
+    for start in term_positions[0]:
+        position = start
+        for positions in term_positions[1:]:
+            idx = bisect_right(positions, position)
+            if idx == len(positions):
+                return False
+            position = positions[idx]
+            if position - start > max_span:
+                break
+        else:
+            return True
+    return False
+
+
+def min_distance(first: list[int], second: list[int]) -> int:
+    """
+    Smallest distance between positions of two terms, both lists are sorted.
+    """
+    distance = float('inf')
+    idx, jdx = 0, 0
+    while idx < len(first) and jdx < len(second):
+        distance = min(distance, abs(first[idx] - second[jdx]))
+        if first[idx] < second[jdx]:
+            idx += 1
+        else:
+            jdx += 1
+    return distance
@@ -0,0 +1,226 @@
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from postings import read_varint, write_varint
+
+# documents per block of compressed postings
+BLOCK_SIZE = 128
+# one entry per block: last doc id, largest term frequency and end offset of the block in the data
+SKIP_DTYPE = np.dtype([('last_doc_id', '<i4'), ('max_term_frequency', '<i4'), ('end', '<i4')])
+
+
+class EncodedPostings:
+    """
+    Sorted postings of one term compressed by the codec named `codec`, see `POSTINGS_CODECS`.
+    """
+    __slots__ = ('codec', 'count', 'skips', 'data')
+
+    def __init__(self, codec: str, count: int, skips: bytes, data: bytes):
+        self.codec = codec
+        self.count = count
+        self.skips = skips
+        self.data = data
+
+    @property
+    def size(self) -> int:
+        return len(self.skips) + len(self.data)
+
+    def decode(self) -> tuple[np.ndarray, np.ndarray]:
+        return get_codec(self.codec).decode(self)
+
+    def intersect(self, doc_ids: set[int]) -> set[int]:
+        return get_codec(self.codec).intersect(self, doc_ids)
+
+    def blocks(self, doc_ids: Sequence[int]) -> np.ndarray:
+        return get_codec(self.codec).blocks(self, doc_ids)
+
+    def max_term_frequencies(self, doc_ids: Sequence[int]) -> np.ndarray:
+        return get_codec(self.codec).max_term_frequencies(self, doc_ids)
+
+    def block_term_frequencies(self, block: int) -> dict[int, int]:
+        return get_codec(self.codec).block_term_frequencies(self, block)
+
+
+class PostingsCodec:
+    """
+    Postings in blocks of BLOCK_SIZE documents. The skip table keeps the last doc id, the largest term frequency
+    and the end of every block, so a lookup decodes only the blocks which can hold its documents and
+    a ranker bounds the term frequency of a document without decoding anything.
+    Subclasses encode doc ids and term frequencies of one block, `previous` is the last doc id of the block before.
+    """
+    name: str = None
+
+    def encode_block(self, doc_ids: np.ndarray, term_frequencies: np.ndarray, previous: int) -> bytes:
+        raise NotImplementedError
+
+    def decode_block(self, data: bytes, offset: int, count: int, previous: int) -> tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def encode(self, doc_ids: Sequence[int], term_frequencies: Sequence[int]) -> EncodedPostings:
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        term_frequencies = np.asarray(term_frequencies, dtype=np.int64)
+        skips = np.zeros((len(doc_ids) + BLOCK_SIZE - 1) // BLOCK_SIZE, dtype=SKIP_DTYPE)
+        blocks = []
+        end = 0
+        previous = -1
+        for block, start in enumerate(range(0, len(doc_ids), BLOCK_SIZE)):
+            block_doc_ids = doc_ids[start:start + BLOCK_SIZE]
+            block_term_frequencies = term_frequencies[start:start + BLOCK_SIZE]
+            blocks.append(self.encode_block(block_doc_ids, block_term_frequencies, previous))
+            end += len(blocks[-1])
+            previous = int(block_doc_ids[-1])
+            skips[block] = (previous, block_term_frequencies.max(), end)
+        return EncodedPostings(self.name, len(doc_ids), skips.tobytes(), b''.join(blocks))
+
+    @staticmethod
+    def skip_table(encoded: EncodedPostings) -> np.ndarray:
+        return np.frombuffer(encoded.skips, dtype=SKIP_DTYPE)
+
+    def decode_blocks(self, encoded: EncodedPostings, blocks: Iterable[int]) -> tuple[np.ndarray, np.ndarray]:
+        skips = self.skip_table(encoded)
+        last_doc_ids, ends = skips['last_doc_id'].tolist(), skips['end'].tolist()
+        doc_ids, term_frequencies = [], []
+        for block in blocks:
+            offset, previous = (ends[block - 1], last_doc_ids[block - 1]) if block else (0, -1)
+            count = min(BLOCK_SIZE, encoded.count - block * BLOCK_SIZE)
+            block_doc_ids, block_term_frequencies = self.decode_block(encoded.data, offset, count, previous)
+            doc_ids.append(block_doc_ids)
+            term_frequencies.append(block_term_frequencies)
+        if not doc_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(doc_ids), np.concatenate(term_frequencies)
+
+    def decode(self, encoded: EncodedPostings) -> tuple[np.ndarray, np.ndarray]:
+        return self.decode_blocks(encoded, range(len(encoded.skips) // SKIP_DTYPE.itemsize))
+
+    def blocks(self, encoded: EncodedPostings, doc_ids: Sequence[int]) -> np.ndarray:
+        """
+        Block which can hold each of the documents, the number of blocks for documents after the last one.
+        """
+        return np.searchsorted(self.skip_table(encoded)['last_doc_id'], np.asarray(doc_ids, dtype=np.int64))
+
+    def max_term_frequencies(self, encoded: EncodedPostings, doc_ids: Sequence[int]) -> np.ndarray:
+        """
+        Largest term frequency of the block which can hold each of the documents, read from the skip table.
+        It bounds the term frequency of the document, 0 for documents after the last block.
+        """
+        maxima = np.append(self.skip_table(encoded)['max_term_frequency'], 0)
+        return maxima[self.blocks(encoded, doc_ids)]
+
+    def block_term_frequencies(self, encoded: EncodedPostings, block: int) -> dict[int, int]:
+        """
+        Postings of one block, doc_id -> term frequency, empty for a block after the last one.
+        """
+        if block >= len(encoded.skips) // SKIP_DTYPE.itemsize:
+            return {}
+        doc_ids, term_frequencies = self.decode_blocks(encoded, [block])
+        return dict(zip(doc_ids.tolist(), term_frequencies.tolist()))
+
+    def intersect(self, encoded: EncodedPostings, doc_ids: set[int]) -> set[int]:
+        """
+        Documents of `doc_ids` in the postings. Blocks are looked up by their last doc id,
+        only the blocks which can hold one of the documents are decoded.
+        """
+        if not doc_ids:
+            return set()
+        candidates = np.fromiter(doc_ids, dtype=np.int64, count=len(doc_ids))
+        last_doc_ids = self.skip_table(encoded)['last_doc_id']
+        blocks = np.unique(np.searchsorted(last_doc_ids, candidates))
+        decoded, _ = self.decode_blocks(encoded, blocks[blocks < len(last_doc_ids)].tolist())
+        return set(candidates[np.isin(candidates, decoded, assume_unique=True)].tolist())
+
+
+class RawCodec(PostingsCodec):
+    """
+    Doc ids and term frequencies as int32, the baseline of the benchmark.
+    """
+    name = 'raw'
+
+    def encode_block(self, doc_ids: np.ndarray, term_frequencies: np.ndarray, previous: int) -> bytes:
+        return np.concatenate((doc_ids, term_frequencies)).astype('<i4').tobytes()
+
+    def decode_block(self, data: bytes, offset: int, count: int, previous: int) -> tuple[np.ndarray, np.ndarray]:
+        values = np.frombuffer(data, dtype='<i4', count=2 * count, offset=offset).astype(np.int64)
+        return values[:count], values[count:]
+
+
+class VarintCodec(PostingsCodec):
+    """
+    Doc id gaps followed by term frequencies as varints, the format of the positions.
+    """
+    name = 'varint'
+
+    def encode_block(self, doc_ids: np.ndarray, term_frequencies: np.ndarray, previous: int) -> bytes:
+        buffer = bytearray()
+        for gap in np.diff(doc_ids, prepend=previous).tolist():
+            write_varint(buffer, gap)
+        for term_frequency in term_frequencies.tolist():
+            write_varint(buffer, term_frequency)
+        return bytes(buffer)
+
+    def decode_block(self, data: bytes, offset: int, count: int, previous: int) -> tuple[np.ndarray, np.ndarray]:
+        values = []
+        for _ in range(2 * count):
+            value, offset = read_varint(data, offset)
+            values.append(value)
+        values = np.array(values, dtype=np.int64)
+        return previous + np.cumsum(values[:count]), values[count:]
+
+
+def pack_bits(values: np.ndarray) -> bytes:
+    """
+    Frame of reference coding: the minimum as a varint, the bit width of the values minus the minimum
+    as one byte, and the values minus the minimum packed into `width` bits each.
+    """
+    buffer = bytearray()
+    base = int(values.min())
+    offsets = values - base
+    width = int(offsets.max()).bit_length()
+    write_varint(buffer, base)
+    buffer.append(width)
+    if width:
+        bits = (offsets[:, np.newaxis] >> np.arange(width)) & 1
+        buffer += np.packbits(bits.astype(np.uint8).ravel(), bitorder='little').tobytes()
+    return bytes(buffer)
+
+
+def unpack_bits(data: bytes, offset: int, count: int) -> tuple[np.ndarray, int]:
+    """
+    Values packed by `pack_bits` and the offset after them. All values are unpacked at once.
+    """
+    base, offset = read_varint(data, offset)
+    width = data[offset]
+    offset += 1
+    if not width:
+        return np.full(count, base, dtype=np.int64), offset
+    size = (count * width + 7) // 8
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=size, offset=offset),
+                         count=count * width, bitorder='little')
+    values = bits.reshape(count, width).astype(np.int64) @ (np.int64(1) << np.arange(width, dtype=np.int64))
+    return values + base, offset + size
+
+
+class BitPackedCodec(PostingsCodec):
+    """
+    Doc id gaps and term frequencies of a block packed with the smallest bit width which fits them.
+    """
+    name = 'bitpacked'
+
+    def encode_block(self, doc_ids: np.ndarray, term_frequencies: np.ndarray, previous: int) -> bytes:
+        return pack_bits(np.diff(doc_ids, prepend=previous)) + pack_bits(term_frequencies)
+
+    def decode_block(self, data: bytes, offset: int, count: int, previous: int) -> tuple[np.ndarray, np.ndarray]:
+        gaps, offset = unpack_bits(data, offset, count)
+        term_frequencies, _ = unpack_bits(data, offset, count)
+        return previous + np.cumsum(gaps), term_frequencies
+
+
+POSTINGS_CODECS: dict[str, PostingsCodec] = {codec.name: codec for codec in (RawCodec(), VarintCodec(),
+                                                                             BitPackedCodec())}
+
+
+def get_codec(name: str) -> PostingsCodec:
+    if name not in POSTINGS_CODECS:
+        raise ValueError(f'Unknown postings codec {name}, use one of {", ".join(POSTINGS_CODECS)}')
+    return POSTINGS_CODECS[name]
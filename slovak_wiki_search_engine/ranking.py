@@ -0,0 +1,221 @@
+import heapq
+import math
+import re
+from typing import Optional
+
+from stemmer import stem
+
+import indexer
+import instrumentation
+from wiki_parser import WikiPage
+
+RANKING_MODES = ('tfidf', 'bm25', 'bm25f')
+DEFAULT_RANKING = 'tfidf'
+FIELDS = ('body', 'title', 'infobox')
+# rankings which read the infobox properties of the indexed documents
+INFOBOX_RANKINGS = ('tfidf', 'bm25f')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# weight and length normalization of the fields in BM25F, body terms come from the postings
+BM25F_FIELD_WEIGHTS = {'body': 1.0, 'title': 3.0, 'infobox': 1.5}
+BM25F_FIELD_B = {'body': 0.75, 'title': 0.5, 'infobox': 0.75}
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+QueryTerm = tuple[str, float, 'indexer.IndexRecord']
+
+
+def field_words(document: WikiPage) -> dict[str, list[str]]:
+    """
+    Words of the title and of the infobox keys and values, these fields are not part of the indexed terms.
+    """
+    infobox_text = ''
+    if document.infobox:
+        infobox_text = ' '.join(f'{key} {value}' for key, value in document.infobox.properties.items())
+    return {
+        'title': WORD_PATTERN.findall(document.title or ''),
+        'infobox': WORD_PATTERN.findall(infobox_text),
+    }
+
+
+def field_lengths(document: WikiPage) -> dict[str, int]:
+    return {field: len(words) for field, words in field_words(document).items()}
+
+
+class BM25Ranker:
+    """
+    Okapi BM25 over the body terms. Needs only the term frequencies of the postings, document lengths and
+    average document lengths, document vectors are not used. `statistics` provides document frequencies
+    and average lengths, for a shard they are the ones of the whole collection.
+    """
+
+    def __init__(self, inverted_index: 'indexer.InvertedIndex', statistics=None, k1=BM25_K1, b=BM25_B):
+        self.inverted_index = inverted_index
+        self.statistics = statistics or inverted_index
+        self.k1 = k1
+        self.b = b
+
+    def idf(self, term: str) -> Optional[float]:
+        try:
+            document_frequency = self.statistics.get(term).document_frequency
+        except AttributeError:
+            return None
+        documents_count = self.statistics.documents_count
+        return math.log(1 + (documents_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _saturate(self, term_frequency: float) -> float:
+        return term_frequency * (self.k1 + 1) / (term_frequency + self.k1)
+
+    def _query_terms(self, query_doc: WikiPage, records: dict[str, Optional['indexer.IndexRecord']]) -> list[QueryTerm]:
+        query_terms = []
+        for term in dict.fromkeys(query_doc.terms):
+            index_record = records.get(term)
+            idf = self.idf(term)
+            if index_record is not None and idf is not None:
+                query_terms.append((term, idf, index_record))
+        return query_terms
+
+    def _length_norm(self, doc_id: int, average_lengths: dict[str, float]) -> float:
+        return 1 - self.b + self.b * self.inverted_index.document_length(doc_id) / average_lengths['body']
+
+    def upper_bounds(self, documents: list[WikiPage], query_terms: list[QueryTerm],
+                     average_lengths: dict[str, float]) -> list[float]:
+        """
+        Highest scores the documents can get. The term frequency of a document is bounded by the largest one
+        of the block of compressed postings which can hold it, read from the skip table, so the blocks are
+        decoded only for documents which are scored.
+        """
+        doc_ids = [document.doc_id for document in documents]
+        length_norms = [self._length_norm(doc_id, average_lengths) for doc_id in doc_ids]
+        bounds = [0.0] * len(documents)
+        for _, idf, index_record in query_terms:
+            for idx, max_term_frequency in enumerate(index_record.max_term_frequencies(doc_ids)):
+                if max_term_frequency:
+                    bounds[idx] += idf * self._saturate(max_term_frequency / length_norms[idx])
+        return bounds
+
+    def score(self, document: WikiPage, query_terms: list[QueryTerm], average_lengths: dict[str, float]) -> float:
+        length_norm = self._length_norm(document.doc_id, average_lengths)
+        score = 0.0
+        for _, idf, index_record in query_terms:
+            term_frequency = index_record.term_frequency(document.doc_id)
+            if term_frequency:
+                score += idf * self._saturate(term_frequency / length_norm)
+        return score
+
+    def rank(self, query_doc: WikiPage, documents: list[WikiPage], records: dict[str, Optional['indexer.IndexRecord']],
+             results_count: Optional[int] = None) -> list[tuple[WikiPage, float]]:
+        """
+        Scores documents and returns them sorted by score. With `results_count` documents are scored in order
+        of their upper bound and scoring stops once no remaining document can enter the top results,
+        the postings blocks of the remaining documents are not decoded.
+        """
+        query_terms = self._query_terms(query_doc, records)
+        average_lengths = {field: self.statistics.average_length(field) or 1.0 for field in FIELDS}
+        if results_count is None or len(documents) <= results_count:
+            scores = [(document, self.score(document, query_terms, average_lengths)) for document in documents]
+            return sorted(scores, key=lambda result: result[1], reverse=True)
+
+        bounded = sorted(zip(self.upper_bounds(documents, query_terms, average_lengths), documents),
+                         key=lambda bound: bound[0], reverse=True)
+        top: list[tuple[float, int, WikiPage]] = []
+        scored = 0
+        for idx, (bound, document) in enumerate(bounded):
+            if len(top) == results_count and bound <= top[0][0]:
+                break
+            scored += 1
+            score = self.score(document, query_terms, average_lengths)
+            if len(top) < results_count:
+                heapq.heappush(top, (score, -idx, document))
+            elif score > top[0][0]:
+                heapq.heapreplace(top, (score, -idx, document))
+        instrumentation.count('search.pruned', len(documents) - scored)
+        return [(document, score) for score, _, document in sorted(top, key=lambda entry: entry[:2], reverse=True)]
+
+
+class BM25FRanker(BM25Ranker):
+    """
+    BM25F over body, title and infobox. Term frequencies of the fields are length normalized and weighted,
+    summed and saturated once. Title and infobox words are matched to query terms by their stems.
+    """
+
+    def _field_frequencies(self, document: WikiPage, query_stems: list[str]) -> dict[str, tuple[dict[str, int], int]]:
+        frequencies = {}
+        for field, words in field_words(document).items():
+            counts = dict.fromkeys(query_stems, 0)
+            for word in words:
+                word_stem = stem(word.lower())
+                if word_stem in counts:
+                    counts[word_stem] += 1
+            frequencies[field] = (counts, len(words))
+        return frequencies
+
+    def _query_terms(self, query_doc: WikiPage, records: dict[str, Optional['indexer.IndexRecord']]) -> list[QueryTerm]:
+        """
+        Terms known to `statistics` are kept without postings, a shard which does not hold a term in any body
+        can still match it in titles and infoboxes.
+        """
+        from indexer import IndexRecord
+
+        query_terms = []
+        for term in dict.fromkeys(query_doc.terms):
+            idf = self.idf(term)
+            if idf is not None:
+                index_record = records.get(term)
+                query_terms.append((term, idf, index_record if index_record is not None else IndexRecord()))
+        return query_terms
+
+    @staticmethod
+    def _normalized(field: str, term_frequency: int, length: int, average_lengths: dict[str, float]) -> float:
+        b = BM25F_FIELD_B[field]
+        return BM25F_FIELD_WEIGHTS[field] * term_frequency / (1 - b + b * length / average_lengths[field])
+
+    def upper_bounds(self, documents: list[WikiPage], query_terms: list[QueryTerm],
+                     average_lengths: dict[str, float]) -> list[float]:
+        """
+        A term occurs in the body at most as often as the largest term frequency of its postings block
+        and in the title or infobox at most once per word of the field. Field lengths are counted
+        without stemming, which makes the bound cheaper than the score.
+        """
+        doc_ids = [document.doc_id for document in documents]
+        body_lengths = [self.inverted_index.document_length(doc_id) for doc_id in doc_ids]
+        field_caps = [[self._normalized(field, length, length, average_lengths)
+                       for field, length in field_lengths(document).items()] for document in documents]
+        bounds = [0.0] * len(documents)
+        for _, idf, index_record in query_terms:
+            for idx, max_term_frequency in enumerate(index_record.max_term_frequencies(doc_ids)):
+                # summed in the order of `score`, so the bound of an exact match is not rounded below its score
+                term_frequency = self._normalized('body', max_term_frequency, body_lengths[idx], average_lengths)
+                for field_cap in field_caps[idx]:
+                    term_frequency += field_cap
+                if term_frequency:
+                    bounds[idx] += idf * self._saturate(term_frequency)
+        return bounds
+
+    def score(self, document: WikiPage, query_terms: list[QueryTerm], average_lengths: dict[str, float]) -> float:
+        query_stems = [stem(term) for term, _, _ in query_terms]
+        frequencies = self._field_frequencies(document, query_stems)
+        body_length = self.inverted_index.document_length(document.doc_id)
+        score = 0.0
+        for (_, idf, index_record), query_stem in zip(query_terms, query_stems):
+            term_frequency = self._normalized('body', index_record.term_frequency(document.doc_id),
+                                              body_length, average_lengths)
+            for field, (counts, length) in frequencies.items():
+                term_frequency += self._normalized(field, counts[query_stem], length, average_lengths)
+            if term_frequency:
+                score += idf * self._saturate(term_frequency)
+        return score
+
+
+def create_ranker(ranking: str, inverted_index: 'indexer.InvertedIndex', statistics=None) -> Optional[BM25Ranker]:
+    """
+    Ranker of the ranking mode. None for tf-idf, its cosine similarity is computed from the document vectors.
+    """
+    if ranking not in RANKING_MODES:
+        raise ValueError(f'Unknown ranking {ranking}, use one of {", ".join(RANKING_MODES)}')
+    if ranking == 'bm25':
+        return BM25Ranker(inverted_index, statistics)
+    if ranking == 'bm25f':
+        return BM25FRanker(inverted_index, statistics)
+    return None
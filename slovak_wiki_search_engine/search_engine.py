@@ -1,39 +1,212 @@
-import ast
 import logging
 from timeit import default_timer as timer
-from typing import Union
+from typing import Optional, Union
 
-from arg_parser import QueryBooleanOperator
-from indexer import InvertedIndex
-from text_preprocessor import TextPreprocessor
+import instrumentation
+import postings
+import ranking
+import utils
+from arg_parser import QueryBooleanOperator, parse_phrases
+from indexer import IndexRecord, InvertedIndex
+from term_expansion import create_term_expander, split_wildcards
+from text_preprocessor import QueryAnalyzer
 from utils import rank_documents
 from vectorizer import TfIdfVectorizer
 from wiki_parser import WikiPage
 
 logger = logging.getLogger(__name__)
 
+# top ranked documents which are re-ranked by proximity of the query terms
+PROXIMITY_RERANK_COUNT = 100
+
+
+def _rank_queries(tasks: list[tuple[int, WikiPage, list[WikiPage]]], results_count: int,
+                  pbar_position=0) -> list[tuple[int, list[tuple[int, float]]]]:
+    """
+    Ranks a slice of batched queries. Runs in a worker process, so only doc ids and scores are sent back.
+    """
+    ranked = []
+    for query_idx, query_doc, candidates in tasks:
+        results = rank_documents(query_doc, candidates)[:results_count]
+        ranked.append((query_idx, [(doc.doc_id, score) for doc, score in results]))
+    return ranked
+
 
 class SearchEngine:
-    def __init__(self, inverted_index: InvertedIndex, conf: dict[str, Union[str, int, list[str]]]):
+    def __init__(self, inverted_index: InvertedIndex, conf: dict[str, Union[str, int, list[str]]],
+                 statistics=None):
+        """
+        `statistics` replaces the term statistics of `inverted_index` when weighting terms,
+        a shard uses the statistics of the whole collection.
+        """
         self.inverted_index = inverted_index
         self.conf = conf
-        preprocessor_components: list = conf.get("preprocessor_components")
-        self.path_to_documents = conf.get("already_processed_path")
-        if preprocessor_components and 'document_saver' in preprocessor_components:
-            preprocessor_components.remove("document_saver")
-        self.text_preprocessor = TextPreprocessor(preprocessor_components, self.conf, load_docs=True)
-        self.vectorizer = TfIdfVectorizer(self.inverted_index)
+        self.query_analyzer = QueryAnalyzer(conf.get("preprocessor_components"), self.conf)
+        self.vectorizer = TfIdfVectorizer(statistics or self.inverted_index)
+        self.ranking = conf.get('ranking') or ranking.DEFAULT_RANKING
+        if self.ranking == 'tfidf' and not getattr(self.inverted_index, 'vectorized', True):
+            logger.warning('Inverted index was created without document vectors, ranking by bm25 instead of tfidf.')
+            self.ranking = 'bm25'
+        if self.ranking in ranking.INFOBOX_RANKINGS and not getattr(self.inverted_index, 'infoboxes', True):
+            logger.warning(f'Inverted index was created without infoboxes, they are in the document store. '
+                           f'Ranking by {self.ranking} ignores them.')
+        self.ranker = ranking.create_ranker(self.ranking, self.inverted_index, statistics)
+        self.term_expander = create_term_expander(self.inverted_index.vocabulary, conf.get('term_expansion'))
+
+    def _get_record(self, term: str, records: dict[str, Optional[IndexRecord]]) -> Optional[IndexRecord]:
+        if term not in records:
+            try:
+                # compressed postings are decoded for this query only
+                records[term] = self.inverted_index.get(term).view()
+            except AttributeError:
+                records[term] = None
+        return records[term]
+
+    def _expand(self, term: str, records: dict[str, Optional[IndexRecord]]) -> list[str]:
+        """
+        Indexed terms replacing a missing query term, the most frequent ones first.
+        """
+        if self.term_expander is None:
+            return []
+
+        def document_frequency(expansion: str) -> Optional[int]:
+            index_record = self._get_record(expansion, records)
+            return index_record.document_frequency if index_record is not None else None
+
+        return self.term_expander.expansions(term, document_frequency)
+
+    def _retrieve(self, query_doc: WikiPage, boolean_operator: QueryBooleanOperator,
+                  records: dict[str, Optional[IndexRecord]], verbose=True,
+                  expansions: Optional[dict[str, list[str]]] = None) -> set[int]:
+        """
+        Returns ids of the matching documents. Missing terms are replaced by their expansions, which match
+        as one OR group, or removed from the query. A shard gets `expansions` of the terms missing in the whole
+        collection instead and keeps the terms it does not hold, they exist in another shard, so no document
+        of this shard matches an AND query.
+        """
+        relevant_documents = set()
+        first_term = True
+        query_terms = []
+        for term in query_doc.terms:
+            if expansions is not None:
+                group = expansions.get(term, [term])
+                query_terms.extend(group)
+                group_records = [self._get_record(expansion, records) for expansion in group]
+                group_records = [group_record for group_record in group_records if group_record is not None]
+                if len(group_records) == 1 and not first_term and boolean_operator == QueryBooleanOperator.AND:
+                    relevant_documents = group_records[0].intersect(relevant_documents)
+                    continue
+                documents = set()
+                for group_record in group_records:
+                    documents |= group_record.documents
+            elif (index_record := self._get_record(term, records)) is not None:
+                query_terms.append(term)
+                if not first_term and boolean_operator == QueryBooleanOperator.AND:
+                    relevant_documents = index_record.intersect(relevant_documents)
+                    continue
+                documents = index_record.documents
+            else:
+                term_expansions = self._expand(term, records)
+                if not term_expansions:
+                    instrumentation.count('search.missing_terms')
+                    if verbose:
+                        logger.info(f"Term {term} not found in inverted index.")
+                    continue
+                instrumentation.count('search.expanded_terms')
+                if verbose:
+                    logger.info(f"Term {term} not found in inverted index, expanded to {', '.join(term_expansions)}.")
+                query_terms.extend(term_expansions)
+                documents = set()
+                for expansion in term_expansions:
+                    documents |= records[expansion].documents
+
+            if first_term:
+                relevant_documents = set(documents)
+                first_term = False
+            elif boolean_operator == QueryBooleanOperator.AND:
+                relevant_documents &= documents
+            elif boolean_operator == QueryBooleanOperator.OR:
+                relevant_documents |= documents
+        query_doc.terms = query_terms
+        return relevant_documents
+
+    def _preprocess_phrases(self, phrases: list[tuple[str, int]]) -> list[tuple[list[str], int]]:
+        if not phrases:
+            return []
+        phrase_docs = self.query_analyzer.analyze_batch([text for text, _ in phrases])
+        return [(phrase_doc.terms, slop) for phrase_doc, (_, slop) in zip(phrase_docs, phrases) if phrase_doc.terms]
+
+    def _match_phrases(self, doc_ids: set[int], phrases: list[tuple[list[str], int]],
+                       records: dict[str, Optional[IndexRecord]]) -> set[int]:
+        """
+        Keeps documents containing every phrase. Positions are decoded only for documents which passed
+        the boolean filter. Indexes without positions only require the phrase terms.
+        """
+        for phrase_terms, slop in phrases:
+            phrase_records = [self._get_record(term, records) for term in phrase_terms]
+            if any(index_record is None for index_record in phrase_records):
+                return set()
+            if any(index_record.positions is None for index_record in phrase_records):
+                doc_ids = {doc_id for doc_id in doc_ids
+                           if all(doc_id in index_record.term_frequencies for index_record in phrase_records)}
+                continue
+            doc_ids = {doc_id for doc_id in doc_ids
+                       if postings.phrase_match([index_record.get_positions(doc_id) for index_record in phrase_records],
+                                                slop)}
+        return doc_ids
+
+    def _boost_proximity(self, query_doc: WikiPage, ranked: list[tuple[WikiPage, float]],
+                         records: dict[str, Optional[IndexRecord]]) -> list[tuple[WikiPage, float]]:
+        """
+        Re-ranks top documents by how close the query terms are to each other in them. A term missing
+        in a shard is in another one, it keeps its place in the query with no positions.
+        """
+        query_records = [self._get_record(term, records) for term in dict.fromkeys(query_doc.terms)]
+        present_records = [index_record for index_record in query_records if index_record is not None]
+        if len(query_records) < 2 or not present_records or \
+                any(index_record.positions is None for index_record in present_records):
+            return ranked
+        boosted = []
+        for doc, score in ranked:
+            term_positions = [index_record.get_positions(doc.doc_id) if index_record is not None else []
+                              for index_record in query_records]
+            boosted.append((doc, score + utils.proximity_boost(term_positions)))
+        return sorted(boosted, key=lambda result: result[1], reverse=True)
+
+    def _split_wildcards(self, query: str) -> tuple[str, list[str]]:
+        """
+        Wildcard terms bypass the preprocessing, they are expanded over the vocabulary.
+        """
+        if self.term_expander is None:
+            return query, []
+        return split_wildcards(query)
+
+    def _set_query_term_ids(self, query_doc: WikiPage):
+        """
+        Query terms as vocabulary ids for ranking, terms missing in the index match nothing.
+        """
+        vocabulary = self.inverted_index.vocabulary
+        query_doc.term_ids = [term_id for term in query_doc.terms if (term_id := vocabulary.get(term)) is not None]
 
     def search(self, query: str,
                boolean_operator=QueryBooleanOperator.AND,
-               results_count=10) -> list[tuple[WikiPage, float]]:
+               results_count=10,
+               phrases: Optional[list[tuple[str, int]]] = None) -> list[tuple[WikiPage, float]]:
+        """
+        `phrases` are (text, slop) pairs which matching documents have to contain, quoted parts of the query
+        by default.
+        """
 
         logger.info(f'Original Query: {query}')
 
         start = timer()
-        query_doc = WikiPage(-1, None, query)
-        query_doc = self.text_preprocessor.preprocess([query_doc], query=True)[0]
-
+        instrumentation.count('search.queries')
+        phrases = parse_phrases(query) if phrases is None else phrases
+        query, wildcard_terms = self._split_wildcards(query)
+        with instrumentation.span('search.preprocess'):
+            query_doc = self.query_analyzer.analyze(query)
+            query_doc.terms.extend(wildcard_terms)
+            phrases = self._preprocess_phrases(phrases)
 
         if boolean_operator == QueryBooleanOperator.AND:
             logger.info(f'Query Terms: {" AND ".join(query_doc.terms)}')
@@ -42,38 +215,117 @@ class SearchEngine:
         else:
             raise ValueError(f'Unknown boolean operator {boolean_operator}')
 
-        relevant_documents = set()
-        for term in list(query_doc.terms):
-            try:
-                documents = self.inverted_index.get(term).documents
-            except AttributeError:
-                logger.info(f"Term {term} not found in inverted index.")
-                query_doc.terms.remove(term)
-                continue
+        relevant_documents = self.search_terms(query_doc, boolean_operator, results_count, phrases=phrases)
+        run_time = timer() - start
+        instrumentation.observe('search.total', run_time)
+        logger.info(f'Relevant documents count after limit: {len(relevant_documents)}')
+        logger.info(f'Search time: {run_time:.2f}s')
 
-            if not relevant_documents:
-                relevant_documents = documents
-            else:
-                try:
-                    if boolean_operator == QueryBooleanOperator.AND:
-                        relevant_documents = relevant_documents.intersection(documents)
-                    elif boolean_operator == QueryBooleanOperator.OR:
-                        relevant_documents = relevant_documents.union(documents)
-                except AttributeError as e:
-                    logger.warning(e)
+        return relevant_documents
+
+    def search_terms(self, query_doc: WikiPage,
+                     boolean_operator=QueryBooleanOperator.AND,
+                     results_count=10, phrases: Optional[list[tuple[list[str], int]]] = None,
+                     expansions: Optional[dict[str, list[str]]] = None) -> list[tuple[WikiPage, float]]:
+        """
+        Retrieves and ranks documents for an already preprocessed query and phrases. `expansions` of missing terms
+        are given to a shard, see `_retrieve`.
+        """
+        records: dict[str, Optional[IndexRecord]] = {}
+        with instrumentation.span('search.retrieve'):
+            relevant_doc_ids = self._retrieve(query_doc, boolean_operator, records, expansions=expansions)
+            if phrases:
+                relevant_doc_ids = self._match_phrases(relevant_doc_ids, phrases, records)
+            relevant_documents = [self.inverted_index.document(doc_id) for doc_id in relevant_doc_ids]
 
         logger.info(f'Relevant documents count: {len(relevant_documents)}')
+        instrumentation.count('search.candidates', len(relevant_documents))
 
-        for doc in relevant_documents:
-            terms = self.text_preprocessor.docs.get(doc.title)
-            if terms:
-                doc.terms = ast.literal_eval(terms)
+        rerank_count = max(results_count, PROXIMITY_RERANK_COUNT)
+        if self.ranker is not None:
+            with instrumentation.span('search.rank'):
+                ranked = self.ranker.rank(query_doc, relevant_documents, records, rerank_count)
+            with instrumentation.span('search.proximity'):
+                return self._boost_proximity(query_doc, ranked, records)[:results_count]
 
-        query_doc.vector = self.vectorizer.vectorize_terms(query_doc.terms)
-        # calculate cosine similarity between query_doc and relevant documents
-        relevant_documents = rank_documents(query_doc, relevant_documents)[:results_count]
-        run_time = timer() - start
-        logger.info(f'Relevant documents count after limit: {len(relevant_documents)}')
-        logger.info(f'Search time: {run_time:.2f}s')
+        with instrumentation.span('search.rank'):
+            self._set_query_term_ids(query_doc)
+            query_doc.vector = self.vectorizer.vectorize_terms(query_doc.terms)
+            # calculate cosine similarity between query_doc and relevant documents
+            ranked = rank_documents(query_doc, relevant_documents)[:rerank_count]
+        with instrumentation.span('search.proximity'):
+            return self._boost_proximity(query_doc, ranked, records)[:results_count]
 
-        return relevant_documents
+    def search_many(self, queries: list[str],
+                    boolean_operator=QueryBooleanOperator.AND,
+                    results_count=10,
+                    workers=1) -> list[list[tuple[WikiPage, float]]]:
+        """
+        Offline throughput mode. All queries are preprocessed in one batch, index records and document terms
+        are shared between queries and tf-idf ranking is split across worker processes. BM25 ranking needs
+        only the shared postings, it runs in this process. Results are returned in the order of the queries.
+        """
+        if boolean_operator not in (QueryBooleanOperator.AND, QueryBooleanOperator.OR):
+            raise ValueError(f'Unknown boolean operator {boolean_operator}')
+        logger.info(f'Searching {len(queries)} queries with {workers=}')
+
+        start = timer()
+        instrumentation.count('search_many.queries', len(queries))
+        split_queries = [self._split_wildcards(query) for query in queries]
+        with instrumentation.span('search_many.preprocess'):
+            query_docs = self.query_analyzer.analyze_batch([query for query, _ in split_queries])
+            for query_doc, (_, wildcard_terms) in zip(query_docs, split_queries):
+                query_doc.terms.extend(wildcard_terms)
+            query_phrases = [self._preprocess_phrases(parse_phrases(query)) for query in queries]
+
+        records: dict[str, Optional[IndexRecord]] = {}
+        documents_by_id: dict[int, WikiPage] = {}
+        tasks = []
+        ranked_in_parent: list[tuple[int, list[tuple[WikiPage, float]]]] = []
+        rerank_count = max(results_count, PROXIMITY_RERANK_COUNT)
+        with instrumentation.span('search_many.retrieve'):
+            for query_idx, query_doc in enumerate(query_docs):
+                relevant_doc_ids = self._retrieve(query_doc, boolean_operator, records, verbose=False)
+                if query_phrases[query_idx]:
+                    relevant_doc_ids = self._match_phrases(relevant_doc_ids, query_phrases[query_idx], records)
+                if self.ranker is not None:
+                    documents = [self.inverted_index.document(doc_id) for doc_id in relevant_doc_ids]
+                    ranked_in_parent.append((query_idx, self.ranker.rank(query_doc, documents, records, rerank_count)))
+                    continue
+                candidates = []
+                for doc_id in relevant_doc_ids:
+                    doc = self.inverted_index.document(doc_id)
+                    candidates.append(doc)
+                    documents_by_id[doc_id] = doc
+                self._set_query_term_ids(query_doc)
+                query_doc.vector = self.vectorizer.vectorize_terms(query_doc.terms)
+                tasks.append((query_idx, query_doc, candidates))
+        logger.info(f'Retrieved candidates, {len(records)} distinct terms, {len(documents_by_id)} distinct documents')
+
+        with instrumentation.span('search_many.rank'):
+            if not tasks:
+                ranked = []
+            elif workers == 1 or len(tasks) < workers:
+                ranked = [_rank_queries(tasks, rerank_count)]
+            else:
+                ranked = utils.generic_parallel_execution(
+                    tasks, _rank_queries, rerank_count, workers=workers, executor='process'
+                )
+
+        # every query gets its results from a ranker, a query left without them is a lost worker result
+        results: list[Optional[list[tuple[WikiPage, float]]]] = [None] * len(queries)
+        with instrumentation.span('search_many.proximity'):
+            for worker_result in ranked:
+                for query_idx, scores in worker_result:
+                    query_results = [(documents_by_id[doc_id], score) for doc_id, score in scores]
+                    ranked_in_parent.append((query_idx, query_results))
+            for query_idx, query_results in ranked_in_parent:
+                results[query_idx] = self._boost_proximity(query_docs[query_idx], query_results,
+                                                           records)[:results_count]
+        missing = [query for query, query_results in zip(queries, results) if query_results is None]
+        if missing:
+            raise RuntimeError(f'Ranking returned no results for {len(missing)} queries, e.g. {missing[0]!r}.')
+
+        run_time = timer() - start
+        logger.info(f'Searched {len(queries)} queries in {run_time:.2f}s, {len(queries) / run_time:.2f} queries/s')
+        return results
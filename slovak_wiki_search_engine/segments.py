@@ -0,0 +1,328 @@
+import ast
+import logging
+import os
+import pickle
+import threading
+from typing import Iterator, Optional, Union
+
+import indexer
+import instrumentation
+import ranking
+import vectorizer
+from indexer import IndexRecord, InvertedIndex, release_terms
+from text_preprocessor import TextPreprocessor
+from vocabulary import Vocabulary
+from wiki_parser import WikiPage, WikiParser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SEGMENTS = 8
+
+
+def manifest_path(inverted_index_path: str) -> str:
+    return f'{inverted_index_path}.segments.pickle'
+
+
+def load(inverted_index_path: str) -> Union[InvertedIndex, 'SegmentedIndex']:
+    """
+    Loads the segmented index if incremental updates were applied to `inverted_index_path`,
+    the plain inverted index otherwise.
+    """
+    if os.path.exists(manifest_path(inverted_index_path)):
+        return SegmentedIndex.load(inverted_index_path)
+    return indexer.load(inverted_index_path)
+
+
+def merge_segments(segments: list[InvertedIndex], tombstones: set[int]) -> tuple[InvertedIndex, set[int]]:
+    """
+    Merges segments into a new one, dropping deleted documents. Returns the merged segment and the
+    tombstones which were applied, so they can be forgotten once the merged segment replaces the old ones.
+    """
+    merged = InvertedIndex(segments[0].vocabulary, segments[0].positional)
+    merged.vectorized = segments[0].vectorized
+    merged._index = {}
+    applied_tombstones = set()
+    for segment in segments:
+        for doc_id, document in segment.documents.items():
+            if doc_id in tombstones:
+                applied_tombstones.add(doc_id)
+            else:
+                merged.documents[doc_id] = document
+                merged._add_lengths(document, segment.document_lengths[doc_id])
+        for term_id, index_record in segment._index.items():
+            if term_id not in merged._index:
+                merged._index[term_id] = IndexRecord()
+            merged._index[term_id].merge(index_record, tombstones)
+    merged._index = {term_id: index_record for term_id, index_record in merged._index.items()
+                     if index_record.document_frequency}
+    merged.documents_count = len(merged.documents)
+    return merged, applied_tombstones
+
+
+class SegmentedIndex:
+    """
+    Inverted index made of immutable segments. The first segment is the fully built index, incremental updates
+    add new segments and mark replaced or deleted documents with tombstones. Term statistics are merged from all
+    segments at lookup time, so document frequencies and IDF only count live documents.
+    All segments share one vocabulary, so a term has the same id in every segment.
+    """
+
+    def __init__(self, base: InvertedIndex, max_segments=DEFAULT_MAX_SEGMENTS):
+        self.inverted_index_path: Optional[str] = base.inverted_index_path
+        self.vocabulary: Vocabulary = base.vocabulary
+        # filter of the base segment, terms of added segments are added to it
+        self.term_filter = base.term_filter
+        self.segments: list[InvertedIndex] = [base]
+        self.segment_paths: list[Optional[str]] = [base.inverted_index_path]
+        self.tombstones: set[int] = set()
+        self.title_to_doc_id: dict[str, int] = {}
+        self.max_segments = max_segments
+        self.generation = 0
+        # summed field lengths of the live documents, updated by `add_documents` and `delete`
+        self._total_lengths: dict[str, int] = dict(base.total_lengths)
+        self._records: dict[str, Optional[IndexRecord]] = {}
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+
+        for document in base.documents.values():
+            self.title_to_doc_id[document.title] = document.doc_id
+        self.next_doc_id = max(base.documents, default=-1) + 1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('segments', '_records', '_lock', '_merge_thread'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.segments = []
+        self._records = {}
+        self._lock = threading.RLock()
+        self._merge_thread = None
+
+    @property
+    def documents_count(self) -> int:
+        return sum(segment.documents_count for segment in self.segments) - len(self.tombstones)
+
+    @property
+    def vectorized(self) -> bool:
+        return self.segments[0].vectorized
+
+    @property
+    def total_lengths(self) -> dict[str, int]:
+        """
+        Summed field lengths of the live documents.
+        """
+        return self._total_lengths
+
+    def _count_total_lengths(self) -> dict[str, int]:
+        total_lengths = dict.fromkeys(ranking.FIELDS, 0)
+        for segment in self.segments:
+            for field, length in segment.total_lengths.items():
+                total_lengths[field] += length
+        for doc_id in self.tombstones:
+            self._subtract_lengths(total_lengths, doc_id)
+        return total_lengths
+
+    def _subtract_lengths(self, total_lengths: dict[str, int], doc_id: int):
+        total_lengths['body'] -= self.document_length(doc_id)
+        for field, length in ranking.field_lengths(self.document(doc_id)).items():
+            total_lengths[field] -= length
+
+    def average_length(self, field: str) -> float:
+        documents_count = self.documents_count
+        return self.total_lengths[field] / documents_count if documents_count else 0.0
+
+    def items(self) -> Iterator[tuple[str, IndexRecord]]:
+        for term, _ in self.vocabulary:
+            index_record = self._merged_record(term)
+            if index_record:
+                yield term, index_record
+
+    def _merged_record(self, term: str) -> Optional[IndexRecord]:
+        with self._lock:
+            if term in self._records:
+                return self._records[term]
+            term_id = self.vocabulary.get(term)
+            index_records = [segment._index[term_id] for segment in self.segments if term_id in segment._index]
+            if len(index_records) == 1 and not self.tombstones:
+                merged = index_records[0]
+            else:
+                merged = IndexRecord()
+                for index_record in index_records:
+                    merged.merge(index_record, self.tombstones)
+                if not merged.document_frequency:
+                    merged = None
+            self._records[term] = merged
+            return merged
+
+    def get(self, term: str) -> Optional[IndexRecord]:
+        if not self.segments:
+            raise Exception('Inverted index does not exist.')
+        if self.term_filter is not None and term not in self.term_filter:
+            raise AttributeError(f'Inverted index does not contain term {term}.')
+        index_record = self._merged_record(term)
+        if not index_record:
+            raise AttributeError(f'Inverted index does not contain term {term}.')
+        return index_record
+
+    def document(self, doc_id: int) -> WikiPage:
+        for segment in reversed(self.segments):
+            document = segment.documents.get(doc_id)
+            if document is not None:
+                return document
+        raise KeyError(doc_id)
+
+    def document_length(self, doc_id: int) -> int:
+        for segment in reversed(self.segments):
+            length = segment.document_lengths.get(doc_id)
+            if length is not None:
+                return length
+        raise KeyError(doc_id)
+
+    def delete(self, title: str) -> bool:
+        with self._lock:
+            doc_id = self.title_to_doc_id.pop(title, None)
+            if doc_id is None:
+                return False
+            self.tombstones.add(doc_id)
+            self._subtract_lengths(self._total_lengths, doc_id)
+            self._records = {}
+            return True
+
+    def add_documents(self, documents: list[WikiPage]):
+        """
+        Adds preprocessed documents as a new segment. Documents whose title is already indexed replace the old
+        version. Documents are vectorized against the statistics of the whole index, unless it is ranked by BM25.
+        """
+        segment = InvertedIndex(self.vocabulary, self.segments[0].positional)
+        segment.vectorized = self.vectorized
+        with self._lock:
+            for document in documents:
+                self.delete(document.title)
+                document.doc_id = self.next_doc_id
+                self.next_doc_id += 1
+                self.title_to_doc_id[document.title] = document.doc_id
+            segment._create_index(documents)
+            if self.term_filter is not None:
+                for term in {term for document in documents for term in document.terms}:
+                    if term not in self.term_filter:
+                        self.term_filter.add(term)
+            self.segments.append(segment)
+            self.segment_paths.append(None)
+            for field, length in segment.total_lengths.items():
+                self._total_lengths[field] += length
+            self._records = {}
+        instrumentation.count('segments.added_documents', len(documents))
+        if self.vectorized:
+            vectorizer.TfIdfVectorizer(self).vectorize_documents(documents)
+        else:
+            release_terms(documents)
+
+    def update(self, conf: dict[str, Union[str, int, list[str]]], dump_path: str,
+               deleted_titles: Optional[list[str]] = None, workers=4):
+        """
+        Applies an incremental dump: pages are added or replace pages with the same title,
+        `deleted_titles` are removed.
+        """
+        logger.info(f'Applying incremental update {dump_path=}, {len(deleted_titles or [])} deleted titles')
+        with instrumentation.span('segments.update'):
+            documents = WikiParser().parse_wiki(dump_path, workers)
+            text_preprocessor = TextPreprocessor(conf['preprocessor_components'], conf)
+            # changed pages must not reuse terms of their previous version
+            for document in documents:
+                text_preprocessor.docs.pop(document.title, None)
+            documents = text_preprocessor.preprocess(documents, workers)
+
+            deleted = sum(self.delete(title) for title in deleted_titles or [])
+            self.add_documents(documents)
+        logger.info(f'Added or updated {len(documents)} documents, deleted {deleted}. '
+                    f'Segments: {len(self.segments)}, tombstones: {len(self.tombstones)}')
+
+    def merge(self, full=False, terms: Optional[dict[str, str]] = None):
+        """
+        Merges incremental segments into one. A full merge also rewrites the base segment, which removes all
+        tombstones. When `terms` (title -> terms of already processed documents) is given, a full merge
+        re-vectorizes all documents with the current statistics.
+        """
+        with self._lock:
+            start = 0 if full else 1
+            to_merge = self.segments[start:]
+            tombstones = set(self.tombstones)
+        if len(to_merge) < 2 and not (full and tombstones):
+            return
+
+        with instrumentation.span('segments.merge'):
+            merged, applied_tombstones = merge_segments(to_merge, tombstones)
+
+        with self._lock:
+            # segments appended while merging stay as they are
+            self.segments = self.segments[:start] + [merged] + self.segments[start + len(to_merge):]
+            self.segment_paths = (self.segment_paths[:start] + [None] +
+                                  self.segment_paths[start + len(to_merge):])
+            self.tombstones -= applied_tombstones
+            self._records = {}
+        logger.info(f'Merged {len(to_merge)} segments, dropped {len(applied_tombstones)} deleted documents.')
+
+        if full and terms is not None and self.vectorized:
+            self._revectorize(merged, terms)
+
+    def _revectorize(self, segment: InvertedIndex, terms: dict[str, str]):
+        documents = [document for document in segment.documents.values() if document.title in terms]
+        for document in documents:
+            document.terms = ast.literal_eval(terms[document.title])
+        vectorizer.TfIdfVectorizer(self).vectorize_documents(documents)
+
+    def merge_in_background(self, full=False, terms: Optional[dict[str, str]] = None) -> threading.Thread:
+        if self._merge_thread and self._merge_thread.is_alive():
+            return self._merge_thread
+        self._merge_thread = threading.Thread(target=self.merge, args=(full, terms), daemon=True)
+        self._merge_thread.start()
+        return self._merge_thread
+
+    def maybe_merge(self) -> Optional[threading.Thread]:
+        if len(self.segments) > self.max_segments:
+            return self.merge_in_background()
+        return None
+
+    def wait_for_merge(self):
+        if self._merge_thread:
+            self._merge_thread.join()
+
+    def save(self, inverted_index_path: Optional[str] = None):
+        """
+        Writes segments which are not on disk yet and the manifest. Segment files of merged segments are removed.
+        """
+        inverted_index_path = inverted_index_path or self.inverted_index_path
+        with self._lock:
+            self.inverted_index_path = inverted_index_path
+            for idx, segment in enumerate(self.segments):
+                if self.segment_paths[idx] is None:
+                    self.generation += 1
+                    self.segment_paths[idx] = f'{inverted_index_path}.segment{self.generation}.pickle'
+                    segment.save(self.segment_paths[idx])
+
+            manifest = manifest_path(inverted_index_path)
+            if os.path.exists(manifest):
+                with open(manifest, 'rb') as manifest_file:
+                    old_paths = set(pickle.load(manifest_file).segment_paths)
+                for old_path in old_paths - set(self.segment_paths):
+                    if old_path != inverted_index_path and os.path.exists(old_path):
+                        os.remove(old_path)
+            logger.info(f'Saving segmented index manifest to {manifest}')
+            with open(manifest, 'wb') as manifest_file:
+                pickle.dump(self, manifest_file)
+
+    @staticmethod
+    def load(inverted_index_path: str) -> 'SegmentedIndex':
+        with open(manifest_path(inverted_index_path), 'rb') as manifest_file:
+            segmented_index: SegmentedIndex = pickle.load(manifest_file)
+        segmented_index.segments = [indexer.load(path) for path in segmented_index.segment_paths]
+        # every segment file holds a copy of the vocabulary, the one of the manifest is the latest
+        for segment in segmented_index.segments:
+            segment.vocabulary = segmented_index.vocabulary
+        # manifests saved before the totals were kept
+        if getattr(segmented_index, '_total_lengths', None) is None:
+            segmented_index._total_lengths = segmented_index._count_total_lengths()
+        return segmented_index
@@ -0,0 +1,278 @@
+import heapq
+import logging
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+from typing import Optional, Union
+
+import bloom
+import document_store
+import indexer
+import instrumentation
+import utils
+import vectorizer
+from arg_parser import QueryBooleanOperator, parse_phrases
+from indexer import InvertedIndex, release_infoboxes, release_terms
+from ranking import DEFAULT_RANKING, INFOBOX_RANKINGS
+from search_engine import SearchEngine
+from term_expansion import DEFAULT_TERM_EXPANSION_CONF, create_term_expander, split_wildcards
+from text_preprocessor import QueryAnalyzer, TextPreprocessor
+from vectorizer import GlobalStatistics
+from vocabulary import Vocabulary
+from wiki_parser import WikiPage, WikiParser
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(document: WikiPage, shards_count: int) -> int:
+    return document.doc_id % shards_count
+
+
+def shard_path(inverted_index_path: str, shard: int) -> str:
+    return f'{inverted_index_path}.shard{shard}'
+
+
+def statistics_path(inverted_index_path: str) -> str:
+    return f'{inverted_index_path}.stats'
+
+
+def _build_shard(documents: list[WikiPage], statistics: GlobalStatistics, path: str, positional=False,
+                 vectorized=True, false_positive_rate: Optional[float] = None,
+                 postings_codec: Optional[str] = None, infoboxes=True) -> int:
+    """
+    Builds and saves one shard. With `false_positive_rate` the term filter of the shard is also saved
+    on its own, so the search process can load it without the shard. Postings are compressed by `postings_codec`.
+    Without `infoboxes` the infobox properties are dropped, the document store keeps them.
+    """
+    shard = InvertedIndex(positional=positional)
+    shard._create_index(documents)
+    if false_positive_rate is not None:
+        shard.build_term_filter(false_positive_rate).save(bloom.filter_path(path))
+    shard.vectorized = vectorized
+    if vectorized:
+        vectorizer.TfIdfVectorizer(statistics).vectorize_documents(documents)
+    else:
+        release_terms(documents)
+    if not infoboxes:
+        release_infoboxes(documents)
+        shard.infoboxes = False
+    if postings_codec:
+        shard.compress_postings(postings_codec)
+    shard.save(path)
+    return len(shard._index)
+
+
+def create_shards(conf: dict[str, Union[str, int, list[str]]], shards_count: int, workers=4) -> GlobalStatistics:
+    """
+    Partitions the collection by doc_id into `shards_count` inverted indexes. Every shard is built and saved by
+    its own process, documents are vectorized with the statistics of the whole collection.
+    """
+    inverted_index_path: str = conf['inverted_index_path']
+    logger.info(f'Creating {shards_count} shards. {inverted_index_path=}')
+
+    with instrumentation.span('shards.parse'):
+        parsed_documents = WikiParser().parse_wiki(conf['sk_wikipedia_dump_path'], workers)
+    if conf.get('document_store'):
+        document_store.write(document_store.store_path(inverted_index_path), parsed_documents)
+    with instrumentation.span('shards.preprocess'):
+        text_preprocessor = TextPreprocessor(conf['preprocessor_components'], conf)
+        parsed_documents = text_preprocessor.preprocess(parsed_documents, workers)
+
+    statistics = GlobalStatistics()
+    statistics.add_documents(parsed_documents)
+    with open(statistics_path(inverted_index_path), 'wb') as statistics_file:
+        pickle.dump(statistics, statistics_file)
+
+    partitions: list[list[WikiPage]] = [[] for _ in range(shards_count)]
+    for document in parsed_documents:
+        partitions[shard_of(document, shards_count)].append(document)
+
+    term_filter_conf = conf.get('term_filter') or {}
+    false_positive_rate = term_filter_conf.get('false_positive_rate', 0.01) if term_filter_conf.get('enabled') else None
+    infoboxes = not conf.get('document_store') or conf.get('ranking', DEFAULT_RANKING) in INFOBOX_RANKINGS
+    with instrumentation.span('shards.build'):
+        with ProcessPoolExecutor(max_workers=min(workers, shards_count)) as executor:
+            futures = [executor.submit(_build_shard, partition, statistics, shard_path(inverted_index_path, shard),
+                                       conf.get('positional_postings', utils.DEFAULT_CONF['positional_postings']),
+                                       conf.get('ranking', DEFAULT_RANKING) == 'tfidf', false_positive_rate,
+                                       conf.get('postings_codec'), infoboxes)
+                       for shard, partition in enumerate(partitions)]
+            for shard, future in enumerate(futures):
+                logger.info(f'Shard {shard}: {len(partitions[shard])} documents, {future.result()} terms')
+    return statistics
+
+
+def load_statistics(inverted_index_path: str) -> GlobalStatistics:
+    with open(statistics_path(inverted_index_path), 'rb') as statistics_file:
+        return pickle.load(statistics_file)
+
+
+# search engine of the shard served by the current worker process
+_shard_search_engine: Optional[SearchEngine] = None
+
+
+def _init_shard_worker(path: str, statistics: GlobalStatistics, conf: dict):
+    global _shard_search_engine
+    utils.setup_logging(verbose=False)
+    _shard_search_engine = SearchEngine(indexer.load(path), conf, statistics=statistics)
+
+
+def _search_shard(query_doc: WikiPage, boolean_operator: QueryBooleanOperator, results_count: int,
+                  phrases: list[tuple[list[str], int]],
+                  expansions: dict[str, list[str]]) -> list[tuple[WikiPage, float]]:
+    return _shard_search_engine.search_terms(query_doc, boolean_operator, results_count, phrases=phrases,
+                                             expansions=expansions)
+
+
+class ShardedSearchEngine:
+    """
+    Scatter-gather search. Each shard is served by its own worker process which keeps the shard loaded,
+    the query is preprocessed once, sent to all shards and the per shard top results are merged.
+    Missing and wildcard terms are expanded once against the terms of the whole collection,
+    so a shard matches the same expansions as a single index.
+    """
+
+    def __init__(self, conf: dict[str, Union[str, int, list[str]]], shards_count: int):
+        self.conf = conf
+        inverted_index_path = conf['inverted_index_path']
+        self.statistics = load_statistics(inverted_index_path)
+        self.query_analyzer = QueryAnalyzer(conf.get('preprocessor_components'), conf)
+        expansion_conf = conf.get('term_expansion') or DEFAULT_TERM_EXPANSION_CONF
+        self.term_expander = None
+        if expansion_conf.get('enabled'):
+            self.term_expander = create_term_expander(Vocabulary(self.statistics.terms), expansion_conf)
+        self.shards = [
+            ProcessPoolExecutor(max_workers=1, initializer=_init_shard_worker,
+                                initargs=(shard_path(inverted_index_path, shard), self.statistics, conf))
+            for shard in range(shards_count)
+        ]
+        # shards without filters are always searched
+        self.term_filters: list[Optional[bloom.BloomFilter]] = []
+        for shard in range(shards_count):
+            path = bloom.filter_path(shard_path(inverted_index_path, shard))
+            self.term_filters.append(bloom.BloomFilter.load(path) if os.path.exists(path) else None)
+
+    def _document_frequency(self, term: str) -> Optional[int]:
+        return self.statistics.terms[term].document_frequency if term in self.statistics else None
+
+    def _split_wildcards(self, query: str) -> tuple[str, list[str]]:
+        if self.term_expander is None:
+            return query, []
+        return split_wildcards(query)
+
+    def _expand_missing_terms(self, query_doc: WikiPage, verbose=True) -> dict[str, list[str]]:
+        """
+        Expansions of the query terms missing in the whole collection, like `SearchEngine._retrieve` expands
+        them in one index. Terms without expansions are removed from the query.
+        """
+        expansions = {}
+        query_terms = []
+        for term in query_doc.terms:
+            if term in self.statistics:
+                query_terms.append(term)
+                continue
+            term_expansions = []
+            if self.term_expander is not None:
+                term_expansions = self.term_expander.expansions(term, self._document_frequency)
+            if not term_expansions:
+                instrumentation.count('search.missing_terms')
+                if verbose:
+                    logger.info(f"Term {term} not found in inverted index.")
+                continue
+            instrumentation.count('search.expanded_terms')
+            if verbose:
+                logger.info(f"Term {term} not found in inverted index, expanded to {', '.join(term_expansions)}.")
+            expansions[term] = term_expansions
+            query_terms.append(term)
+        query_doc.terms = query_terms
+        return expansions
+
+    def _preprocess_phrases(self, phrases: list[tuple[str, int]]) -> list[tuple[list[str], int]]:
+        if not phrases:
+            return []
+        phrase_docs = self.query_analyzer.analyze_batch([text for text, _ in phrases])
+        return [(phrase_doc.terms, slop) for phrase_doc, (_, slop) in zip(phrase_docs, phrases) if phrase_doc.terms]
+
+    def _may_match(self, shard: int, query_doc: WikiPage, boolean_operator: QueryBooleanOperator,
+                   phrases: list[tuple[list[str], int]], expansions: dict[str, list[str]]) -> bool:
+        """
+        False if the term filter of the shard rules out every match, all phrase terms are required
+        and all query terms for an AND query. An expanded term matches if any of its expansions does.
+        """
+        term_filter = self.term_filters[shard]
+        if term_filter is None:
+            return True
+        if not all(term in term_filter for phrase_terms, _ in phrases for term in phrase_terms):
+            return False
+        groups = [any(expansion in term_filter for expansion in expansions.get(term, [term]))
+                  for term in query_doc.terms]
+        if boolean_operator == QueryBooleanOperator.AND:
+            return all(groups)
+        return any(groups)
+
+    def _scatter(self, query_doc: WikiPage, boolean_operator: QueryBooleanOperator, results_count: int,
+                 phrases: list[tuple[list[str], int]], expansions: dict[str, list[str]]) -> list:
+        if not query_doc.terms:
+            return []
+        futures = []
+        for shard, executor in enumerate(self.shards):
+            if self._may_match(shard, query_doc, boolean_operator, phrases, expansions):
+                futures.append(executor.submit(_search_shard, query_doc, boolean_operator, results_count, phrases,
+                                               expansions))
+            else:
+                instrumentation.count('shards.skipped')
+        return futures
+
+    @staticmethod
+    def _gather(futures: list, results_count: int) -> list[tuple[WikiPage, float]]:
+        shard_results = [future.result() for future in futures]
+        return heapq.nlargest(results_count, (result for results in shard_results for result in results),
+                              key=lambda result: result[1])
+
+    def search(self, query: str,
+               boolean_operator=QueryBooleanOperator.AND,
+               results_count=10,
+               phrases: Optional[list[tuple[str, int]]] = None) -> list[tuple[WikiPage, float]]:
+        logger.info(f'Original Query: {query}')
+        start = timer()
+        phrases = parse_phrases(query) if phrases is None else phrases
+        query, wildcard_terms = self._split_wildcards(query)
+        with instrumentation.span('search.preprocess'):
+            query_doc = self.query_analyzer.analyze(query)
+            query_doc.terms.extend(wildcard_terms)
+            phrases = self._preprocess_phrases(phrases)
+        expansions = self._expand_missing_terms(query_doc)
+        logger.info(f'Query Terms: {f" {boolean_operator.name} ".join(query_doc.terms)}')
+
+        with instrumentation.span('search.scatter_gather'):
+            futures = self._scatter(query_doc, boolean_operator, results_count, phrases, expansions)
+            results = self._gather(futures, results_count)
+        logger.info(f'Search time: {timer() - start:.2f}s')
+        return results
+
+    def search_many(self, queries: list[str],
+                    boolean_operator=QueryBooleanOperator.AND,
+                    results_count=10,
+                    workers=None) -> list[list[tuple[WikiPage, float]]]:
+        """
+        All queries are sent to the shards before any results are gathered, so shards work through them
+        concurrently. `workers` is ignored, parallelism is given by the number of shards.
+        """
+        start = timer()
+        split_queries = [self._split_wildcards(query) for query in queries]
+        query_docs = self.query_analyzer.analyze_batch([query for query, _ in split_queries])
+        pending = []
+        for query, query_doc, (_, wildcard_terms) in zip(queries, query_docs, split_queries):
+            query_doc.terms.extend(wildcard_terms)
+            expansions = self._expand_missing_terms(query_doc, verbose=False)
+            phrases = self._preprocess_phrases(parse_phrases(query))
+            pending.append(self._scatter(query_doc, boolean_operator, results_count, phrases, expansions))
+        results = [self._gather(futures, results_count) for futures in pending]
+        run_time = timer() - start
+        logger.info(f'Searched {len(queries)} queries in {run_time:.2f}s, {len(queries) / run_time:.2f} queries/s')
+        return results
+
+    def close(self):
+        for shard in self.shards:
+            shard.shutdown()
@@ -0,0 +1,132 @@
+import glob
+import json
+import logging
+import os
+import pickle
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Union
+
+import bloom
+import instrumentation
+import ranking
+from indexer import IndexRecord, InvertedIndex
+from sharding import shard_path, statistics_path
+from vectorizer import GlobalStatistics, TermStatistics
+from wiki_parser import Infobox, WikiPage
+
+logger = logging.getLogger(__name__)
+
+
+def read_json_lines(path: str) -> Iterator[dict]:
+    """
+    Records of all part files of a directory written by Spark.
+    """
+    for part_path in sorted(glob.glob(os.path.join(path, 'part-*'))):
+        with open(part_path, encoding='utf-8') as part_file:
+            for line in part_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_collection(spark_index_path: str) -> dict:
+    return next(read_json_lines(os.path.join(spark_index_path, 'collection')))
+
+
+def read_statistics(spark_index_path: str) -> GlobalStatistics:
+    collection = read_collection(spark_index_path)
+    statistics = GlobalStatistics()
+    statistics.documents_count = collection['documents_count']
+    statistics.total_lengths = dict.fromkeys(ranking.FIELDS, 0)
+    statistics.total_lengths.update(collection['total_lengths'])
+    statistics.terms = {record['term']: TermStatistics(record['df'], record['cf'])
+                        for record in read_json_lines(os.path.join(spark_index_path, 'statistics'))}
+    return statistics
+
+
+def _document(record: dict) -> WikiPage:
+    infobox = None
+    if record.get('infobox') is not None:
+        infobox = Infobox(record.get('infobox_name'))
+        infobox.properties = json.loads(record['infobox'])
+    document = WikiPage(record['doc_id'], record.get('title'), None, infobox)
+    document.terms = None
+    return document
+
+
+def build_shard(spark_index_path: str, shard: int, path: str,
+                false_positive_rate: Optional[float] = None, postings_codec: Optional[str] = None) -> int:
+    """
+    Converts the postings and documents of one shard built by Spark to an inverted index and saves it to `path`.
+    Nothing is preprocessed or counted again, the postings hold term frequencies, positions and tf-idf weights.
+    Terms of the documents are restored from the positions, without them the occurrences of a term are
+    consecutive, which gives the same vectors and scores. Postings are compressed by `postings_codec`.
+    """
+    collection = read_collection(spark_index_path)
+    inverted_index = InvertedIndex(positional=collection['positional'])
+    inverted_index.vectorized = collection['vectorized']
+    inverted_index._index = {}
+    for record in read_json_lines(os.path.join(spark_index_path, 'documents', f'shard={shard}')):
+        document = _document(record)
+        inverted_index.documents[document.doc_id] = document
+        inverted_index._add_lengths(document, record['length'])
+    inverted_index.documents_count = len(inverted_index.documents)
+
+    # doc_id -> (position, term id, weight) of every occurrence
+    occurrences: dict[int, list[tuple[int, int, float]]] = {doc_id: [] for doc_id in inverted_index.documents}
+    for record in read_json_lines(os.path.join(spark_index_path, 'postings', f'shard={shard}')):
+        term_id = inverted_index.vocabulary.add(record['term'])
+        index_record = inverted_index._index[term_id] = IndexRecord()
+        for posting in record['postings']:
+            doc_id, term_frequency, positions = posting['doc_id'], posting['tf'], posting.get('positions')
+            index_record.document_frequency += 1
+            index_record.corpus_frequency += term_frequency
+            index_record.term_frequencies[doc_id] = term_frequency
+            if inverted_index.positional:
+                index_record.set_positions(doc_id, positions)
+            else:
+                positions = range(len(occurrences[doc_id]), len(occurrences[doc_id]) + term_frequency)
+            occurrences[doc_id].extend((position, term_id, posting.get('weight')) for position in positions)
+    inverted_index.vocabulary.compact()
+
+    for doc_id, document in inverted_index.documents.items():
+        document_occurrences = sorted(occurrences[doc_id])
+        document.term_ids = array('I', (term_id for _, term_id, _ in document_occurrences))
+        if inverted_index.vectorized:
+            document.vector = array('d', (weight for _, _, weight in document_occurrences))
+
+    if false_positive_rate is not None:
+        inverted_index.build_term_filter(false_positive_rate).save(bloom.filter_path(path))
+    if postings_codec:
+        inverted_index.compress_postings(postings_codec)
+    inverted_index.save(path)
+    return len(inverted_index._index)
+
+
+def import_shards(conf: dict[str, Union[str, int, list[str]]], spark_index_path: str,
+                  workers=4) -> GlobalStatistics:
+    """
+    Writes the shards and global statistics of an index built by the Spark job, see `spark/src/index_builder.py`,
+    in the format of `sharding.create_shards`. The number of shards is the one of the Spark job.
+    """
+    inverted_index_path: str = conf['inverted_index_path']
+    collection = read_collection(spark_index_path)
+    shards_count = collection['shards']
+    if conf.get('shards') and conf['shards'] != shards_count:
+        raise ValueError(f'Spark index has {shards_count} shards, configuration expects {conf["shards"]}.')
+    logger.info(f'Importing {shards_count} shards built by Spark. {spark_index_path=}, {inverted_index_path=}')
+
+    statistics = read_statistics(spark_index_path)
+    with open(statistics_path(inverted_index_path), 'wb') as statistics_file:
+        pickle.dump(statistics, statistics_file)
+
+    term_filter_conf = conf.get('term_filter') or {}
+    false_positive_rate = term_filter_conf.get('false_positive_rate', 0.01) if term_filter_conf.get('enabled') else None
+    with instrumentation.span('shards.import'):
+        with ProcessPoolExecutor(max_workers=min(workers, shards_count)) as executor:
+            futures = [executor.submit(build_shard, spark_index_path, shard, shard_path(inverted_index_path, shard),
+                                       false_positive_rate, conf.get('postings_codec'))
+                       for shard in range(shards_count)]
+            for shard, future in enumerate(futures):
+                logger.info(f'Shard {shard}: {future.result()} terms')
+    return statistics
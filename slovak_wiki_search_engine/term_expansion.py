@@ -0,0 +1,197 @@
+import fnmatch
+import os
+import re
+import unicodedata
+from typing import Callable, Optional
+
+from vocabulary import Vocabulary
+
+DEFAULT_TERM_EXPANSION_CONF = {
+    "enabled": True,
+    "max_distance": 2,
+    "max_expansions": 5,
+    "prefix_length": 1,
+}
+WILDCARD_CHARACTERS = '*?'
+# `?` ends a lot of questions, it is a wildcard only inside a word
+WILDCARD_TERM_PATTERN = re.compile(r'\w*(?:\*|\?\w)[\w*?]*', re.UNICODE)
+# upper bound of all terms with a given prefix
+_LAST_CHARACTER = '\U0010ffff'
+
+_folded_characters: dict[str, str] = {}
+
+
+def fold(character: str) -> str:
+    """
+    Character without diacritics, á -> a, ľ -> l.
+    """
+    folded = _folded_characters.get(character)
+    if folded is None:
+        folded = unicodedata.normalize('NFD', character)[0]
+        _folded_characters[character] = folded
+    return folded
+
+
+def remove_diacritics(text: str) -> str:
+    return ''.join(fold(character) for character in text)
+
+
+def is_wildcard(term: str) -> bool:
+    return any(character in term for character in WILDCARD_CHARACTERS)
+
+
+def split_wildcards(query: str) -> tuple[str, list[str]]:
+    """
+    Query without its wildcard terms and the wildcard terms, they bypass the preprocessing
+    and are expanded over the vocabulary.
+    """
+    wildcard_terms = [match.group().lower() for match in WILDCARD_TERM_PATTERN.finditer(query)]
+    return WILDCARD_TERM_PATTERN.sub(' ', query), wildcard_terms
+
+
+def auto_distance(term: str, max_distance: int) -> int:
+    """
+    Allowed edits grow with the term length, short terms would match too many others.
+    """
+    if len(term) < 3:
+        return 0
+    if len(term) <= 5:
+        return min(1, max_distance)
+    return max_distance
+
+
+class TermExpander:
+    """
+    Finds vocabulary terms for query terms which are not in the index. Prefix and wildcard patterns are matched
+    against the range of sorted terms sharing their literal prefix. Fuzzy matching walks the sorted terms like
+    a trie: Levenshtein rows of a prefix are reused by all terms sharing it and whole prefix ranges are skipped
+    once no row value is within the allowed distance. Characters are compared without diacritics,
+    so a distance of 0 is a diacritic-insensitive lookup.
+    """
+
+    def __init__(self, vocabulary: Vocabulary, max_distance=2, max_expansions=5, prefix_length=1):
+        self.vocabulary = vocabulary
+        self.max_distance = max_distance
+        self.max_expansions = max_expansions
+        # leading characters which have to match, they are rarely misspelled and bound the walk
+        self.prefix_length = prefix_length
+
+    def wildcard(self, pattern: str) -> list[str]:
+        """
+        Vocabulary terms matching the pattern. Like in fuzzy matching the first `prefix_length` characters,
+        at least one, have to be literal, `*ava` would test every term of the vocabulary and matches nothing.
+        """
+        literal_prefix = re.split(r'[*?]', pattern, maxsplit=1)[0]
+        if len(literal_prefix) < max(self.prefix_length, 1):
+            return []
+        matcher = re.compile(fnmatch.translate(pattern))
+        return [term for term, _ in self.vocabulary.prefix(literal_prefix) if matcher.match(term)]
+
+    def fuzzy(self, term: str, max_distance: Optional[int] = None) -> list[tuple[int, str]]:
+        """
+        Returns (distance, term) of vocabulary terms within `max_distance` edits of `term`, ignoring diacritics.
+        """
+        if max_distance is None:
+            max_distance = auto_distance(term, self.max_distance)
+        query = remove_diacritics(term)
+        prefix_length = min(self.prefix_length, len(query))
+        # rows[i] is the Levenshtein row after the first i characters of the current term
+        rows = [list(range(len(query) + 1))]
+
+        def extend(candidate: str, depth: int) -> int:
+            """
+            Computes rows of `candidate` from `depth` on. Returns the number of characters after which no term
+            with the same prefix can match, or -1.
+            """
+            del rows[depth + 1:]
+            for character in candidate[depth:]:
+                character = fold(character)
+                if len(rows) <= prefix_length and character != query[len(rows) - 1]:
+                    return len(rows)
+                row = rows[-1]
+                new_row = [row[0] + 1]
+                for idx, query_character in enumerate(query):
+                    new_row.append(min(row[idx + 1] + 1, new_row[idx] + 1, row[idx] + (query_character != character)))
+                rows.append(new_row)
+                if min(new_row) > max_distance:
+                    return len(rows) - 1
+            return -1
+
+        def distance(exceeded: int) -> Optional[int]:
+            """
+            Distance of a candidate walked by `extend` or None. A walk which stopped early leaves the rows of
+            a prefix of the candidate, and a candidate shorter than the required prefix never matches.
+            """
+            if exceeded >= 0 or len(rows) <= prefix_length or rows[-1][-1] > max_distance:
+                return None
+            return rows[-1][-1]
+
+        matches = []
+        previous = ''
+        skip_prefix = None
+        position = 0
+        while position < self.vocabulary.stored_count:
+            jump_to = None
+            for position, candidate in self.vocabulary.stored_terms(position):
+                if skip_prefix is not None:
+                    if candidate.startswith(skip_prefix):
+                        continue
+                    skip_prefix = None
+                depth = len(os.path.commonprefix((previous, candidate)))
+                previous = candidate
+                exceeded = extend(candidate, min(depth, len(rows) - 1))
+                candidate_distance = distance(exceeded)
+                if candidate_distance is not None:
+                    matches.append((candidate_distance, candidate))
+                elif exceeded >= 0:
+                    # no term starting with this prefix can match, terms of the decoded block are skipped one by
+                    # one, a range reaching into the next block is skipped by a lookup
+                    skip_prefix = candidate[:exceeded]
+                    next_head = self.vocabulary.next_block_head(position)
+                    if next_head is not None and next_head.startswith(skip_prefix):
+                        jump_to = self.vocabulary.bisect(skip_prefix + _LAST_CHARACTER)
+                        break
+            if jump_to is None:
+                break
+            position = jump_to
+            skip_prefix = None
+
+        for candidate in self.vocabulary.added_terms():
+            candidate_distance = distance(extend(candidate, 0))
+            if candidate_distance is not None:
+                matches.append((candidate_distance, candidate))
+        return sorted(matches)
+
+    def expand(self, term: str) -> list[str]:
+        """
+        Candidate terms for a term which is not in the index. Only the closest fuzzy matches are returned,
+        e.g. terms differing only in diacritics, if there are any.
+        """
+        if is_wildcard(term):
+            return self.wildcard(term)
+        matches = self.fuzzy(term)
+        if not matches:
+            return []
+        best_distance = matches[0][0]
+        return [candidate for distance, candidate in matches if distance == best_distance and candidate != term]
+
+    def expansions(self, term: str, document_frequency: Callable[[str], Optional[int]]) -> list[str]:
+        """
+        At most `max_expansions` candidates of `expand`, the most frequent ones first. Candidates without
+        a document frequency are not in the searched index and are left out.
+        """
+        frequencies = [(candidate, document_frequency(candidate)) for candidate in self.expand(term)]
+        frequencies = [(candidate, frequency) for candidate, frequency in frequencies if frequency is not None]
+        frequencies.sort(key=lambda candidate_frequency: candidate_frequency[1], reverse=True)
+        return [candidate for candidate, _ in frequencies[:self.max_expansions]]
+
+
+def create_term_expander(vocabulary: Vocabulary, expansion_conf: Optional[dict]) -> Optional[TermExpander]:
+    """
+    Expander of `term_expansion` in the configuration, None if expansion is disabled.
+    """
+    expansion_conf = expansion_conf or DEFAULT_TERM_EXPANSION_CONF
+    if not expansion_conf.get('enabled'):
+        return None
+    return TermExpander(vocabulary, expansion_conf.get('max_distance', 2), expansion_conf.get('max_expansions', 5),
+                        expansion_conf.get('prefix_length', 1))
@@ -4,12 +4,9 @@ import logging
 import multiprocessing
 import re
 from abc import ABC
-from typing import Union
+from typing import Optional, Union
 
-import pandas as pd
-import spacy_udpipe
 import unicodedata
-from tqdm import tqdm
 
 import utils
 from utils import get_file_path
@@ -31,6 +28,10 @@ class PreprocessorComponent(ABC):
     def process(self, document: WikiPage):
         raise NotImplementedError
 
+    def process_batch(self, documents: list[WikiPage]):
+        for document in documents:
+            self.process(document)
+
 
 class Normalizer(PreprocessorComponent):
     def __init__(self):
@@ -57,10 +58,10 @@ class StopWordsRemover(PreprocessorComponent):
     def __init__(self, stop_words_path: str):
         self.stop_words_path = get_file_path(stop_words_path)
         with open(self.stop_words_path, encoding="UTF-8") as stopwords_file:
-            self.stop_words_list = [line.strip() for line in stopwords_file]
+            self.stop_words = frozenset(line.strip() for line in stopwords_file)
 
     def process(self, document: WikiPage):
-        document.terms = [word for word in document.terms if word not in self.stop_words_list and len(word) > 1]
+        document.terms = [word for word in document.terms if word not in self.stop_words and len(word) > 1]
 
 
 class Tokenizer(PreprocessorComponent):
@@ -84,6 +85,9 @@ class Tokenizer(PreprocessorComponent):
 
 class Lemmatizer(PreprocessorComponent):
     def __init__(self):
+        # spacy takes about half a second to import, only the lemmatizer needs it
+        import spacy_udpipe
+
         self.allowed_postags = DEFAULT_ALLOWED_POSTAGS
         self.lemmatizer = spacy_udpipe.load("sk")
 
@@ -95,6 +99,15 @@ class Lemmatizer(PreprocessorComponent):
             if token.pos_ in self.allowed_postags and len(token.lemma_) > 1
         ]
 
+    def process_batch(self, documents: list[WikiPage]):
+        texts = (" ".join(document.terms) for document in documents)
+        for document, doc in zip(documents, self.lemmatizer.pipe(texts)):
+            document.terms = [
+                CUSTOM_WORDS[token.lemma_] if token.lemma_ in CUSTOM_WORDS else token.lemma_
+                for token in doc
+                if token.pos_ in self.allowed_postags and len(token.lemma_) > 1
+            ]
+
 
 class DocumentSaver(PreprocessorComponent):
     def __init__(self, already_processed_path: str, lock: multiprocessing.Lock):
@@ -102,12 +115,41 @@ class DocumentSaver(PreprocessorComponent):
         self.lock = lock
 
     def process(self, document: WikiPage):
+        import pandas as pd
+
         with self.lock:
             pd.DataFrame([[document.doc_id, document.title, document.terms]]).to_csv(
                 self.already_processed_path, index=False, header=False, mode='a', encoding='utf-8'
             )
 
 
+# configuration name -> component key, in the order the components run
+PIPELINE_COMPONENTS = {
+    'normalize': 'normalizer',
+    'tokenize': 'tokenizer',
+    'remove_stopwords': 'stopwords_remover',
+    'lemmatize': 'lemmatizer',
+    # after lemmatize we want to remove stop words again
+    'stop_words_cleaner': 'stopwords_cleaner',
+    'document_saver': 'document_saver',
+}
+
+
+def create_component(component_name: str, conf: dict[str, Union[str, int, list[str]]],
+                     lock: multiprocessing.Lock = None) -> PreprocessorComponent:
+    if component_name == 'normalize':
+        return Normalizer()
+    if component_name == 'tokenize':
+        return Tokenizer()
+    if component_name in ('remove_stopwords', 'stop_words_cleaner'):
+        return StopWordsRemover(conf.get('stop_words_path'))
+    if component_name == 'lemmatize':
+        return Lemmatizer()
+    if component_name == 'document_saver':
+        return DocumentSaver(conf.get('already_processed_path'), lock)
+    raise ValueError(f"Unknown preprocessor component {component_name}")
+
+
 class TextPreprocessor:
     def __init__(self, component_names: list[str], conf: dict[str, Union[str, int, list[str]]], load_docs=True):
         self.component_names = component_names
@@ -117,50 +159,77 @@ class TextPreprocessor:
         ).set_index('title')['terms'].to_dict()
         self.conf = conf
         if 'lemmatize' in component_names:
+            import spacy_udpipe
+
             spacy_udpipe.download("sk")
         self.lock = multiprocessing.Manager().Lock()
 
+    def __getstate__(self):
+        # workers do not read already processed documents, do not send them along
+        state = self.__dict__.copy()
+        state['docs'] = {}
+        return state
+
     def init_components(self) -> dict[str, PreprocessorComponent]:
         components: dict[str, PreprocessorComponent] = {}
-        if 'normalize' in self.component_names:
-            components['normalizer'] = Normalizer()
-        if 'tokenize' in self.component_names:
-            components['tokenizer'] = Tokenizer()
-        if 'remove_stopwords' in self.component_names:
-            components['stopwords_remover'] = StopWordsRemover(self.conf.get('stop_words_path'))
-        if 'lemmatize' in self.component_names:
-            components['lemmatizer'] = Lemmatizer()
-        if 'stop_words_cleaner' in self.component_names:
-            # after lemmatize we want to remove stop words again
-            components['stopwords_cleaner'] = StopWordsRemover(self.conf.get('stop_words_path'))
-        if 'document_saver' in self.component_names:
-            components['document_saver'] = DocumentSaver(self.already_processed_path, self.lock)
+        for component_name, key in PIPELINE_COMPONENTS.items():
+            if component_name in self.component_names:
+                components[key] = create_component(component_name, self.conf, self.lock)
         return components
 
     def _preprocess(self, documents: list[WikiPage], pbar_position=0):
+        from tqdm import tqdm
+
         logger.info(f"Preprocessing {len(documents)} documents.")
         components = self.init_components()
 
-        for document in tqdm(documents, desc=f"{pbar_position}", position=pbar_position, leave=False):
+        for document in tqdm(documents, desc=f"{pbar_position}", position=pbar_position, leave=False,
+                             disable=not utils.show_progress()):
             for name, component in components.items():
                 component.process(document)
             document.raw_text = None
             # document.terms = None
         return documents
 
-    def preprocess(self, documents: list[WikiPage], workers=4, query=False) -> list[WikiPage]:
-        if query:
-            return self._preprocess(documents)
+    def preprocess_batch(self, documents: list[WikiPage]) -> list[WikiPage]:
+        """
+        Runs each component over the whole batch before moving to the next one,
+        so the lemmatizer can process all documents in a single pipe.
+        """
+        components = self.init_components()
+        for name, component in components.items():
+            component.process_batch(documents)
+        for document in documents:
+            document.raw_text = None
+        return documents
+
+    def load_already_processed(self, documents: list[WikiPage]) -> set[WikiPage]:
+        """
+        Sets terms of documents which were processed before. Their raw text is dropped,
+        so `needs_preprocessing` is false for them.
+        """
+        from tqdm import tqdm
+
         already_parsed = set()
-        for document in tqdm(documents, desc="Reading already processed documents", position=0, leave=False):
+        for document in tqdm(documents, desc="Reading already processed documents", position=0, leave=False,
+                             disable=not utils.show_progress()):
             if document.title in self.docs:
                 document.terms = ast.literal_eval(self.docs[document.title])
                 document.raw_text = None
                 already_parsed.add(document)
+        logger.info(f"Already parsed {len(already_parsed)} documents.")
+        logger.info(f"Need to parse {len(documents) - len(already_parsed)} documents.")
+        return already_parsed
+
+    @staticmethod
+    def needs_preprocessing(document: WikiPage) -> bool:
+        return document.raw_text is not None
 
+    def preprocess(self, documents: list[WikiPage], workers=4, query=False) -> list[WikiPage]:
+        if query:
+            return self._preprocess(documents)
+        already_parsed = self.load_already_processed(documents)
         to_parse = list(set(documents) - already_parsed)
-        logger.info(f"Already parsed {len(already_parsed)} documents.")
-        logger.info(f"Need to parse {len(to_parse)} documents.")
         if workers == 1 or len(to_parse) < 100:
             return self._preprocess(to_parse) + list(already_parsed)
 
@@ -170,3 +239,52 @@ class TextPreprocessor:
         preprocessed_documents = list(itertools.chain.from_iterable(preprocessed_documents))
         preprocessed_documents.extend(already_parsed)
         return preprocessed_documents
+
+
+# a short sentence which runs through every component, including the tagger of the lemmatizer
+WARMUP_TEXT = 'Bratislava je hlavné mesto Slovenska.'
+
+
+class QueryAnalyzer:
+    """
+    Preprocessing of queries for a long running search engine. Components are created on the first query
+    and kept, so the lemmatizer model is loaded once. Unlike TextPreprocessor it does not read already processed
+    documents, does not check the model download and starts no multiprocessing manager, queries are never saved.
+    """
+
+    def __init__(self, component_names: list[str], conf: dict[str, Union[str, int, list[str]]]):
+        self.component_names = [name for name in component_names or [] if name != 'document_saver']
+        self.conf = conf
+        self._components: Optional[dict[str, PreprocessorComponent]] = None
+
+    @property
+    def components(self) -> dict[str, PreprocessorComponent]:
+        if self._components is None:
+            self._components = {key: create_component(component_name, self.conf)
+                                for component_name, key in PIPELINE_COMPONENTS.items()
+                                if component_name in self.component_names}
+        return self._components
+
+    def warmup(self):
+        """
+        Creates the components and runs a query through them, the first real query does not pay for it.
+        """
+        self.analyze(WARMUP_TEXT)
+
+    def analyze(self, query: str) -> WikiPage:
+        query_doc = WikiPage(-1, None, query)
+        for component in self.components.values():
+            component.process(query_doc)
+        query_doc.raw_text = None
+        return query_doc
+
+    def analyze_batch(self, queries: list[str]) -> list[WikiPage]:
+        """
+        Runs each component over all queries, the lemmatizer processes them in a single pipe.
+        """
+        query_docs = [WikiPage(-1, None, query) for query in queries]
+        for component in self.components.values():
+            component.process_batch(query_docs)
+        for query_doc in query_docs:
+            query_doc.raw_text = None
+        return query_docs
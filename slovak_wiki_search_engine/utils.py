@@ -7,15 +7,24 @@ from concurrent.futures import as_completed, ProcessPoolExecutor, ThreadPoolExec
 from os.path import exists
 from pathlib import Path
 from timeit import default_timer as timer
+from typing import TYPE_CHECKING
 from stemmer import stem
 
-import numpy as np
-import pandas as pd
-
+import bloom
+import instrumentation
+import postings
+import term_expansion
 import wiki_parser
 
+# numpy and pandas take most of the import time, they are imported by the functions which use them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
+PROXIMITY_WEIGHT = 0.2
+
 DEFAULT_CONF = {
     'inverted_index_path': 'data/inverted_index_1m.pickle',
     'sk_wikipedia_dump_path': 'data/sk_wikipedia_dump_small_1m.xml',
@@ -30,23 +39,41 @@ DEFAULT_CONF = {
         "document_saver"
     ],
     "workers": 4,
-    "verbose": True
+    "verbose": True,
+    "max_segments": 8,
+    "shards": 0,
+    "spark_index_path": None,
+    "instrumentation": instrumentation.DEFAULT_INSTRUMENTATION_CONF,
+    "term_expansion": term_expansion.DEFAULT_TERM_EXPANSION_CONF,
+    "positional_postings": True,
+    "postings_codec": None,
+    "ranking": "tfidf",
+    "term_filter": bloom.DEFAULT_TERM_FILTER_CONF,
+    "document_store": False,
 }
 
 
-def setup_logging(verbose=True):
+def setup_logging(verbose=True, level=logging.INFO):
     log_handlers = [logging.StreamHandler()]
     formatter = logging.Formatter(fmt='[%(asctime)s.%(msecs)03d] [%(levelname)s] [%(filename)s]: %(message)s',
                                   datefmt='%m/%d/%Y %I:%M:%S')
     for handler in log_handlers:
         handler.setFormatter(formatter)
+    # the level is set on the root logger, so disabled messages are dropped before a record is created
     if not verbose:
-        for handler in log_handlers:
-            handler.setLevel(logging.CRITICAL)
-    logging.basicConfig(level=logging.DEBUG, handlers=log_handlers)
+        level = logging.CRITICAL
+    logging.basicConfig(level=level, handlers=log_handlers)
+    logging.root.setLevel(level)
     logging.root.handlers = log_handlers
 
 
+def show_progress() -> bool:
+    """
+    Progress bars are shown only when info messages are logged.
+    """
+    return logging.root.isEnabledFor(logging.INFO)
+
+
 def get_conf(conf_file_path):
     if not os.path.exists(conf_file_path):
         os.makedirs(os.path.dirname(conf_file_path), exist_ok=True)
@@ -71,7 +98,9 @@ def get_file_path(file_path):
         raise FileNotFoundError(f"File {file_path} not found")
 
 
-def load_or_create_csv(name: str, column_names: list[str]) -> pd.DataFrame:
+def load_or_create_csv(name: str, column_names: list[str]) -> 'pd.DataFrame':
+    import pandas as pd
+
     if exists(name):
         df = pd.read_csv(name, encoding='utf-8')
     else:
@@ -81,6 +110,10 @@ def load_or_create_csv(name: str, column_names: list[str]) -> pd.DataFrame:
 
 
 def generic_parallel_execution(data, func, *args, workers=4, executor='process', **kwargs):
+    """
+    Splits `data` into `workers` slices and runs `func` on each of them. Results are in the order the workers
+    finished. An exception of any worker is raised once all of them are done, no partial result is returned.
+    """
     if executor == 'process':
         executor_type = ProcessPoolExecutor
     elif executor == 'thread':
@@ -88,24 +121,29 @@ def generic_parallel_execution(data, func, *args, workers=4, executor='process',
     else:
         raise Exception(f"Executor {executor} not supported")
 
+    import numpy as np
+
     space = np.linspace(0, len(data), workers + 1, dtype=int)
     results = []
     start_time = timer()
-    with executor_type(max_workers=workers) as executor:
-        futures = set()
-        for i in range(workers):
-            kwargs['pbar_position'] = i
-            future = executor.submit(func, data[space[i]:space[i + 1]], *args, **kwargs)
-            logger.info(f"Starting worker {future}")
-            futures.add(future)
-    for future in as_completed(futures):
-        try:
-            results.append(future.result())
-        except Exception as e:
-            logger.error(f"{future} generated an exception: {e}")
-            logger.error(traceback.format_exc())
-        else:
-            logger.info(f"Joining worker {future}")
+    with instrumentation.span(f"parallel.{getattr(func, '__name__', 'func')}"):
+        with executor_type(max_workers=workers) as executor:
+            futures = set()
+            for i in range(workers):
+                kwargs['pbar_position'] = i
+                future = executor.submit(func, data[space[i]:space[i + 1]], *args, **kwargs)
+                logger.info(f"Starting worker {future}")
+                futures.add(future)
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"{future} generated an exception: {e}")
+                logger.error(traceback.format_exc())
+                raise
+            else:
+                logger.info(f"Joining worker {future}")
+    instrumentation.count('parallel.items', len(data))
     end_time = timer()
     logger.info(f"Runtime time: {end_time - start_time:.2f}s")
     return results
@@ -123,15 +161,19 @@ def calculate_stats(name):
             start_time = timeit.default_timer()
             result = func(*args, **kwargs)
             elapsed_time = timeit.default_timer() - start_time
-            logger.info(f"{name} took {elapsed_time:.2f} seconds")
+            instrumentation.observe(name, elapsed_time)
 
             total_words_new = len(document.terms)
-            new_words_ratio = 1 - (total_words_new / total_words)
-            new_words_percentage = round(new_words_ratio * 100, 2)
-
-            logger.info(f"Total words before: {total_words}")
-            logger.info(f"Total words after: {total_words_new}")
-            logger.info(f"Removed {new_words_percentage}% of words from documents.")
+            if instrumentation.registry.enabled:
+                instrumentation.count(f"{name}.words_before", total_words)
+                instrumentation.count(f"{name}.words_after", total_words_new)
+            if logger.isEnabledFor(logging.DEBUG):
+                new_words_ratio = 1 - (total_words_new / total_words)
+                new_words_percentage = round(new_words_ratio * 100, 2)
+                logger.debug(f"{name} took {elapsed_time:.2f} seconds")
+                logger.debug(f"Total words before: {total_words}")
+                logger.debug(f"Total words after: {total_words_new}")
+                logger.debug(f"Removed {new_words_percentage}% of words from documents.")
 
             return result
 
@@ -162,27 +204,50 @@ def dot_product(query: 'wiki_parser.WikiPage', doc: 'wiki_parser.WikiPage') -> f
 
 
 def increase_weights(score_map, query):
+    # formatting per term and document is expensive, only do it when debugging
+    debug = logger.isEnabledFor(logging.DEBUG)
     for doc, cos_sim_val in score_map.items():
         for term in query.terms:
             term = stem(term)
             if term in " ".join(stem(x) for x in doc.title.split()):
                 score_map[doc] += 0.3
-                logger.info(f"Found term {term} in title {doc.title}. Increasing by 0.3")
+                if debug:
+                    logger.debug(f"Found term {term} in title {doc.title}. Increasing by 0.3")
             if doc.infobox:
                 if any(term in [stem(y) for y in x.split()] for x in doc.infobox.properties.keys()):
-                    logger.info(f"Found term {term} in {doc.title} infobox keys. Increasing by 0.1")
+                    if debug:
+                        logger.debug(f"Found term {term} in {doc.title} infobox keys. Increasing by 0.1")
                     score_map[doc] += 0.1
                 if any(term in [stem(y) for y in x.split()] for x in doc.infobox.properties.values()):
-                    logger.info(f"Found term {term} in {doc.title} infobox values. Increasing by 0.15")
+                    if debug:
+                        logger.debug(f"Found term {term} in {doc.title} infobox values. Increasing by 0.15")
                     score_map[doc] += 0.15
     return score_map
 
 
-def create_query_doc_vector(doc: 'wiki_parser.WikiPage', query: 'wiki_parser.WikiPage') -> np.array:
-    query_vec = np.zeros(len(doc.terms))
-    for token_id, token in enumerate(query.terms):
+def proximity_boost(term_positions: list[list[int]], weight=PROXIMITY_WEIGHT) -> float:
+    """
+    Boost for query terms occurring close to each other, `term_positions` are positions of the query terms
+    in query order. Every pair of neighbouring query terms adds weight / distance, averaged over the pairs.
+    """
+    if len(term_positions) < 2:
+        return 0.0
+    boost = 0.0
+    for first, second in zip(term_positions, term_positions[1:]):
+        if first and second:
+            boost += weight / max(postings.min_distance(first, second), 1)
+    return boost / (len(term_positions) - 1)
+
+
+def create_query_doc_vector(doc: 'wiki_parser.WikiPage', query: 'wiki_parser.WikiPage') -> 'np.array':
+    import numpy as np
+
+    # term ids of the document are aligned with its vector
+    doc_terms = doc.term_ids
+    query_vec = np.zeros(len(doc_terms))
+    for token in query.term_ids:
         try:
-            doc_token_id = doc.terms.index(token)
+            doc_token_id = doc_terms.index(token)
             query_vec[doc_token_id] = doc.vector[doc_token_id]
         except ValueError:
             pass
@@ -191,6 +256,8 @@ def create_query_doc_vector(doc: 'wiki_parser.WikiPage', query: 'wiki_parser.Wik
 
 def new_cosine_sim(query: 'wiki_parser.WikiPage',
                    relevant_docs: list['wiki_parser.WikiPage']) -> list[tuple['wiki_parser.WikiPage', float]]:
+    import numpy as np
+
     score_map = {}
     for doc in relevant_docs:
         doc_vector = np.array(doc.vector)
@@ -201,7 +268,11 @@ def new_cosine_sim(query: 'wiki_parser.WikiPage',
     return score_map
 
 
-def format_results(results: list[tuple['wiki_parser.WikiPage', float]]):
+def format_results(results: list[tuple['wiki_parser.WikiPage', float]], store=None):
+    """
+    Lists the results and shows infoboxes of the selected ones. Infoboxes are read from the document `store`,
+    if given, only for the selected documents. Indexes built with the store keep only the infobox name.
+    """
     results = results[::-1]
     for idx, result in enumerate(results):
         document = result[0]
@@ -227,7 +298,29 @@ def format_results(results: list[tuple['wiki_parser.WikiPage', float]]):
             print('Invalid input.')
             continue
         result_to_show = results[len(results) - num_to_show][0]
+        if store is not None:
+            result_to_show = store.get(result_to_show.doc_id) or result_to_show
         if result_to_show.infobox:
             print('\n'.join("{}: {}".format(k, v) for k, v in result_to_show.infobox.properties.items()))
         else:
             print('Please select result which has category.')
+
+
+def read_lines(lines_path: str) -> list[str]:
+    with open(get_file_path(lines_path), encoding='utf-8') as lines_file:
+        return [line.strip() for line in lines_file if line.strip()]
+
+
+def write_results_jsonl(results_path: str, queries: list[str],
+                        results: list[list[tuple['wiki_parser.WikiPage', float]]]):
+    with open(results_path, 'w', encoding='utf-8') as results_file:
+        for query, query_results in zip(queries, results):
+            record = {
+                'query': query,
+                'results': [
+                    {'rank': rank, 'doc_id': document.doc_id, 'title': document.title, 'score': float(score)}
+                    for rank, (document, score) in enumerate(query_results, start=1)
+                ]
+            }
+            results_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    logger.info(f"Results for {len(queries)} queries written to {results_path}")
@@ -1,22 +1,105 @@
 import logging
 import math
-
-from tqdm import tqdm
+from array import array
+from collections import Counter
 
 import indexer
+import ranking
+import utils
 from wiki_parser import WikiPage
 
 logger = logging.getLogger(__name__)
 
 
+class TermStatistics:
+    def __init__(self, document_frequency=0, corpus_frequency=0):
+        self.document_frequency = document_frequency
+        self.corpus_frequency = corpus_frequency
+
+
+class GlobalStatistics:
+    """
+    Term statistics without postings. Used where documents are weighted outside of the inverted index which
+    holds them, e.g. shards or index build workers, so IDF is the same everywhere.
+    Implements the part of the InvertedIndex interface used by the vectorizer.
+    """
+
+    def __init__(self):
+        self.documents_count = 0
+        self.terms: dict[str, TermStatistics] = {}
+        self.total_lengths: dict[str, int] = dict.fromkeys(ranking.FIELDS, 0)
+
+    @classmethod
+    def from_index(cls, inverted_index: 'indexer.InvertedIndex') -> 'GlobalStatistics':
+        statistics = cls()
+        statistics.documents_count = inverted_index.documents_count
+        statistics.terms = {
+            term: TermStatistics(index_record.document_frequency, index_record.corpus_frequency)
+            for term, index_record in inverted_index.items()
+        }
+        statistics.total_lengths = dict(inverted_index.total_lengths)
+        return statistics
+
+    def add_documents(self, documents: list[WikiPage]):
+        for document in documents:
+            for term, frequency in Counter(document.terms).items():
+                if term not in self.terms:
+                    self.terms[term] = TermStatistics()
+                self.terms[term].document_frequency += 1
+                self.terms[term].corpus_frequency += frequency
+            self.total_lengths['body'] += len(document.terms)
+            for field, length in ranking.field_lengths(document).items():
+                self.total_lengths[field] += length
+        self.documents_count += len(documents)
+
+    def get(self, term: str) -> TermStatistics:
+        term_statistics = self.terms.get(term)
+        if not term_statistics:
+            raise AttributeError(f'Inverted index does not contain term {term}.')
+        return term_statistics
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.terms
+
+    def average_length(self, field: str) -> float:
+        return self.total_lengths[field] / self.documents_count if self.documents_count else 0.0
+
+
+def _vectorize_slice(items: list[tuple[int, list[str]]], statistics: GlobalStatistics,
+                     pbar_position=0) -> list[tuple[int, list[float]]]:
+    tfidf_vectorizer = TfIdfVectorizer(statistics)
+    return [(doc_id, tfidf_vectorizer.normalize_vector(tfidf_vectorizer.vectorize_terms(terms)))
+            for doc_id, terms in items]
+
+
 class TfIdfVectorizer:
     def __init__(self, inverted_index: 'indexer.InvertedIndex'):
         self.inverted_index = inverted_index
 
-    def vectorize_documents(self, documents: list[WikiPage]) -> list[WikiPage]:
+    def vectorize_documents(self, documents: list[WikiPage], workers=1) -> list[WikiPage]:
+        from tqdm import tqdm
+
         logger.info(f"Vectorizing {len(documents)} documents")
-        for document in tqdm(documents, desc="Vectorizing documents"):
-            document.vector = self.normalize_vector(self.vectorize_terms(document.terms))
+        if workers > 1 and len(documents) >= 100:
+            return self._vectorize_documents_parallel(documents, workers)
+        for document in tqdm(documents, desc="Vectorizing documents", disable=not utils.show_progress()):
+            document.vector = array('d', self.normalize_vector(self.vectorize_terms(document.terms)))
+            document.raw_text = None
+            document.terms = None
+        return documents
+
+    def _vectorize_documents_parallel(self, documents: list[WikiPage], workers: int) -> list[WikiPage]:
+        """
+        Only doc ids, terms and vectors travel between processes, workers weight terms with a copy
+        of the index statistics.
+        """
+        statistics = GlobalStatistics.from_index(self.inverted_index)
+        items = [(document.doc_id, document.terms) for document in documents]
+        results = utils.generic_parallel_execution(items, _vectorize_slice, statistics,
+                                                   workers=workers, executor='process')
+        vectors = {doc_id: vector for result in results for doc_id, vector in result}
+        for document in documents:
+            document.vector = array('d', vectors[document.doc_id])
             document.raw_text = None
             document.terms = None
         return documents
@@ -24,21 +107,18 @@ class TfIdfVectorizer:
     def vectorize_terms(self, document: list[str]) -> list[float]:
         if not document:
             return []
-        return [self._tfidf(term, document) for term in document]
-
-    def _tfidf(self, term: str, document: list[str]) -> float:
-        tf = self._tf(term, document)
-        idf = self._idf(term)
-        return tf * idf
+        term_counts = Counter(document)
+        weights = {term: self._tf(count, len(document)) * self._idf(term) for term, count in term_counts.items()}
+        return [weights[term] for term in document]
 
-    def _tf(self, term: str, document: list[str], sublinear_tf=True) -> float:
+    def _tf(self, term_count: int, document_length: int, sublinear_tf=True) -> float:
         """
         Term frequency, tf(t,d), is the relative frequency of term t within document d.
         """
         if sublinear_tf:  # log normalization
-            return 1 + math.log10(document.count(term))  # 1 + log(f_{f_d})
+            return 1 + math.log10(term_count)  # 1 + log(f_{f_d})
 
-        return document.count(term) / len(document)  # -> f_{t,d} / sum_{t' in d} f_{t',d}
+        return term_count / document_length  # -> f_{t,d} / sum_{t' in d} f_{t',d}
 
     def _idf(self, term: str, smooth_idf=True) -> float:
         """
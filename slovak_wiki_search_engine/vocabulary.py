@@ -0,0 +1,205 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, Optional
+
+from postings import read_varint, write_varint
+
+# terms per front-coded block, lookup decodes at most one block
+BLOCK_SIZE = 16
+
+
+def _common_prefix_length(first: bytes, second: bytes) -> int:
+    length = min(len(first), len(second))
+    for idx in range(length):
+        if first[idx] != second[idx]:
+            return idx
+    return length
+
+
+class Vocabulary:
+    """
+    Maps terms to dense int ids. Terms are kept sorted in front-coded blocks: the first term of a block is stored
+    whole, every other term as the length of the prefix shared with the previous term and the remaining suffix.
+    Lookup bisects the block heads and decodes one block.
+
+    Ids never change. Terms added after the store was built are kept in a small dict until `compact`
+    rebuilds the store.
+    """
+
+    def __init__(self, terms: Iterable[str] = ()):
+        self._data = b''
+        self._block_offsets = array('I')
+        self._heads: list[str] = []
+        # id of the term at each sorted position and sorted position of each id
+        self._ids = array('I')
+        self._positions = array('I')
+        self._added: dict[str, int] = {}
+        self._added_terms: list[str] = []
+        for term in sorted(set(terms)):
+            self.add(term)
+        self.compact()
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._added)
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def __iter__(self) -> Iterator[tuple[str, int]]:
+        """
+        Yields (term, id) pairs, stored terms in sorted order followed by terms added since the last compaction.
+        """
+        for block in range(len(self._block_offsets)):
+            start = block * BLOCK_SIZE
+            for offset, term in enumerate(self._decode_block(block)):
+                yield term, self._ids[start + offset]
+        yield from self._added.items()
+
+    def _decode_block(self, block: int) -> list[str]:
+        data = self._data
+        offset = self._block_offsets[block]
+        end = self._block_offsets[block + 1] if block + 1 < len(self._block_offsets) else len(data)
+        terms = []
+        previous = b''
+        while offset < end:
+            prefix_length, offset = read_varint(data, offset)
+            suffix_length, offset = read_varint(data, offset)
+            previous = previous[:prefix_length] + data[offset:offset + suffix_length]
+            offset += suffix_length
+            terms.append(previous.decode('utf-8'))
+        return terms
+
+    def _find(self, term: str) -> Optional[int]:
+        """
+        Sorted position of a stored term.
+        """
+        block = bisect_right(self._heads, term) - 1
+        if block < 0:
+            return None
+        for offset, block_term in enumerate(self._decode_block(block)):
+            if block_term == term:
+                return block * BLOCK_SIZE + offset
+            if block_term > term:
+                return None
+        return None
+
+    @property
+    def stored_count(self) -> int:
+        return len(self._ids)
+
+    def bisect(self, term: str) -> int:
+        """
+        Sorted position of the first stored term which is not smaller than `term`.
+        """
+        block = bisect_right(self._heads, term) - 1
+        if block < 0:
+            return 0
+        for offset, block_term in enumerate(self._decode_block(block)):
+            if block_term >= term:
+                return block * BLOCK_SIZE + offset
+        return min((block + 1) * BLOCK_SIZE, len(self._ids))
+
+    def stored_terms(self, start=0) -> Iterator[tuple[int, str]]:
+        """
+        Yields (sorted position, term) of stored terms from `start` on, decoding one block at a time.
+        """
+        for block in range(start // BLOCK_SIZE, len(self._block_offsets)):
+            block_start = block * BLOCK_SIZE
+            for offset, term in enumerate(self._decode_block(block)):
+                if block_start + offset >= start:
+                    yield block_start + offset, term
+
+    def next_block_head(self, position: int) -> Optional[str]:
+        """
+        First term of the block after the one holding `position`.
+        """
+        block = position // BLOCK_SIZE + 1
+        return self._heads[block] if block < len(self._heads) else None
+
+    def added_terms(self) -> list[str]:
+        """
+        Terms added since the last compaction, they are not part of the sorted store yet.
+        """
+        return list(self._added_terms)
+
+    def prefix(self, prefix: str) -> Iterator[tuple[str, int]]:
+        """
+        Yields (term, id) of all terms starting with `prefix`.
+        """
+        for position, term in self.stored_terms(self.bisect(prefix)):
+            if not term.startswith(prefix):
+                break
+            yield term, self._ids[position]
+        for term in self._added_terms:
+            if term.startswith(prefix):
+                yield term, self._added[term]
+
+    def get(self, term: str) -> Optional[int]:
+        term_id = self._added.get(term)
+        if term_id is not None:
+            return term_id
+        position = self._find(term)
+        return self._ids[position] if position is not None else None
+
+    def add(self, term: str) -> int:
+        term_id = self.get(term)
+        if term_id is None:
+            term_id = len(self)
+            self._added[term] = term_id
+            self._added_terms.append(term)
+        return term_id
+
+    def term(self, term_id: int) -> str:
+        # ids are dense, added terms follow the stored ones
+        if term_id >= len(self._ids):
+            return self._added_terms[term_id - len(self._ids)]
+        position = self._positions[term_id]
+        return self._decode_block(position // BLOCK_SIZE)[position % BLOCK_SIZE]
+
+    def terms(self, term_ids: Iterable[int]) -> list[str]:
+        return [self.term(term_id) for term_id in term_ids]
+
+    def compact(self):
+        """
+        Rebuilds the front-coded store with the added terms.
+        """
+        if not self._added:
+            return
+        entries = sorted(self)
+        data = bytearray()
+        block_offsets = array('I')
+        heads = []
+        ids = array('I')
+        previous = b''
+        for position, (term, term_id) in enumerate(entries):
+            encoded = term.encode('utf-8')
+            if position % BLOCK_SIZE == 0:
+                block_offsets.append(len(data))
+                heads.append(term)
+                prefix_length = 0
+            else:
+                prefix_length = _common_prefix_length(previous, encoded)
+            write_varint(data, prefix_length)
+            write_varint(data, len(encoded) - prefix_length)
+            data += encoded[prefix_length:]
+            ids.append(term_id)
+            previous = encoded
+
+        positions = array('I', [0]) * len(entries)
+        for position, term_id in enumerate(ids):
+            positions[term_id] = position
+        self._data = bytes(data)
+        self._block_offsets = block_offsets
+        self._heads = heads
+        self._ids = ids
+        self._positions = positions
+        self._added = {}
+        self._added_terms = []
+
+    def memory_size(self) -> int:
+        """
+        Approximate size of the store in bytes, without the terms added since the last compaction.
+        """
+        return (len(self._data) + self._block_offsets.itemsize * len(self._block_offsets) +
+                sum(len(head) for head in self._heads) +
+                self._ids.itemsize * len(self._ids) + self._positions.itemsize * len(self._positions))
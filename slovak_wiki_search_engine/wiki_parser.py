@@ -2,12 +2,12 @@ import itertools
 import logging
 import random
 import re
+from array import array
 from collections import defaultdict
 from timeit import default_timer as timer
 from typing import Optional, Union, Any
 
-from tqdm import tqdm
-
+import instrumentation
 import utils
 
 logger = logging.getLogger(__name__)
@@ -33,6 +33,8 @@ class WikiPage:
         self.infobox = infobox
         self.infobox_title = infobox.name if infobox else None
         self.terms: list[str] = []
+        # terms as vocabulary ids, set when the document is indexed
+        self.term_ids: Optional[array] = None
         self.vector: list[float] = []
 
     def __str__(self):
@@ -105,9 +107,12 @@ class WikiParser:
         return ''
 
     def parse_pages(self, pages: tuple[str, int], pbar_position=0):
+        from tqdm import tqdm
+
         parsed_pages = []
         infobox_types = defaultdict(list)
-        for page, idx in tqdm(pages, desc=f"{pbar_position}", position=pbar_position):
+        for page, idx in tqdm(pages, desc=f"{pbar_position}", position=pbar_position,
+                              disable=not utils.show_progress()):
             title = self._parse_attr(page, self.TITLE_PATTERN)
             if any(title.startswith(disallowed_page) for disallowed_page in self.DISALLOWED_PAGES):
                 continue
@@ -131,9 +136,12 @@ class WikiParser:
     def get_pages(self, wikipedia_data_path: str) -> list[tuple[str, int]]:
         logger.info(f'Parsing pages from {wikipedia_data_path}')
         read_time = timer()
-        with open(wikipedia_data_path, 'r', encoding='UTF-8') as wikipedia_data_file:
-            wiki_data = wikipedia_data_file.read()
-        pages = self.PAGE_PATTERN.findall(wiki_data)
+        with instrumentation.span('parse.read_dump'):
+            with open(wikipedia_data_path, 'r', encoding='UTF-8') as wikipedia_data_file:
+                wiki_data = wikipedia_data_file.read()
+        with instrumentation.span('parse.split_pages'):
+            pages = self.PAGE_PATTERN.findall(wiki_data)
+        instrumentation.count('parse.pages', len(pages))
         logger.info(f'Read {len(pages)} pages in {timer() - read_time:.2f}s')
         return [(page, idx) for idx, page in enumerate(pages)]
 
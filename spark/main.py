@@ -1,9 +1,81 @@
 import sys
+from timeit import default_timer as timer
+from pyspark import AccumulatorParam, StorageLevel
 from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+from pyspark.sql.types import ArrayType, StringType, StructField, StructType
 from src.wiki_parser import WikiParser
 import src.text_preprocessor as text_preprocessor
+import src.index_builder as index_builder
 import json
 
+OUTPUT_SCHEMA = StructType([
+    StructField("title", StringType(), False),
+    StructField("raw_text", StringType(), True),
+    StructField("infobox", StringType(), True),
+    StructField("terms", ArrayType(StringType()), False),
+])
+
+
+def to_row(page):
+    return (page.title, page.raw_text, page.infobox.to_string() if page.infobox else None, page.terms or [])
+
+
+class ListAccumulatorParam(AccumulatorParam):
+    def zero(self, value):
+        return []
+
+    def addInPlace(self, value1, value2):
+        value1.extend(value2)
+        return value1
+
+
+def preprocess_partition(parser, batch_size, partition_stats):
+    """
+    Partition function. The preprocessor is loaded once per python worker and reused by its later partitions,
+    pages are lemmatized in batches and rows are yielded one by one, so the partition is never held in memory.
+    """
+
+    def process(index, rows):
+        start = timer()
+        model_loaded = not text_preprocessor.is_loaded()
+        processor = text_preprocessor.get_text_processor()
+        startup_time = timer() - start
+        pages = (parser.parse_page(row) for row in rows)
+        pages = (page for page in pages if page is not None and page.raw_text is not None)
+        documents = 0
+        for page in processor.preprocess_iterator(pages, batch_size):
+            documents += 1
+            yield to_row(page)
+        run_time = timer() - start
+        stats = {
+            "partition": index,
+            "documents": documents,
+            "model_loaded": model_loaded,
+            "startup_time": startup_time,
+            "run_time": run_time,
+            "docs_per_sec": documents / (run_time - startup_time) if run_time > startup_time else 0.0,
+        }
+        print("Partition stats:", json.dumps(stats))
+        partition_stats.add([stats])
+
+    return process
+
+
+def print_partition_stats(partition_stats):
+    # a partition recomputed by a later action reports again, only its last run is kept
+    stats = {partition["partition"]: partition for partition in partition_stats}
+    if not stats:
+        return
+    for partition in sorted(stats.values(), key=lambda x: x["partition"]):
+        print(f"Partition {partition['partition']}: {partition['documents']} docs, "
+              f"startup {partition['startup_time']:.2f}s, {partition['docs_per_sec']:.2f} docs/sec")
+    documents = sum(partition["documents"] for partition in stats.values())
+    loads = [partition["startup_time"] for partition in stats.values() if partition["model_loaded"]]
+    print(f"Preprocessed documents: {documents} in {len(stats)} partitions, "
+          f"model loads: {len(loads)}, total startup time: {sum(loads):.2f}s")
+
+
 if __name__ == '__main__':
     with open('conf.json', 'r') as conf_file:
         conf = json.load(conf_file)
@@ -27,27 +99,51 @@ if __name__ == '__main__':
 
     rdd = df.rdd.repartition(conf['partitions'])
 
-    data = (
-        rdd
-        .map(parser.parse_page)
-        .filter(lambda x: x is not None and x.raw_text is not None)
-        .map(lambda x: text_preprocessor.text_processor.preprocess(x))
-    )
-
-    split = [
-        (x.title, x.raw_text, x.infobox.to_string() if x.infobox else None, " ".join(x.terms) if x.terms else "")
-        for x in data.collect()
-    ]
-    df = spark.createDataFrame(split, ["title", "raw_text", "infobox", "terms"])
-
-    df.write \
-        .option("header", "true") \
-        .format("com.databricks.spark.csv") \
-        .option('quote', '"') \
-        .option('escape', '"') \
-        .option('multiLine', True) \
-        .option("delimiter", ",") \
-        .mode("overwrite") \
-        .save(output_path + "/data")
+    partition_stats = spark.sparkContext.accumulator([], ListAccumulatorParam())
+    batch_size = conf.get('batch_size', text_preprocessor.DEFAULT_BATCH_SIZE)
+    data = rdd.mapPartitionsWithIndex(preprocess_partition(parser, batch_size, partition_stats))
+
+    # rows stay on the executors, a stable hash of the title decides the output part
+    output_parts = conf.get('output_parts', conf['partitions'])
+    df = spark.createDataFrame(data, OUTPUT_SCHEMA) \
+        .withColumn("part", F.pmod(F.hash("title"), F.lit(output_parts)))
+    index_conf = dict(index_builder.DEFAULT_INDEX_CONF, **conf.get('index', {}))
+    if conf.get('write_title_mapping', False) or index_conf['enabled']:
+        # the mapping and the index are written by further actions, pages are not parsed and lemmatized twice
+        df = df.persist(StorageLevel.MEMORY_AND_DISK)
+
+    if conf.get('output_format', 'parquet') == 'csv':
+        # part*.csv files with space separated terms, as read by the PyLucene indexer
+        df.repartition("part") \
+            .drop("part") \
+            .withColumn("terms", F.concat_ws(" ", "terms")) \
+            .write \
+            .option("header", "true") \
+            .format("com.databricks.spark.csv") \
+            .option('quote', '"') \
+            .option('escape', '"') \
+            .option('multiLine', True) \
+            .option("delimiter", ",") \
+            .mode("overwrite") \
+            .save(output_path + "/data")
+    else:
+        df.repartition("part") \
+            .write \
+            .partitionBy("part") \
+            .mode("overwrite") \
+            .parquet(output_path + "/data")
+
+    if conf.get('write_title_mapping', False):
+        df.select("title", "part") \
+            .write \
+            .mode("overwrite") \
+            .parquet(output_path + "/title_mapping")
+
+    if index_conf['enabled']:
+        start = timer()
+        collection = index_builder.build_index(spark, df, output_path + "/index", index_conf)
+        print(f"Index of {collection['documents_count']} documents in {collection['shards']} shards "
+              f"built in {timer() - start:.2f}s")
 
+    print_partition_stats(partition_stats.value)
     spark.stop()
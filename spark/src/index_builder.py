@@ -0,0 +1,122 @@
+import json
+import math
+from operator import add
+
+from pyspark.sql.types import ArrayType, DoubleType, IntegerType, LongType, StringType, StructField, StructType
+
+from src.index_functions import (collection_record, document_postings, document_row, norm_component,
+                                 normalize_posting, weight_posting)
+
+DEFAULT_INDEX_CONF = {
+    "enabled": False,
+    "shards": 4,
+    "positional": True,
+    "vectorized": True,
+}
+
+DOCUMENTS_SCHEMA = StructType([
+    StructField("shard", IntegerType(), False),
+    StructField("doc_id", LongType(), False),
+    StructField("title", StringType(), True),
+    StructField("infobox_name", StringType(), True),
+    StructField("infobox", StringType(), True),
+    StructField("length", IntegerType(), False),
+    StructField("title_length", IntegerType(), False),
+    StructField("infobox_length", IntegerType(), False),
+])
+
+POSTINGS_SCHEMA = StructType([
+    StructField("shard", IntegerType(), False),
+    StructField("term", StringType(), False),
+    StructField("postings", ArrayType(StructType([
+        StructField("doc_id", LongType(), False),
+        StructField("tf", IntegerType(), False),
+        StructField("weight", DoubleType(), True),
+        StructField("positions", ArrayType(IntegerType()), True),
+    ])), False),
+])
+
+STATISTICS_SCHEMA = StructType([
+    StructField("term", StringType(), False),
+    StructField("df", LongType(), False),
+    StructField("cf", LongType(), False),
+])
+
+
+def build_index(spark, df, output_path, index_conf):
+    """
+    Builds the inverted index of the preprocessed pages with distributed aggregations and writes it
+    as JSON lines partitioned by shard, `skwiki_search.py` converts it to the shards of the search engine.
+    Doc ids are dense, a document belongs to the shard doc_id % shards.
+
+    - documents: doc_id, title, infobox, length of the terms, title and infobox
+    - postings: per shard and term the sorted postings with term frequencies, normalized tf-idf weights
+      and positions
+    - statistics: document and corpus frequency of every term in the whole collection
+    - collection: documents count and total field lengths
+    """
+    index_conf = dict(DEFAULT_INDEX_CONF, **index_conf)
+    shards = index_conf["shards"]
+    positional = index_conf["positional"]
+    vectorized = index_conf["vectorized"]
+
+    documents = df.select("title", "infobox", "terms").rdd \
+        .zipWithIndex() \
+        .map(lambda x: (x[1], x[0].title, x[0].infobox, x[0].terms or []))
+    documents.cache()
+    documents_count = documents.count()
+
+    document_rows = documents.map(lambda x: document_row(x[0], x[1], x[2], x[3], shards))
+    document_rows.cache()
+    spark.createDataFrame(document_rows, DOCUMENTS_SCHEMA) \
+        .write \
+        .partitionBy("shard") \
+        .mode("overwrite") \
+        .json(output_path + "/documents")
+
+    # term -> (doc_id, tf, positions)
+    postings = documents.flatMap(lambda x: document_postings(x[0], x[3], positional))
+    postings.cache()
+    # term -> (df, cf)
+    statistics = postings.mapValues(lambda posting: (1, posting[1])) \
+        .reduceByKey(lambda x, y: (x[0] + y[0], x[1] + y[1]))
+    statistics.cache()
+    spark.createDataFrame(statistics.map(lambda x: (x[0], x[1][0], x[1][1])), STATISTICS_SCHEMA) \
+        .write \
+        .mode("overwrite") \
+        .json(output_path + "/statistics")
+
+    if vectorized:
+        # doc_id -> (term, tf, weight, positions), weights are normalized by the norm of the document vector,
+        # every occurrence of a term is one component of the vector
+        weighted = postings.join(statistics) \
+            .map(lambda x: weight_posting(x[0], x[1][0], x[1][1], documents_count))
+        norms = weighted.mapValues(norm_component) \
+            .reduceByKey(add) \
+            .mapValues(math.sqrt)
+        weighted = weighted.join(norms).map(lambda x: normalize_posting(x[0], x[1][0], x[1][1]))
+    else:
+        weighted = postings.mapValues(lambda posting: (posting[0], posting[1], None, posting[2]))
+
+    shard_postings = weighted.map(lambda x: ((x[1][0] % shards, x[0]), x[1])) \
+        .groupByKey() \
+        .map(lambda x: (x[0][0], x[0][1], sorted(x[1])))
+    spark.createDataFrame(shard_postings, POSTINGS_SCHEMA) \
+        .write \
+        .partitionBy("shard") \
+        .mode("overwrite") \
+        .json(output_path + "/postings")
+
+    lengths = document_rows.map(lambda row: row[5:]) \
+        .fold((0, 0, 0), lambda x, y: (x[0] + y[0], x[1] + y[1], x[2] + y[2]))
+    collection = collection_record(documents_count, shards, positional, vectorized, lengths)
+    # one line of text, written by the DataFrame writer to be overwritten like the other outputs
+    spark.createDataFrame([(json.dumps(collection),)], ["value"]) \
+        .coalesce(1) \
+        .write \
+        .mode("overwrite") \
+        .text(output_path + "/collection")
+
+    for rdd in (documents, document_rows, postings, statistics):
+        rdd.unpersist()
+    return collection
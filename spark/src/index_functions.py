@@ -0,0 +1,79 @@
+"""
+Row level functions of the Spark index builder. They do not depend on Spark, so they can be tested
+without it and are shared with the tests of the search engine which import the index.
+"""
+import json
+import math
+import re
+from ast import literal_eval
+from collections import Counter
+
+# the same words as ranking.field_words of the search engine, title and infobox are not part of the terms
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_infobox(infobox_string):
+    """
+    Name and properties of an infobox written by Infobox.to_string.
+    """
+    if not infobox_string:
+        return None, None
+    name, _, properties = infobox_string.partition("\t")
+    return name, literal_eval(properties)
+
+
+def document_row(doc_id, title, infobox_string, terms, shards):
+    infobox_name, properties = parse_infobox(infobox_string)
+    infobox_text = " ".join("{} {}".format(key, value) for key, value in (properties or {}).items())
+    return (doc_id % shards, doc_id, title, infobox_name,
+            json.dumps(properties, ensure_ascii=False) if properties is not None else None,
+            len(terms), len(WORD_PATTERN.findall(title or "")), len(WORD_PATTERN.findall(infobox_text)))
+
+
+def document_postings(doc_id, terms, positional):
+    """
+    (term, (doc_id, term frequency, positions)) of every distinct term of the document.
+    """
+    if not positional:
+        return [(term, (doc_id, count, None)) for term, count in Counter(terms).items()]
+    positions = {}
+    for position, term in enumerate(terms):
+        positions.setdefault(term, []).append(position)
+    return [(term, (doc_id, len(term_positions), term_positions)) for term, term_positions in positions.items()]
+
+
+def tfidf_weight(term_frequency, document_frequency, documents_count):
+    # sublinear tf and smooth idf, as TfIdfVectorizer of the search engine weights terms
+    return (1 + math.log10(term_frequency)) * (math.log10((1 + documents_count) / (1 + document_frequency)) + 1)
+
+
+def weight_posting(term, posting, term_statistics, documents_count):
+    doc_id, term_frequency, positions = posting
+    return doc_id, (term, term_frequency, tfidf_weight(term_frequency, term_statistics[0], documents_count), positions)
+
+
+def norm_component(posting):
+    """
+    Squared length of the components of one term in the document vector, every occurrence of the term
+    is a component with the weight of the term.
+    """
+    _, term_frequency, weight, _ = posting
+    return term_frequency * weight ** 2
+
+
+def normalize_posting(doc_id, posting, norm):
+    term, term_frequency, weight, positions = posting
+    return term, (doc_id, term_frequency, weight / norm, positions)
+
+
+def collection_record(documents_count, shards, positional, vectorized, lengths):
+    """
+    The collection file of the index, `lengths` are the summed lengths of the terms, titles and infoboxes.
+    """
+    return {
+        "documents_count": documents_count,
+        "shards": shards,
+        "positional": positional,
+        "vectorized": vectorized,
+        "total_lengths": {"body": lengths[0], "title": lengths[1], "infobox": lengths[2]},
+    }
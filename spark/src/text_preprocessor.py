@@ -1,6 +1,7 @@
 import json
 import re
 from abc import ABC
+from itertools import islice
 
 import spacy_udpipe
 import unicodedata
@@ -8,12 +9,17 @@ import unicodedata
 DEFAULT_NORMALIZATION_METHOD = "NFKC"
 DEFAULT_ALLOWED_POSTAGS = ["NOUN", "ADJ", "VERB", "ADV"]
 REMOVE_ACCENTS = False
+DEFAULT_BATCH_SIZE = 64
 
 
 class PreprocessorComponent(ABC):
     def process(self, document):
         raise NotImplementedError
 
+    def process_batch(self, documents):
+        for document in documents:
+            self.process(document)
+
 
 class Normalizer(PreprocessorComponent):
     def __init__(self):
@@ -76,6 +82,15 @@ class Lemmatizer(PreprocessorComponent):
             if token.pos_ in self.allowed_postags and len(token.lemma_) > 1
         ]
 
+    def process_batch(self, documents):
+        texts = (" ".join(document.terms) for document in documents)
+        for document, doc in zip(documents, self.lemmatizer.pipe(texts)):
+            document.terms = [
+                token.lemma_
+                for token in doc
+                if token.pos_ in self.allowed_postags and len(token.lemma_) > 1
+            ]
+
 
 class TextPreprocessor:
     def __init__(self, preprocessor_components, stopwords):
@@ -105,6 +120,26 @@ class TextPreprocessor:
             component.process(document)
         return document
 
+    def preprocess_batch(self, documents):
+        """
+        Runs each component over the whole batch, the lemmatizer processes it in one pipe.
+        """
+        for name, component in self.components.items():
+            component.process_batch(documents)
+        return documents
+
+    def preprocess_iterator(self, documents, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Preprocesses documents of a partition in batches, yielding them as they are done.
+        """
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                return
+            for document in self.preprocess_batch(batch):
+                yield document
+
 
 def load():
     with open('conf.json', 'r') as conf_file:
@@ -114,4 +149,16 @@ def load():
     return TextPreprocessor(conf.get("preprocessor_components"), stop_words_list)
 
 
-text_processor = load()
+# preprocessor of the current python worker, created by the first partition it processes
+_text_processor = None
+
+
+def is_loaded():
+    return _text_processor is not None
+
+
+def get_text_processor():
+    global _text_processor
+    if _text_processor is None:
+        _text_processor = load()
+    return _text_processor
@@ -19,3 +19,67 @@ DEFAULT_TEST_CONF = {
     "workers": 6,
     "verbose": True
 }
+
+
+def build_toy_index(tmp_dir):
+    """
+    Small in-memory corpus for tests which do not need the wikipedia dump or the lemmatizer.
+    """
+    import pandas as pd
+
+    from indexer import InvertedIndex
+    from text_preprocessor import TextPreprocessor
+    from vectorizer import TfIdfVectorizer
+    from wiki_parser import WikiPage
+
+    conf = dict(DEFAULT_TEST_CONF)
+    conf['preprocessor_components'] = ['normalize', 'tokenize', 'remove_stopwords']
+    conf['already_processed_path'] = os.path.join(tmp_dir, 'already_parsed.csv')
+    conf['inverted_index_path'] = os.path.join(tmp_dir, 'inverted_index.pickle')
+    texts = {
+        'Rusko': 'Rusko je federácia, prezident Ruskej federácie je Putin.',
+        'Vladimir Putin': 'Vladimir Putin je prezident Ruska a bývalý agent.',
+        'Slovensko': 'Slovensko je republika, prezident Slovenskej republiky sídli v Bratislave.',
+        'Bratislava': 'Bratislava je hlavné mesto Slovenska a sídlo kraja.',
+        'Dunaj': 'Dunaj je rieka, ktorá tečie cez Bratislavu a Viedeň.',
+    }
+    documents = [WikiPage(doc_id, title, text) for doc_id, (title, text) in enumerate(texts.items())]
+    text_preprocessor = TextPreprocessor(conf['preprocessor_components'], conf, load_docs=False)
+    documents = text_preprocessor.preprocess(documents, workers=1)
+    pd.DataFrame([[doc.doc_id, doc.title, doc.terms] for doc in documents],
+                 columns=['doc_id', 'title', 'terms']).to_csv(conf['already_processed_path'], index=False)
+
+    inverted_index = InvertedIndex(positional=True)
+    inverted_index._create_index(documents)
+    TfIdfVectorizer(inverted_index).vectorize_documents(documents)
+    return inverted_index, conf
+
+
+TOY_DUMP_PAGES = {
+    'Rusko': 'Rusko je federácia, prezident Ruskej federácie je Putin. Moskva je hlavné mesto Ruska.',
+    'Vladimir Putin': 'Vladimir Putin je prezident Ruska a bývalý agent.',
+    'Slovensko': 'Slovensko je republika, prezident Slovenskej republiky sídli v Bratislave.',
+    'Bratislava': 'Bratislava je hlavné mesto Slovenska a sídlo kraja.',
+    'Dunaj': 'Dunaj je rieka, ktorá tečie cez Bratislavu a Viedeň.',
+    'Viedeň': 'Viedeň je hlavné mesto Rakúska na rieke Dunaj.',
+    'Moskva': 'Moskva je hlavné mesto Ruskej federácie, sídli tu prezident.',
+    'Wikipédia:Pomoc': 'Pomocná stránka.',
+}
+
+
+def write_toy_dump(tmp_dir, pages=None):
+    """
+    Writes `pages` (TOY_DUMP_PAGES by default) as a wikipedia dump and returns a configuration
+    which indexes it without the lemmatizer.
+    """
+    dump_path = os.path.join(tmp_dir, 'dump.xml')
+    with open(dump_path, 'w', encoding='utf-8') as dump_file:
+        for title, text in (pages or TOY_DUMP_PAGES).items():
+            dump_file.write(f'<page><title>{title}</title><text>{text}</text></page>\n')
+    conf = dict(DEFAULT_TEST_CONF)
+    conf['preprocessor_components'] = ['normalize', 'tokenize', 'remove_stopwords', 'document_saver']
+    conf['positional_postings'] = True
+    conf['sk_wikipedia_dump_path'] = dump_path
+    conf['already_processed_path'] = os.path.join(tmp_dir, 'already_parsed.csv')
+    conf['inverted_index_path'] = os.path.join(tmp_dir, 'inverted_index.pickle')
+    return conf
@@ -18,6 +18,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.OR,
             'results_count': 5,
             'relevant_documents_count': 250,
+            'phrases': [],
         }
 
         self.assertEqual(arg_parser_mock(input_params), expected_params)
@@ -29,6 +30,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -39,6 +41,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.OR,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -49,6 +52,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 15,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -59,6 +63,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 10,
             'relevant_documents_count': 250,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -69,6 +74,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -79,6 +85,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.OR,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -89,6 +96,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -99,6 +107,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -111,6 +120,7 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.OR,
             'results_count': 15,
             'relevant_documents_count': 1000,
+            'phrases': [],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
 
@@ -121,5 +131,17 @@ class ArgParseTester(unittest.TestCase):
             'boolean_operator': QueryBooleanOperator.AND,
             'results_count': 10,
             'relevant_documents_count': 1000,
+            'phrases': [],
+        }
+        self.assertEqual(arg_parser_mock(input_params), expected_params)
+
+    def test_query_with_phrases(self):
+        input_params = [None, '"Vladimir Putin" prezident "Ruskej federácie"~2', '-o']
+        expected_params = {
+            'query': '"Vladimir Putin" prezident "Ruskej federácie"~2',
+            'boolean_operator': QueryBooleanOperator.OR,
+            'results_count': 10,
+            'relevant_documents_count': 1000,
+            'phrases': [('Vladimir Putin', 0), ('Ruskej federácie', 2)],
         }
         self.assertEqual(arg_parser_mock(input_params), expected_params)
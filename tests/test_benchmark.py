@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, benchmark, SearchEngine
+from indexer import IndexRecord
+from tests import DEFAULT_TEST_CONF, build_toy_index
+
+utils.setup_logging(verbose=False)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_search_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inverted_index, conf = build_toy_index(tmp_dir)
+            search_engine = SearchEngine(inverted_index, conf)
+            queries = [
+                {'name': 'and', 'query': 'prezident federácie', 'boolean_operator': 'AND'},
+                {'name': 'or', 'query': 'rieka mesto', 'boolean_operator': 'OR'},
+            ]
+            report = benchmark.run_search_benchmark(search_engine, queries, repeat=2, warmup=0)
+
+        self.assertEqual(report['runs'], 4)
+        self.assertEqual(set(report['per_query_p50_ms']), {'and', 'or'})
+        self.assertLessEqual(report['latency']['p50_ms'], report['latency']['p99_ms'])
+        self.assertGreater(report['throughput_qps'], 0)
+
+    def test_indexing_benchmark(self):
+        pages = [
+            ('<title>Rusko</title><text>Rusko je federácia, prezident je Putin.</text>', 0),
+            ('<title>Dunaj</title><text>Dunaj je rieka, tečie cez Bratislavu.</text>', 1),
+            ('<title>Wikipédia:Pomoc</title><text>Pomoc</text>', 2),
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dump_path = os.path.join(tmp_dir, 'dump.xml')
+            with open(dump_path, 'w', encoding='utf-8') as dump_file:
+                dump_file.write(''.join(f'<page>{page}</page>' for page, _ in pages))
+            conf = dict(DEFAULT_TEST_CONF)
+            conf['preprocessor_components'] = ['normalize', 'tokenize', 'remove_stopwords', 'document_saver']
+            benchmark.BENCHMARK_DUMPS['test'] = {
+                'sk_wikipedia_dump_path': dump_path,
+                'inverted_index_path': os.path.join(tmp_dir, 'index.pickle'),
+            }
+            try:
+                report = benchmark.indexing_benchmark(conf, 'test', workers=1)
+            finally:
+                del benchmark.BENCHMARK_DUMPS['test']
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'index.pickle.benchmark')))
+
+        self.assertEqual(list(report['stages']),
+                         ['parse', 'normalize', 'tokenize', 'remove_stopwords', 'index', 'vectorize', 'save'])
+        self.assertEqual(report['documents'], 2)
+        self.assertEqual(report['stages']['tokenize']['documents'], 2)
+        self.assertGreater(report['stages']['tokenize']['tokens'], 0)
+        self.assertIn('cpu_utilization', report['stages']['parse']['workers'][0])
+        self.assertIn('save', benchmark.format_indexing_summary(report))
+
+    def test_run_codec_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inverted_index, _ = build_toy_index(tmp_dir)
+            report = benchmark.run_codec_benchmark(inverted_index, ['raw', 'bitpacked'], repeat=1)
+
+        self.assertEqual(list(report['codecs']), ['raw', 'bitpacked'])
+        self.assertEqual(report['terms'], len(inverted_index._index))
+        self.assertLess(report['codecs']['bitpacked']['size_mb'], report['codecs']['raw']['size_mb'])
+        self.assertGreater(report['codecs']['raw']['decode_postings_per_s'], 0)
+        self.assertIn('bitpacked', benchmark.format_codec_summary({'benchmark': 'codecs', **report}))
+
+    def test_codec_benchmark_skips_empty_records(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inverted_index, _ = build_toy_index(tmp_dir)
+            term_id, _ = next(iter(inverted_index._index.items()))
+            inverted_index._index[term_id] = IndexRecord()
+            report = benchmark.run_codec_benchmark(inverted_index, ['varint'], repeat=1)
+        self.assertEqual(report['terms'], len(inverted_index._index) - 1)
+
+    def test_compare_reports(self):
+        baseline = {'latency': {'p95_ms': 10.0}, 'throughput_qps': 100.0, 'index_load_s': 2.0, 'runs': 10}
+        current = {'latency': {'p95_ms': 12.0}, 'throughput_qps': 80.0, 'index_load_s': 1.0, 'runs': 20}
+        regressions = benchmark.compare_reports(current, baseline, threshold=0.1)
+        self.assertEqual(set(regressions), {'latency.p95_ms', 'throughput_qps'})
+
+
+if __name__ == '__main__':
+    unittest.main()
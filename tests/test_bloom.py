@@ -0,0 +1,51 @@
+import os
+import random
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, indexer, sharding, QueryBooleanOperator, SearchEngine
+from bloom import BloomFilter, filter_path
+from tests import write_toy_dump
+from wiki_parser import WikiPage
+
+utils.setup_logging(verbose=False)
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_false_positive_rate(self):
+        random.seed(1)
+        terms = {f'term{random.getrandbits(40)}' for _ in range(10000)}
+        bloom_filter = BloomFilter.from_terms(terms, len(terms), false_positive_rate=0.01)
+        self.assertTrue(all(term in bloom_filter for term in terms))
+        false_positives = sum(f'missing{idx}' in bloom_filter for idx in range(10000))
+        self.assertLess(false_positives, 200)
+        self.assertLess(bloom_filter.memory_size(), 10000 * 10 // 8 + 100)
+
+    def test_index_and_shard_filters(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = write_toy_dump(tmp_dir)
+            conf['term_filter'] = {'enabled': True, 'false_positive_rate': 0.01}
+            inverted_index = indexer.InvertedIndex()
+            inverted_index.create(dict(conf), workers=1)
+            self.assertEqual(len(inverted_index.term_filter), len(list(inverted_index.items())))
+            search_engine = SearchEngine(inverted_index, dict(conf))
+            self.assertEqual([doc.title for doc, _ in search_engine.search('rieka Dunaj')], ['Dunaj'])
+            self.assertEqual(search_engine.search('rieka zzzz'), search_engine.search('rieka'))
+
+            sharding.create_shards(dict(conf), shards_count=3, workers=2)
+            self.assertTrue(os.path.exists(filter_path(sharding.shard_path(conf['inverted_index_path'], 0))))
+            sharded_search_engine = sharding.ShardedSearchEngine(dict(conf), shards_count=3)
+            try:
+                query_doc = WikiPage(-1, None, None)
+                query_doc.terms = ['viedeň', 'rieka']
+                matching = [shard for shard in range(3)
+                            if sharded_search_engine._may_match(shard, query_doc, QueryBooleanOperator.AND, [], {})]
+                self.assertEqual(len(matching), 1)
+                self.assertEqual([doc.title for doc, _ in sharded_search_engine.search('viedeň rieka')],
+                                 [doc.title for doc, _ in search_engine.search('viedeň rieka')])
+            finally:
+                sharded_search_engine.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, indexer
+from document_store import DocumentStore, store_path, write
+from tests import TOY_DUMP_PAGES, write_toy_dump
+from wiki_parser import Infobox, WikiPage
+
+utils.setup_logging(verbose=False)
+
+
+class TestDocumentStore(unittest.TestCase):
+    def setUp(self):
+        infobox = Infobox('Mesto')
+        infobox.properties = {'krajina': 'Slovensko', 'rozloha': '367,6 km²'}
+        self.documents = [WikiPage(doc_id * 3, f'Stránka {doc_id}', f'Text stránky {doc_id}. ' * doc_id,
+                                   infobox if doc_id % 4 == 0 else None)
+                          for doc_id in range(200)]
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'documents')
+            for block_size in (1, 1024, 1024 * 1024):
+                blocks = write(path, reversed(self.documents), block_size)
+                self.assertEqual(blocks, {1: 200, 1024 * 1024: 1}.get(block_size, blocks))
+                with DocumentStore(path) as store:
+                    self.assertEqual(len(store), 200)
+                    for document in self.documents:
+                        stored = store.get(document.doc_id)
+                        self.assertEqual((stored.doc_id, stored.title, stored.raw_text, stored.infobox_title),
+                                         (document.doc_id, document.title, document.raw_text,
+                                          document.infobox_title))
+                        if document.infobox:
+                            self.assertEqual(stored.infobox.properties, document.infobox.properties)
+                        else:
+                            self.assertIsNone(stored.infobox)
+                    self.assertIsNone(store.get(1))
+                    self.assertIsNone(store.get(10000))
+                    self.assertNotIn(-1, store)
+
+    def test_written_at_index_time(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = write_toy_dump(tmp_dir)
+            conf['document_store'] = True
+            inverted_index = indexer.InvertedIndex()
+            inverted_index.create(dict(conf), workers=1)
+            with DocumentStore(store_path(conf['inverted_index_path'])) as store:
+                self.assertEqual(len(store), inverted_index.documents_count)
+                for doc_id, document in inverted_index.documents.items():
+                    self.assertIsNone(document.raw_text)
+                    self.assertEqual(store.get(doc_id).title, document.title)
+                bratislava = next(doc_id for doc_id, document in inverted_index.documents.items()
+                                  if document.title == 'Bratislava')
+                self.assertEqual(store.get(bratislava).raw_text, 'Bratislava je hlavné mesto Slovenska a sídlo kraja.')
+
+    def test_infoboxes_are_kept_only_in_store(self):
+        pages = dict(TOY_DUMP_PAGES, Bratislava='{{Infobox Mesto\n| krajina = Slovensko\n}} Bratislava je mesto.')
+        for ranking, infoboxes in (('bm25', False), ('bm25f', True)):
+            with self.subTest(ranking=ranking), tempfile.TemporaryDirectory() as tmp_dir:
+                conf = write_toy_dump(tmp_dir, pages)
+                conf['document_store'] = True
+                conf['ranking'] = ranking
+                inverted_index = indexer.InvertedIndex()
+                inverted_index.create(dict(conf), workers=1)
+                self.assertEqual(inverted_index.infoboxes, infoboxes)
+                bratislava = next(document for document in inverted_index.documents.values()
+                                  if document.title == 'Bratislava')
+                self.assertEqual(bratislava.infobox_title, 'Mesto')
+                self.assertEqual(bratislava.infobox is not None, infoboxes)
+                # field lengths are counted before the infoboxes are dropped
+                self.assertEqual(inverted_index.total_lengths['infobox'], 2)
+                with DocumentStore(store_path(conf['inverted_index_path'])) as store:
+                    self.assertEqual(store.get(bratislava.doc_id).infobox.properties, {'krajina': 'Slovensko'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import math
+import os
+import random
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils
+from evaluation import compare, evaluate, read_qrels, read_run
+from wiki_parser import WikiPage
+
+utils.setup_logging(verbose=False)
+
+
+def naive_average_precision(ranked, relevant):
+    hits, precisions = 0, 0.0
+    for rank, title in enumerate(ranked, start=1):
+        if title in relevant:
+            hits += 1
+            precisions += hits / rank
+    return precisions / len(relevant)
+
+
+def naive_ndcg(ranked, judgments, k):
+    dcg = sum((2 ** judgments.get(title, 0) - 1) / math.log2(rank + 1)
+              for rank, title in enumerate(ranked[:k], start=1))
+    ideal = sorted((grade for grade in judgments.values() if grade > 0), reverse=True)[:k]
+    return dcg / sum((2 ** grade - 1) / math.log2(rank + 1) for rank, grade in enumerate(ideal, start=1))
+
+
+class TestEvaluation(unittest.TestCase):
+    def test_metrics(self):
+        qrels = {
+            'hlavné mesto': {'Bratislava': 2, 'Viedeň': 1, 'Moskva': 1},
+            'prezident': {'Vladimir Putin': 1},
+            'bez výsledkov': {'Dunaj': 1},
+            'nehodnotené': {'Dunaj': 0},
+        }
+        run = {
+            'hlavné mesto': ['Bratislava', 'Dunaj', 'Viedeň'],
+            'prezident': ['Rusko', 'Vladimir Putin'],
+        }
+        report = evaluate(qrels, run, cutoffs=(1, 2))
+        self.assertEqual(report['queries'], 3)
+        self.assertAlmostEqual(report['map'], ((1 + 2 / 3) / 3 + 1 / 2 + 0) / 3)
+        self.assertAlmostEqual(report['p@1'], 1 / 3)
+        self.assertAlmostEqual(report['p@2'], (1 / 2 + 1 / 2) / 3)
+        self.assertAlmostEqual(report['recall@2'], (1 / 3 + 1) / 3)
+        self.assertAlmostEqual(report['f1@2'], (2 * 0.5 * (1 / 3) / (0.5 + 1 / 3) + 2 * 0.5 / 1.5) / 3)
+        self.assertAlmostEqual(report['ndcg@1'], 1 / 3)
+
+    def test_matches_per_query_computation(self):
+        rng = random.Random(7)
+        titles = [f'Stránka {idx}' for idx in range(50)]
+        qrels, run = {}, {}
+        for query_id in range(300):
+            query = f'dotaz {query_id}'
+            qrels[query] = {title: rng.randint(1, 3) for title in rng.sample(titles, rng.randint(1, 10))}
+            run[query] = rng.sample(titles, rng.randint(0, 20))
+        report = evaluate(qrels, run, cutoffs=(5, 10))
+        self.assertAlmostEqual(report['map'], sum(naive_average_precision(run[query], qrels[query])
+                                                  for query in qrels) / len(qrels))
+        self.assertAlmostEqual(report['p@5'], sum(len(set(run[query][:5]) & set(qrels[query])) / 5
+                                                  for query in qrels) / len(qrels))
+        self.assertAlmostEqual(report['ndcg@10'], sum(naive_ndcg(run[query], qrels[query], 10)
+                                                      for query in qrels) / len(qrels))
+
+    def test_read_files_and_compare(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            qrels_path = os.path.join(tmp_dir, 'qrels.jsonl')
+            with open(qrels_path, 'w', encoding='utf-8') as qrels_file:
+                qrels_file.write(json.dumps({'query': 'hlavné mesto', 'relevant': ['Bratislava', 'Viedeň']}) + '\n')
+                qrels_file.write(json.dumps({'query': 'rieka', 'relevant': {'Dunaj': 2}}) + '\n')
+            run_path = os.path.join(tmp_dir, 'results.jsonl')
+            utils.write_results_jsonl(run_path, ['hlavné mesto', 'rieka'], [
+                [(WikiPage(3, 'Bratislava', None), 0.9), (WikiPage(1, 'Rusko', None), 0.5)],
+                [(WikiPage(4, 'Dunaj', None), 0.7)],
+            ])
+            qrels = read_qrels(qrels_path)
+            run = read_run(run_path)
+            self.assertEqual(qrels['hlavné mesto'], {'Bratislava': 1, 'Viedeň': 1})
+            self.assertEqual(run['hlavné mesto'], ['Bratislava', 'Rusko'])
+
+            native = evaluate(qrels, run)
+            self.assertAlmostEqual(native['p@1'], 1.0)
+            self.assertAlmostEqual(native['recall@10'], 0.75)
+            table = compare({'native': native, 'pylucene': evaluate(qrels, {})})
+            self.assertIn('native', table.splitlines()[0])
+            self.assertIn('-1.0000', next(line for line in table.splitlines() if line.startswith('p@1 ')))
+
+    def test_no_relevant_documents(self):
+        with self.assertRaises(ValueError):
+            evaluate({'dotaz': {'Dunaj': 0}}, {})
+
+    def test_invalid_cutoffs(self):
+        for cutoffs in ([0, 5], [], [-1]):
+            with self.subTest(cutoffs=cutoffs), self.assertRaises(ValueError):
+                evaluate({'dotaz': {'Dunaj': 1}}, {'dotaz': ['Dunaj']}, cutoffs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,17 @@
 import os
+import pickle
+import random
+import tempfile
 import unittest
 
-from slovak_wiki_search_engine import indexer
-from tests import DEFAULT_TEST_CONF
+from slovak_wiki_search_engine import indexer, utils
+from tests import DEFAULT_TEST_CONF, TOY_DUMP_PAGES, write_toy_dump
+
+
+def _fail_on_second_slice(items, pbar_position=0):
+    if pbar_position == 1:
+        raise ValueError('Malformed slice')
+    return items
 
 
 class TestIndexer(unittest.TestCase):
@@ -27,6 +36,59 @@ class TestIndexer(unittest.TestCase):
         self.assertEqual(inverted_index.get('prezident').corpus_frequency, 188)
         self.assertEqual(inverted_index.get('súbor').corpus_frequency, 1549)
 
+    def test_parallel_index_matches_serial(self):
+        random.seed(0)
+        words = ' '.join(TOY_DUMP_PAGES.values()).split()
+        pages = {f'Stránka {idx}': ' '.join(random.choices(words, k=30)) for idx in range(240)}
+
+        indexes = []
+        for workers in (1, 3):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                conf = write_toy_dump(tmp_dir, pages)
+                inverted_index = indexer.InvertedIndex()
+                inverted_index.create(conf, workers)
+                indexes.append(inverted_index)
+        serial, parallel = indexes
+
+        self.assertEqual(serial.documents_count, parallel.documents_count)
+        self.assertEqual({term for term, _ in serial.items()}, {term for term, _ in parallel.items()})
+        self.assertEqual(sorted(parallel.documents), list(range(240)))
+        for term, index_record in serial.items():
+            parallel_record = parallel.get(term)
+            self.assertEqual(index_record.document_frequency, parallel_record.document_frequency)
+            self.assertEqual(index_record.corpus_frequency, parallel_record.corpus_frequency)
+            self.assertEqual({serial.document(doc_id).title: tf for doc_id, tf in index_record.term_frequencies.items()},
+                             {parallel.document(doc_id).title: tf
+                              for doc_id, tf in parallel_record.term_frequencies.items()})
+        serial_documents = {doc.title: doc for doc in serial.documents.values()}
+        for document in parallel.documents.values():
+            serial_document = serial_documents[document.title]
+            # term ids differ between the indexes, the terms they stand for do not
+            self.assertEqual(serial.vocabulary.terms(serial_document.term_ids),
+                             parallel.vocabulary.terms(document.term_ids))
+            self.assertEqual([round(x, 9) for x in serial_document.vector],
+                             [round(x, 9) for x in document.vector])
+
+    def test_load_rejects_old_format(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'inverted_index.pickle')
+            inverted_index = indexer.InvertedIndex()
+            inverted_index._index = {}
+            inverted_index.save(path)
+            self.assertEqual(indexer.load(path).format_version, indexer.INDEX_FORMAT_VERSION)
+
+            # indexes saved before the format was recorded have to be rebuilt
+            del inverted_index.format_version
+            with open(path, 'wb') as inverted_index_file:
+                pickle.dump(inverted_index, inverted_index_file)
+            with self.assertRaisesRegex(ValueError, 'Rebuild the index'):
+                indexer.load(path)
+
+    def test_failed_worker_is_raised(self):
+        # a lost slice would be merged into an index missing its documents
+        with self.assertRaises(ValueError):
+            utils.generic_parallel_execution(list(range(9)), _fail_on_second_slice, workers=3, executor='thread')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+
+from slovak_wiki_search_engine import instrumentation, utils, QueryBooleanOperator, SearchEngine
+from tests import build_toy_index
+
+utils.setup_logging(verbose=False)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.shutdown()
+        instrumentation.registry.reset()
+
+    def test_disabled_is_noop(self):
+        instrumentation.configure({'enabled': False})
+        with instrumentation.span('noop'):
+            instrumentation.count('noop')
+        self.assertEqual(instrumentation.registry.snapshot(), {'spans': {}, 'counters': {}})
+
+    def test_spans_and_counters(self):
+        instrumentation.configure({'enabled': True, 'exporters': []})
+        for _ in range(3):
+            with instrumentation.span('stage'):
+                instrumentation.count('items', 2)
+        snapshot = instrumentation.registry.snapshot()
+        self.assertEqual(snapshot['spans']['stage']['count'], 3)
+        self.assertEqual(snapshot['counters']['items'], 6)
+
+    def test_search_spans_and_json_exporter(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'metrics.json')
+            instrumentation.configure({'enabled': True, 'exporters': ['json'], 'json_path': json_path})
+            inverted_index, conf = build_toy_index(tmp_dir)
+            SearchEngine(inverted_index, conf).search('prezident neznamy', QueryBooleanOperator.OR)
+            instrumentation.export()
+            with open(json_path) as json_file:
+                metrics = json.load(json_file)
+        for name in ('search.preprocess', 'search.retrieve', 'search.rank', 'search.total'):
+            self.assertEqual(metrics['spans'][name]['count'], 1)
+        self.assertEqual(metrics['counters']['search.missing_terms'], 1)
+
+    def test_prometheus_exporter(self):
+        instrumentation.configure({'enabled': True, 'exporters': ['prometheus'], 'prometheus_port': 0})
+        with instrumentation.span('search.total'):
+            instrumentation.count('search.queries')
+        port = instrumentation._exporters[0].server.server_port
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            body = response.read().decode('utf-8')
+        self.assertIn('skwiki_search_total_seconds_count 1', body)
+        self.assertIn('skwiki_search_queries_total 1', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
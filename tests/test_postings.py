@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, QueryBooleanOperator, SearchEngine
+from postings import decode_positions, encode_positions, min_distance, phrase_match
+from tests import build_toy_index
+
+utils.setup_logging(verbose=False)
+
+
+class TestPostings(unittest.TestCase):
+    def test_encode_positions(self):
+        positions = [0, 1, 5, 130, 20000, 20001]
+        encoded = encode_positions(positions)
+        self.assertEqual(decode_positions(encoded), positions)
+        self.assertEqual(len(encoded), 8)
+        self.assertEqual(decode_positions(b''), [])
+
+    def test_phrase_match(self):
+        self.assertTrue(phrase_match([[1, 7], [8], [9]]))
+        self.assertFalse(phrase_match([[1, 7], [9], [10]]))
+        self.assertTrue(phrase_match([[1, 7], [9], [10]], slop=1))
+        # terms have to be in order
+        self.assertFalse(phrase_match([[5], [4]], slop=3))
+        self.assertFalse(phrase_match([[1], []]))
+        self.assertEqual(min_distance([1, 10, 20], [5, 18]), 2)
+
+    def test_phrase_queries_and_proximity(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inverted_index, conf = build_toy_index(tmp_dir)
+            self.assertIsNotNone(inverted_index.get('prezident').positions)
+            search_engine = SearchEngine(inverted_index, conf)
+
+            results = search_engine.search('"prezident Ruskej"')
+            self.assertEqual([doc.title for doc, _ in results], ['Rusko'])
+            self.assertEqual(search_engine.search('"Ruskej prezident"~3'), [])
+            results = search_engine.search('prezident', QueryBooleanOperator.OR, phrases=[('Slovenskej republiky', 0)])
+            self.assertEqual([doc.title for doc, _ in results], ['Slovensko'])
+
+            # putin and prezident are neighbours in "Vladimir Putin", three terms apart in "Rusko"
+            results = dict((doc.title, score) for doc, score in search_engine.search('putin prezident'))
+            search_engine.inverted_index.positional = False
+            for index_record in (inverted_index.get('putin'), inverted_index.get('prezident')):
+                index_record.positions = None
+            plain_results = dict((doc.title, score) for doc, score in search_engine.search('putin prezident'))
+            self.assertAlmostEqual(results['Vladimir Putin'] - plain_results['Vladimir Putin'], 0.2)
+            self.assertAlmostEqual(results['Rusko'] - plain_results['Rusko'], 0.2 / 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import random
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, indexer, QueryBooleanOperator, SearchEngine
+from indexer import IndexRecord, InvertedIndex
+from postings_codecs import BLOCK_SIZE, POSTINGS_CODECS, get_codec
+from ranking import BM25Ranker
+from tests import build_toy_index
+from wiki_parser import WikiPage
+
+utils.setup_logging(verbose=False)
+
+
+def random_postings(rng, count):
+    doc_ids = sorted(rng.sample(range(count * 20), count))
+    return doc_ids, [rng.choice((1, 1, 1, 2, 3, 40)) for _ in doc_ids]
+
+
+class TestPostingsCodecs(unittest.TestCase):
+    def test_round_trip(self):
+        rng = random.Random(3)
+        for name, codec in POSTINGS_CODECS.items():
+            for count in (1, BLOCK_SIZE, BLOCK_SIZE + 1, 3 * BLOCK_SIZE + 17):
+                with self.subTest(codec=name, count=count):
+                    doc_ids, term_frequencies = random_postings(rng, count)
+                    encoded = codec.encode(doc_ids, term_frequencies)
+                    decoded_doc_ids, decoded_term_frequencies = encoded.decode()
+                    self.assertEqual(decoded_doc_ids.tolist(), doc_ids)
+                    self.assertEqual(decoded_term_frequencies.tolist(), term_frequencies)
+
+                    skips = codec.skip_table(encoded)
+                    self.assertEqual(len(skips), (count + BLOCK_SIZE - 1) // BLOCK_SIZE)
+                    self.assertEqual(skips['last_doc_id'][-1], doc_ids[-1])
+                    self.assertEqual(skips['end'][-1], len(encoded.data))
+                    self.assertEqual(skips['max_term_frequency'][0], max(term_frequencies[:BLOCK_SIZE]))
+                    self.assertEqual(encoded.max_term_frequencies([doc_ids[0], doc_ids[-1] + 1]).tolist(),
+                                     [max(term_frequencies[:BLOCK_SIZE]), 0])
+
+        doc_ids, term_frequencies = random_postings(rng, 1000)
+        sizes = {name: codec.encode(doc_ids, term_frequencies).size for name, codec in POSTINGS_CODECS.items()}
+        self.assertLess(sizes['bitpacked'], sizes['varint'])
+        self.assertLess(sizes['varint'], sizes['raw'])
+        with self.assertRaises(ValueError):
+            get_codec('gzip')
+
+    def test_intersect_decodes_only_needed_blocks(self):
+        codec = get_codec('bitpacked')
+        doc_ids = list(range(0, 10 * BLOCK_SIZE * 2, 2))
+        encoded = codec.encode(doc_ids, [1] * len(doc_ids))
+        candidates = {4, 5, 2 * BLOCK_SIZE * 7 + 2, 10 ** 6}
+
+        decoded_blocks = []
+        decode_block = codec.decode_block
+
+        def counting_decode_block(data, offset, count, previous):
+            decoded_blocks.append(offset)
+            return decode_block(data, offset, count, previous)
+
+        codec.decode_block = counting_decode_block
+        try:
+            self.assertEqual(codec.intersect(encoded, candidates), {4, 2 * BLOCK_SIZE * 7 + 2})
+        finally:
+            del codec.decode_block
+        self.assertEqual(len(decoded_blocks), 2)
+        self.assertEqual(codec.intersect(encoded, set()), set())
+
+    def test_compressed_record(self):
+        index_record = IndexRecord()
+        for doc_id in (3, 1, 1, 7):
+            index_record.add_document(doc_id)
+        index_record.compress(get_codec('varint'))
+        view = index_record.view()
+        self.assertEqual(view.term_frequencies, {1: 2, 3: 1, 7: 1})
+        self.assertIsNone(index_record._term_frequencies)
+        self.assertEqual(index_record.intersect({1, 2, 7}), {1, 7})
+        self.assertEqual([view.term_frequency(doc_id) for doc_id in (1, 2, 8)], [2, 0, 0])
+        self.assertEqual(view.max_term_frequencies([2, 8]), [0, 0])
+        # a new view bounds documents by their block and decodes only it
+        view = index_record.view()
+        self.assertEqual(view.max_term_frequencies([2, 8]), [2, 0])
+        self.assertEqual(view.term_frequency(3), 1)
+        self.assertEqual(list(view._decoded_blocks), [0])
+        self.assertIsNone(view._term_frequencies)
+
+        other = IndexRecord()
+        other.add_document(9)
+        merged = IndexRecord()
+        merged.merge(index_record, tombstones={3})
+        merged.merge(other)
+        self.assertEqual(merged.term_frequencies, {1: 2, 7: 1, 9: 1})
+        self.assertEqual(merged.document_frequency, 3)
+        index_record.add_document(9)
+        self.assertIsNone(index_record.encoded)
+        self.assertEqual(index_record.term_frequencies, {1: 2, 3: 1, 7: 1, 9: 1})
+
+    def test_bm25_decodes_only_blocks_of_scored_documents(self):
+        # documents of the same length, every fourth one holds `rieka`, two documents of block 7 five times
+        documents = []
+        for doc_id in range(10 * BLOCK_SIZE):
+            document = WikiPage(doc_id, f'Dokument {doc_id}', None)
+            rieka_count = 5 if doc_id in (7 * BLOCK_SIZE, 7 * BLOCK_SIZE + 4) else int(doc_id % 4 == 0)
+            document.terms = ['mesto'] + ['rieka'] * rieka_count + ['dom'] * (5 - rieka_count)
+            documents.append(document)
+        inverted_index = InvertedIndex()
+        inverted_index._create_index(documents)
+        query_doc = WikiPage(-1, None, None)
+        query_doc.terms = ['mesto', 'rieka']
+        expected = BM25Ranker(inverted_index).rank(query_doc, documents, {term: inverted_index.get(term).view()
+                                                                          for term in query_doc.terms}, 2)
+
+        inverted_index.compress_postings('bitpacked')
+        records = {term: inverted_index.get(term).view() for term in query_doc.terms}
+        results = BM25Ranker(inverted_index).rank(query_doc, documents, records, 2)
+        self.assertEqual([(doc.doc_id, score) for doc, score in results],
+                         [(doc.doc_id, score) for doc, score in expected])
+        self.assertEqual({doc.doc_id for doc, _ in results}, {7 * BLOCK_SIZE, 7 * BLOCK_SIZE + 4})
+        # block 1 of `rieka` holds doc ids 509 to 1020, only documents in it can reach the top results
+        self.assertEqual(sorted(records['rieka']._decoded_blocks), [1])
+        self.assertEqual(sorted(records['mesto']._decoded_blocks), [3, 4, 5, 6, 7])
+        self.assertTrue(all(index_record._term_frequencies is None for index_record in records.values()))
+
+    def test_search_with_compressed_postings(self):
+        queries = ['prezident', 'prezident republika', 'bratislava rieka', '"hlavné mesto"']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inverted_index, conf = build_toy_index(tmp_dir)
+            conf['ranking'] = 'bm25'
+            search_engine = SearchEngine(inverted_index, conf)
+            expected = [(query, boolean_operator, search_engine.search(query, boolean_operator))
+                        for query in queries for boolean_operator in QueryBooleanOperator]
+
+            inverted_index.compress_postings('bitpacked')
+            path = os.path.join(tmp_dir, 'compressed.pickle')
+            inverted_index.save(path)
+            search_engine = SearchEngine(indexer.load(path), conf)
+            for query, boolean_operator, results in expected:
+                with self.subTest(query=query, boolean_operator=boolean_operator):
+                    compressed_results = search_engine.search(query, boolean_operator)
+                    self.assertEqual([(doc.title, score) for doc, score in results],
+                                     [(doc.title, score) for doc, score in compressed_results])
+            self.assertTrue(all(index_record._term_frequencies is None
+                                for _, index_record in search_engine.inverted_index.items()))
+
+
+if __name__ == '__main__':
+    unittest.main()
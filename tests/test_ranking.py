@@ -0,0 +1,106 @@
+import math
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, QueryBooleanOperator, SearchEngine
+from indexer import InvertedIndex
+from ranking import FIELDS, BM25FRanker, BM25Ranker, field_lengths
+from tests import build_toy_index, write_toy_dump
+from vectorizer import GlobalStatistics
+from wiki_parser import WikiPage
+
+utils.setup_logging(verbose=False)
+
+
+class TestRanking(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.inverted_index, self.conf = build_toy_index(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _records(self, terms):
+        return {term: self.inverted_index.get(term) for term in terms}
+
+    def test_lengths(self):
+        index = self.inverted_index
+        self.assertEqual(index.document_length(0), len(index.document(0).term_ids))
+        self.assertEqual(index.total_lengths['body'], sum(index.document_lengths.values()))
+        self.assertEqual(index.total_lengths['title'], 6)
+        self.assertEqual(field_lengths(index.document(1)), {'title': 2, 'infobox': 0})
+        statistics = GlobalStatistics.from_index(index)
+        for field in ('body', 'title', 'infobox'):
+            self.assertEqual(statistics.average_length(field), index.average_length(field))
+
+    def test_bm25_score(self):
+        ranker = BM25Ranker(self.inverted_index)
+        query_doc = WikiPage(-1, None, None)
+        query_doc.terms = ['prezident']
+        results = dict((doc.title, score) for doc, score in
+                       ranker.rank(query_doc, list(self.inverted_index.documents.values()),
+                                   self._records(['prezident'])))
+
+        documents_count = self.inverted_index.documents_count
+        idf = math.log(1 + (documents_count - 3 + 0.5) / (3 + 0.5))
+        length_norm = 0.25 + 0.75 * self.inverted_index.document_length(1) / self.inverted_index.average_length('body')
+        self.assertAlmostEqual(results['Vladimir Putin'], idf * (1 / length_norm) * 2.2 / (1 / length_norm + 1.2))
+        self.assertEqual(results['Dunaj'], 0.0)
+
+    def test_pruned_rank_matches_full_rank(self):
+        query_doc = WikiPage(-1, None, None)
+        query_doc.terms = ['prezident', 'bratislave', 'rieka', 'putin']
+        documents = list(self.inverted_index.documents.values())
+        for ranker in (BM25Ranker(self.inverted_index), BM25FRanker(self.inverted_index)):
+            full = ranker.rank(query_doc, documents, self._records(query_doc.terms))
+            for results_count in (1, 2, 3):
+                pruned = ranker.rank(query_doc, documents, self._records(query_doc.terms), results_count)
+                self.assertEqual([score for _, score in pruned], [score for _, score in full[:results_count]])
+
+    def test_upper_bounds(self):
+        query_doc = WikiPage(-1, None, None)
+        query_doc.terms = ['prezident', 'bratislave']
+        documents = list(self.inverted_index.documents.values())
+        average_lengths = {field: self.inverted_index.average_length(field) or 1.0 for field in FIELDS}
+        for ranker in (BM25Ranker(self.inverted_index), BM25FRanker(self.inverted_index)):
+            with self.subTest(ranker=type(ranker).__name__):
+                query_terms = ranker._query_terms(query_doc, self._records(query_doc.terms))
+                bounds = ranker.upper_bounds(documents, query_terms, average_lengths)
+                for document, bound in zip(documents, bounds):
+                    self.assertGreaterEqual(bound, ranker.score(document, query_terms, average_lengths))
+                # documents without the terms can be pruned
+                self.assertGreater(len(set(bounds)), 1)
+
+    def test_search(self):
+        self.conf['ranking'] = 'bm25'
+        results = SearchEngine(self.inverted_index, self.conf).search('prezident', QueryBooleanOperator.OR)
+        self.assertEqual({doc.title for doc, _ in results}, {'Rusko', 'Vladimir Putin', 'Slovensko'})
+
+        # the title of Bratislava holds the query term
+        self.conf['ranking'] = 'bm25f'
+        results = SearchEngine(self.inverted_index, self.conf).search('bratislava mesto', QueryBooleanOperator.OR)
+        self.assertEqual(results[0][0].title, 'Bratislava')
+
+        self.conf['ranking'] = 'cosine'
+        with self.assertRaises(ValueError):
+            SearchEngine(self.inverted_index, self.conf)
+
+    def test_index_without_vectors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = write_toy_dump(tmp_dir)
+            conf['ranking'] = 'bm25'
+            inverted_index = InvertedIndex()
+            inverted_index.create(conf, workers=1)
+            self.assertFalse(inverted_index.vectorized)
+            self.assertFalse(any(doc.vector for doc in inverted_index.documents.values()))
+
+            conf['ranking'] = 'tfidf'
+            search_engine = SearchEngine(inverted_index, conf)
+            self.assertEqual(search_engine.ranking, 'bm25')
+            results = search_engine.search('hlavné mesto')
+            self.assertEqual({doc.title for doc, _ in results}, {'Rusko', 'Bratislava', 'Viedeň', 'Moskva'})
+            self.assertEqual(search_engine.search_many(['hlavné mesto'])[0], results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import slovak_wiki_search_engine.search_engine as search_engine_module
+from slovak_wiki_search_engine import utils, QueryBooleanOperator, SearchEngine
+from tests import build_toy_index
+
+utils.setup_logging(verbose=False)
+
+
+def _failing_rank_queries(tasks, rerank_count, pbar_position=0):
+    raise MemoryError('Ranking worker died')
+
+
+class TestSearchMany(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.inverted_index, self.conf = build_toy_index(self.tmp_dir.name)
+        self.search_engine = SearchEngine(self.inverted_index, self.conf)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_search_many_matches_search(self):
+        queries = ['prezident federácie', 'Bratislava', 'neexistujuci pojem', 'prezident']
+        for workers in (1, 2):
+            batch_results = self.search_engine.search_many(queries, QueryBooleanOperator.OR, 3, workers=workers)
+            self.assertEqual(len(batch_results), len(queries))
+            for query, batch_result in zip(queries, batch_results):
+                single_result = self.search_engine.search(query, QueryBooleanOperator.OR, 3)
+                self.assertEqual([(doc.title, round(score, 6)) for doc, score in single_result],
+                                 [(doc.title, round(score, 6)) for doc, score in batch_result])
+
+    def test_failed_ranking_worker_is_raised(self):
+        queries = ['prezident federácie', 'Bratislava', 'rieka', 'prezident']
+        with mock.patch.object(search_engine_module.utils, 'generic_parallel_execution', return_value=[[]]):
+            # a worker result which went missing is not reported as queries without results
+            with self.assertRaises(RuntimeError):
+                self.search_engine.search_many(queries, QueryBooleanOperator.OR, 3, workers=2)
+        with mock.patch.object(search_engine_module, '_rank_queries', _failing_rank_queries):
+            with self.assertRaises(MemoryError):
+                self.search_engine.search_many(queries, QueryBooleanOperator.OR, 3, workers=2)
+
+    def test_search_does_not_read_processed_documents(self):
+        # documents of the index keep term ids, already_parsed.csv is not needed for ranking
+        os.remove(self.conf['already_processed_path'])
+        self.assertTrue(self.search_engine.search('prezident federácie', QueryBooleanOperator.OR, 3))
+        self.assertTrue(all(self.search_engine.search_many(['prezident', 'rieka'], QueryBooleanOperator.OR, 3)))
+        self.assertFalse(os.path.exists(self.conf['already_processed_path']))
+
+    def test_write_results_jsonl(self):
+        queries = ['prezident', 'rieka']
+        results = self.search_engine.search_many(queries, QueryBooleanOperator.AND, 2)
+        results_path = f'{self.tmp_dir.name}/results.jsonl'
+        utils.write_results_jsonl(results_path, queries, results)
+        with open(results_path, encoding='utf-8') as results_file:
+            records = [json.loads(line) for line in results_file]
+        self.assertEqual([record['query'] for record in records], queries)
+        self.assertEqual(records[1]['results'][0]['title'], 'Dunaj')
+        self.assertEqual(records[0]['results'][0]['rank'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
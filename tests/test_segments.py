@@ -0,0 +1,99 @@
+import os
+import re
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, segments
+from tests import build_toy_index
+from text_preprocessor import TextPreprocessor
+from wiki_parser import WikiPage
+
+utils.setup_logging(verbose=False)
+
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        inverted_index, self.conf = build_toy_index(self.tmp_dir.name)
+        self.index = segments.SegmentedIndex(inverted_index, max_segments=2)
+        self.text_preprocessor = TextPreprocessor(self.conf['preprocessor_components'], self.conf, load_docs=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def preprocess(self, pages):
+        documents = [WikiPage(-1, title, text) for title, text in pages.items()]
+        return self.text_preprocessor.preprocess(documents, workers=1)
+
+    def titles(self, term):
+        return sorted(self.index.document(doc_id).title for doc_id in self.index.get(term).documents)
+
+    def test_add_update_delete(self):
+        self.assertEqual(self.index.get('prezident').document_frequency, 3)
+        self.index.add_documents(self.preprocess({
+            'Robert Fico': 'Robert Fico je premiér a nie prezident.',
+            'Dunaj': 'Dunaj je rieka v Európe.',
+        }))
+        self.assertTrue(self.index.delete('Rusko'))
+        self.assertFalse(self.index.delete('Rusko'))
+
+        self.assertEqual(self.index.documents_count, 5)
+        self.assertEqual(self.titles('prezident'), ['Robert Fico', 'Slovensko', 'Vladimir Putin'])
+        self.assertEqual(self.index.get('prezident').corpus_frequency, 3)
+        self.assertEqual(self.titles('európe'), ['Dunaj'])
+        # old version of the updated page is not found anymore
+        self.assertRaises(AttributeError, self.index.get, 'viedeň')
+        self.assertRaises(AttributeError, self.index.get, 'federácia')
+        self.assertTrue(all(self.index.document(doc_id).vector for doc_id in self.index.get('premiér').documents))
+
+    def test_merge_matches_lookup_statistics(self):
+        self.index.add_documents(self.preprocess({'Košice': 'Košice sú mesto na východe.'}))
+        self.index.add_documents(self.preprocess({'Bratislava': 'Bratislava je hlavné mesto a prístav.'}))
+        self.index.delete('Dunaj')
+        before = {term: (record.document_frequency, record.corpus_frequency)
+                  for term, record in self.index.items()}
+        # totals are kept up to date instead of being counted on every lookup
+        total_lengths = dict(self.index.total_lengths)
+        self.assertEqual(total_lengths, self.index._count_total_lengths())
+
+        self.index.maybe_merge()
+        self.index.wait_for_merge()
+        self.assertEqual(len(self.index.segments), 2)
+        self.index.merge(full=True)
+        self.assertEqual(len(self.index.segments), 1)
+        self.assertEqual(self.index.tombstones, set())
+
+        after = {term: (record.document_frequency, record.corpus_frequency)
+                 for term, record in self.index.items()}
+        self.assertEqual(before, after)
+        self.assertEqual(self.index.documents_count, 5)
+        self.assertEqual(self.index.total_lengths, total_lengths)
+        self.assertEqual(self.index.segments[0].total_lengths, total_lengths)
+
+    def test_save_and_load(self):
+        index_path = self.conf['inverted_index_path']
+        self.index.segments[0].save(index_path)
+        self.index.segment_paths[0] = index_path
+        self.index.add_documents(self.preprocess({'Košice': 'Košice sú mesto na východe.'}))
+        self.index.delete('Dunaj')
+        self.index.save(index_path)
+
+        loaded = segments.load(index_path)
+        self.assertIsInstance(loaded, segments.SegmentedIndex)
+        self.assertEqual(len(loaded.segments), 2)
+        self.assertEqual(loaded.tombstones, self.index.tombstones)
+        self.assertEqual(sorted(loaded.document(doc_id).title for doc_id in loaded.get('mesto').documents),
+                         ['Bratislava', 'Košice'])
+
+        loaded.add_documents(self.preprocess({'Nitra': 'Nitra je mesto pod Zoborom.'}))
+        loaded.save()
+        loaded.merge()
+        loaded.save()
+        segment_files = [path for path in os.listdir(self.tmp_dir.name) if re.search(r'\.segment\d+\.', path)]
+        # files of the two merged incremental segments are replaced by one
+        self.assertEqual(len(segment_files), 1)
+        self.assertEqual(len(segments.load(index_path).get('mesto').documents), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
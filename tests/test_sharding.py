@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, indexer, sharding, QueryBooleanOperator, SearchEngine
+from tests import write_toy_dump
+
+utils.setup_logging(verbose=False)
+
+
+class TestSharding(unittest.TestCase):
+    def test_sharded_search_matches_single_index(self):
+        # bm25f ties at the third result, all results are compared
+        for ranking, results_count in (('tfidf', 3), ('bm25f', 10)):
+            with self.subTest(ranking=ranking):
+                self._check_sharded_search(ranking, results_count)
+
+    def _check_sharded_search(self, ranking, results_count):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = write_toy_dump(tmp_dir)
+            conf['ranking'] = ranking
+            statistics = sharding.create_shards(dict(conf), shards_count=3, workers=2)
+            inverted_index = indexer.InvertedIndex()
+            inverted_index.create(dict(conf), workers=1)
+
+            self.assertEqual(statistics.documents_count, inverted_index.documents_count)
+            self.assertEqual(statistics.get('prezident').document_frequency,
+                             inverted_index.get('prezident').document_frequency)
+
+            search_engine = SearchEngine(inverted_index, dict(conf))
+            sharded_search_engine = sharding.ShardedSearchEngine(dict(conf), shards_count=3)
+            try:
+                self.assertEqual(len(sharded_search_engine.search('hlavné mesto', QueryBooleanOperator.AND, 10)), 4)
+                # missing and wildcard terms are expanded against the terms of all shards
+                self.assertTrue(sharded_search_engine.search('prezident federacie'))
+                self.assertTrue(sharded_search_engine.search('bratisl*', QueryBooleanOperator.OR))
+                queries = ['hlavné mesto', 'prezident federácie', 'rieka neznáme', 'mesto prezident',
+                           '"hlavné mesto" prezident', 'prezident federacie', 'bratisl* rieka', 'hlavne mest*']
+                for boolean_operator in (QueryBooleanOperator.AND, QueryBooleanOperator.OR):
+                    batch_results = sharded_search_engine.search_many(queries, boolean_operator, results_count)
+                    for query, batch_result in zip(queries, batch_results):
+                        expected = search_engine.search(query, boolean_operator, results_count)
+                        results = sharded_search_engine.search(query, boolean_operator, results_count)
+                        self.assertEqual(sorted((doc.title, round(score, 6)) for doc, score in expected),
+                                         sorted((doc.title, round(score, 6)) for doc, score in results))
+                        self.assertEqual([doc.title for doc, _ in results], [doc.title for doc, _ in batch_result])
+            finally:
+                sharded_search_engine.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import json
+import math
+import os
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, indexer, sharding, QueryBooleanOperator, SearchEngine
+from spark.src.index_functions import (collection_record, document_postings, document_row, norm_component,
+                                       normalize_posting, parse_infobox, tfidf_weight, weight_posting)
+from spark_index import import_shards
+from tests import write_toy_dump
+from text_preprocessor import TextPreprocessor
+from wiki_parser import WikiParser
+
+utils.setup_logging(verbose=False)
+
+
+def write_part(path, records):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'part-00000'), 'w', encoding='utf-8') as part_file:
+        for record in records:
+            part_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def write_spark_index(path, documents, shards, positional, vectorized):
+    """
+    The output of spark/src/index_builder.py for preprocessed documents, the rows are built by the functions
+    of the Spark job and only the aggregations are done without Spark.
+    """
+    rows = [document_row(document.doc_id, document.title,
+                         document.infobox.to_string() if document.infobox else None, document.terms, shards)
+            for document in documents]
+    postings = [posting for document in documents
+                for posting in document_postings(document.doc_id, document.terms, positional)]
+    statistics = {}
+    for term, (_, term_frequency, _) in postings:
+        document_frequency, corpus_frequency = statistics.get(term, (0, 0))
+        statistics[term] = (document_frequency + 1, corpus_frequency + term_frequency)
+    write_part(os.path.join(path, 'statistics'), [{'term': term, 'df': df, 'cf': cf}
+                                                  for term, (df, cf) in statistics.items()])
+    lengths = [sum(row[column] for row in rows) for column in (5, 6, 7)]
+    write_part(os.path.join(path, 'collection'),
+               [collection_record(len(documents), shards, positional, vectorized, lengths)])
+
+    if vectorized:
+        weighted = [weight_posting(term, posting, statistics[term], len(documents)) for term, posting in postings]
+        norms = {}
+        for doc_id, posting in weighted:
+            norms[doc_id] = norms.get(doc_id, 0) + norm_component(posting)
+        weighted = [normalize_posting(doc_id, posting, math.sqrt(norms[doc_id])) for doc_id, posting in weighted]
+    else:
+        weighted = [(term, (doc_id, term_frequency, None, positions))
+                    for term, (doc_id, term_frequency, positions) in postings]
+
+    columns = ('shard', 'doc_id', 'title', 'infobox_name', 'infobox', 'length', 'title_length', 'infobox_length')
+    for shard in range(shards):
+        write_part(os.path.join(path, 'documents', f'shard={shard}'),
+                   [dict(zip(columns[1:], row[1:])) for row in rows if row[0] == shard])
+        shard_postings = {}
+        for term, (doc_id, term_frequency, weight, positions) in weighted:
+            if doc_id % shards == shard:
+                shard_postings.setdefault(term, []).append(
+                    {'doc_id': doc_id, 'tf': term_frequency, 'weight': weight, 'positions': positions})
+        write_part(os.path.join(path, 'postings', f'shard={shard}'),
+                   [{'term': term, 'postings': sorted(term_postings, key=lambda posting: posting['doc_id'])}
+                    for term, term_postings in shard_postings.items()])
+
+
+class TestIndexFunctions(unittest.TestCase):
+    def test_document_row(self):
+        infobox = "osoba\t{'meno': 'Ján Novák', 'narodenie': 1950}"
+        self.assertEqual(parse_infobox(infobox), ('osoba', {'meno': 'Ján Novák', 'narodenie': 1950}))
+        self.assertEqual(parse_infobox(None), (None, None))
+        row = document_row(7, 'Ján Novák', infobox, ['jan', 'novak', 'prezident'], shards=3)
+        self.assertEqual(row[:4], (1, 7, 'Ján Novák', 'osoba'))
+        self.assertEqual(json.loads(row[4]), {'meno': 'Ján Novák', 'narodenie': 1950})
+        # meno, Ján, Novák, narodenie, 1950
+        self.assertEqual(row[5:], (3, 2, 5))
+        self.assertEqual(document_row(8, None, None, [], shards=3)[2:], (None, None, None, 0, 0, 0))
+
+    def test_document_postings(self):
+        terms = ['mesto', 'rieka', 'mesto']
+        self.assertEqual(sorted(document_postings(4, terms, positional=True)),
+                         [('mesto', (4, 2, [0, 2])), ('rieka', (4, 1, [1]))])
+        self.assertEqual(sorted(document_postings(4, terms, positional=False)),
+                         [('mesto', (4, 2, None)), ('rieka', (4, 1, None))])
+
+    def test_weights_are_normalized(self):
+        self.assertAlmostEqual(tfidf_weight(1, 9, 9), 1)
+        self.assertAlmostEqual(tfidf_weight(10, 0, 9), 2 * 2)
+        statistics = {'mesto': (1, 2), 'rieka': (3, 3)}
+        postings = document_postings(4, ['mesto', 'rieka', 'mesto'], positional=True)
+        weighted = [weight_posting(term, posting, statistics[term], 9) for term, posting in postings]
+        self.assertTrue(all(doc_id == 4 for doc_id, _ in weighted))
+        norm = math.sqrt(sum(norm_component(posting) for _, posting in weighted))
+        normalized = dict(normalize_posting(doc_id, posting, norm) for doc_id, posting in weighted)
+        # the document vector has a component for every occurrence, mesto occurs twice
+        self.assertAlmostEqual(2 * normalized['mesto'][2] ** 2 + normalized['rieka'][2] ** 2, 1)
+        self.assertEqual(normalized['mesto'][:2], (4, 2))
+        self.assertEqual(normalized['mesto'][3], [0, 2])
+
+    def test_collection_record(self):
+        self.assertEqual(collection_record(5, 2, True, False, (10, 3, 4))['total_lengths'],
+                         {'body': 10, 'title': 3, 'infobox': 4})
+
+
+class TestSparkIndex(unittest.TestCase):
+    def test_imported_shards_match_single_index(self):
+        # bm25f ties at the third result, all results are compared
+        for ranking, positional, results_count in (('tfidf', True, 3), ('bm25f', False, 10)):
+            with self.subTest(ranking=ranking, positional=positional):
+                self._check_imported_shards(ranking, positional, results_count)
+
+    def _check_imported_shards(self, ranking, positional, results_count):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = write_toy_dump(tmp_dir)
+            conf['ranking'] = ranking
+            conf['shards'] = 3
+            conf['positional_postings'] = positional
+            documents = WikiParser().parse_wiki(conf['sk_wikipedia_dump_path'], workers=1)
+            for doc_id, document in enumerate(documents):
+                document.doc_id = doc_id
+            text_preprocessor = TextPreprocessor(['normalize', 'tokenize', 'remove_stopwords'], conf, load_docs=False)
+            documents = text_preprocessor.preprocess(documents, workers=1)
+            spark_index_path = os.path.join(tmp_dir, 'spark_index')
+            write_spark_index(spark_index_path, documents, 3, positional, vectorized=ranking == 'tfidf')
+
+            statistics = import_shards(dict(conf), spark_index_path, workers=2)
+            inverted_index = indexer.InvertedIndex()
+            inverted_index.create(dict(conf), workers=1)
+            self.assertEqual(statistics.documents_count, inverted_index.documents_count)
+            self.assertEqual(statistics.get('prezident').document_frequency,
+                             inverted_index.get('prezident').document_frequency)
+
+            shard = indexer.load(sharding.shard_path(conf['inverted_index_path'], 0))
+            self.assertEqual(shard.vectorized, ranking == 'tfidf')
+            for document in shard.documents.values():
+                expected_terms = next(other.terms for other in documents if other.doc_id == document.doc_id)
+                terms = shard.vocabulary.terms(document.term_ids)
+                self.assertEqual(terms if positional else sorted(terms),
+                                 expected_terms if positional else sorted(expected_terms))
+
+            search_engine = SearchEngine(inverted_index, dict(conf))
+            sharded_search_engine = sharding.ShardedSearchEngine(dict(conf), shards_count=3)
+            try:
+                queries = ['hlavné mesto', 'prezident federácie', 'rieka neznáme', 'mesto prezident']
+                if positional:
+                    queries.append('"hlavné mesto" prezident')
+                for boolean_operator in (QueryBooleanOperator.AND, QueryBooleanOperator.OR):
+                    for query in queries:
+                        expected = search_engine.search(query, boolean_operator, results_count)
+                        results = sharded_search_engine.search(query, boolean_operator, results_count)
+                        self.assertEqual(sorted((doc.title, round(score, 6)) for doc, score in expected),
+                                         sorted((doc.title, round(score, 6)) for doc, score in results))
+            finally:
+                sharded_search_engine.close()
+
+    def test_shards_count_has_to_match(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = write_toy_dump(tmp_dir)
+            conf['shards'] = 2
+            write_part(os.path.join(tmp_dir, 'spark_index', 'collection'), [{'shards': 3}])
+            with self.assertRaises(ValueError):
+                import_shards(conf, os.path.join(tmp_dir, 'spark_index'))
+
+
+if __name__ == '__main__':
+    unittest.main()
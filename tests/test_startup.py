@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ('numpy', 'pandas', 'spacy', 'spacy_udpipe', 'tqdm')
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_is_light(self):
+        # a fresh interpreter, the test process already imported everything
+        code = ('import logging, sys\n'
+                'import slovak_wiki_search_engine\n'
+                f'print(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n'
+                'print(len(logging.root.handlers))\n')
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        imported, handlers = output.split('\n')[:2]
+        self.assertEqual(imported, '[]')
+        # logging is configured by the scripts, not by the import
+        self.assertEqual(handlers, '0')
+
+    def test_import_from_other_directory(self):
+        # modules of the package are found without starting in the project root
+        code = 'import slovak_wiki_search_engine as swse; print(swse.ranking.DEFAULT_RANKING)'
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd='/', env={'PYTHONPATH': package_root}).stdout
+        self.assertEqual(output.strip(), 'tfidf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import random
+import tempfile
+import unittest
+
+from slovak_wiki_search_engine import utils, QueryBooleanOperator, SearchEngine
+from term_expansion import TermExpander, remove_diacritics
+from tests import build_toy_index
+from vocabulary import Vocabulary
+
+utils.setup_logging(verbose=False)
+
+
+def levenshtein(first: str, second: str) -> int:
+    row = list(range(len(second) + 1))
+    for idx, first_character in enumerate(first):
+        new_row = [idx + 1]
+        for jdx, second_character in enumerate(second):
+            new_row.append(min(row[jdx + 1] + 1, new_row[jdx] + 1, row[jdx] + (first_character != second_character)))
+        row = new_row
+    return row[-1]
+
+
+class TestTermExpansion(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        letters = 'abcdeáčéíľ'
+        self.terms = sorted({''.join(random.choices(letters, k=random.randint(2, 8))) for _ in range(2000)})
+        self.vocabulary = Vocabulary(self.terms[:1500])
+        for term in self.terms[1500:]:
+            self.vocabulary.add(term)
+        self.expander = TermExpander(self.vocabulary)
+
+    def test_fuzzy_matches_brute_force(self):
+        for prefix_length in (0, 1):
+            self.expander.prefix_length = prefix_length
+            for query in ['abcde', 'čaba', 'eeeee', 'ľa', 'dcbaaec']:
+                for max_distance in (0, 1, 2):
+                    folded_query = remove_diacritics(query)
+                    expected = sorted(
+                        (distance, term) for term in self.terms
+                        if remove_diacritics(term)[:prefix_length] == folded_query[:prefix_length]
+                        and (distance := levenshtein(folded_query, remove_diacritics(term))) <= max_distance
+                    )
+                    self.assertEqual(self.expander.fuzzy(query, max_distance), expected)
+
+    def test_fuzzy_with_explicit_distance_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            query = ''.join(rng.choices('abcdeáčé', k=rng.randint(1, 7)))
+            self.expander.prefix_length = prefix_length = rng.randint(0, 3)
+            max_distance = rng.randint(0, 3)
+            folded_query = remove_diacritics(query)
+            required_prefix = folded_query[:prefix_length]
+            expected = sorted(
+                (distance, term) for term in self.terms
+                if remove_diacritics(term)[:len(required_prefix)] == required_prefix
+                and (distance := levenshtein(folded_query, remove_diacritics(term))) <= max_distance
+            )
+            with self.subTest(query=query, prefix_length=prefix_length, max_distance=max_distance):
+                self.assertEqual(self.expander.fuzzy(query, max_distance), expected)
+        self.expander.prefix_length = 3
+        self.assertTrue(all(remove_diacritics(term).startswith('a') for _, term in self.expander.fuzzy('a', 2)))
+
+    def test_wildcard(self):
+        self.assertEqual(self.expander.wildcard('ab*'), [term for term in self.terms if term.startswith('ab')])
+        self.assertEqual(self.expander.wildcard('a?c*'),
+                         [term for term in self.terms if len(term) > 2 and term[0] == 'a' and term[2] == 'c'])
+        # leading wildcards would scan the whole vocabulary
+        self.assertEqual(self.expander.wildcard('*c'), [])
+        self.assertEqual(self.expander.wildcard('?bc'), [])
+
+    def test_search_expands_missing_terms(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inverted_index, conf = build_toy_index(tmp_dir)
+            search_engine = SearchEngine(inverted_index, conf)
+            results = search_engine.search('prezident Ruskej federacie')
+            self.assertEqual([doc.title for doc, _ in results], ['Rusko'])
+            results = search_engine.search('bratisl*', QueryBooleanOperator.OR)
+            self.assertEqual({doc.title for doc, _ in results}, {'Bratislava', 'Slovensko', 'Dunaj'})
+            self.assertEqual(search_engine.search('Je to pravda?'), [])
+
+            conf['term_expansion'] = {'enabled': False}
+            self.assertEqual(SearchEngine(inverted_index, conf).search('prezident Ruskej federacie', results_count=2),
+                             SearchEngine(inverted_index, conf).search('prezident Ruskej', results_count=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ from slovak_wiki_search_engine import utils
 from tests import DEFAULT_TEST_CONF
 import unittest
 
-from text_preprocessor import Normalizer, StopWordsRemover, Tokenizer, Lemmatizer, TextPreprocessor
+from text_preprocessor import Normalizer, QueryAnalyzer, StopWordsRemover, Tokenizer, Lemmatizer, TextPreprocessor
 from wiki_parser import WikiPage, WikiParser
 
 utils.setup_logging(verbose=False)
@@ -72,6 +72,24 @@ class TestTextPreprocessing(unittest.TestCase):
             'obžierať', 'veľký', 'kus', 'exkluzívný', 'kôra', 'quesadilla'
         ])
 
+    def test_query_analyzer(self):
+        conf = dict(DEFAULT_TEST_CONF)
+        components = ['normalize', 'tokenize', 'remove_stopwords', 'document_saver']
+        query_analyzer = QueryAnalyzer(components, conf)
+        self.assertEqual(query_analyzer.component_names, ['normalize', 'tokenize', 'remove_stopwords'])
+        queries = ['Prezident Ruskej federácie', 'hlavné mesto Slovenska', 'URL adries https://www.google.com']
+        expected = TextPreprocessor(components[:-1], conf, load_docs=False).preprocess_batch(
+            [WikiPage(-1, None, query) for query in queries])
+
+        query_analyzer.warmup()
+        components = query_analyzer.components
+        self.assertEqual([query_analyzer.analyze(query).terms for query in queries],
+                         [query_doc.terms for query_doc in expected])
+        self.assertEqual([query_doc.terms for query_doc in query_analyzer.analyze_batch(queries)],
+                         [query_doc.terms for query_doc in expected])
+        # components are created once and reused by later queries
+        self.assertIs(query_analyzer.components, components)
+
     def test_parser_and_preprocess(self):
         wikipedia_data_path = 'data/sk_wikipedia_dump_small_100k.xml'
         workers = 6
@@ -0,0 +1,43 @@
+import random
+import unittest
+
+from vocabulary import Vocabulary, BLOCK_SIZE
+
+
+class TestVocabulary(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        letters = 'abcdeáčďéíľňóšťúýž'
+        self.terms = sorted({''.join(random.choices(letters, k=random.randint(1, 12))) for _ in range(500)})
+
+    def test_lookup(self):
+        vocabulary = Vocabulary(self.terms)
+        self.assertEqual(len(vocabulary), len(self.terms))
+        self.assertGreater(len(self.terms), BLOCK_SIZE * 2)
+        for term_id, term in enumerate(self.terms):
+            self.assertEqual(vocabulary.get(term), term_id)
+            self.assertEqual(vocabulary.term(term_id), term)
+        self.assertIsNone(vocabulary.get('neexistuje'))
+        self.assertNotIn('', vocabulary)
+        self.assertEqual([term for term, _ in vocabulary], self.terms)
+
+    def test_ids_are_stable(self):
+        vocabulary = Vocabulary()
+        ids = {term: vocabulary.add(term) for term in self.terms[::-1]}
+        self.assertEqual(vocabulary.add(self.terms[0]), ids[self.terms[0]])
+        vocabulary.compact()
+        self.assertEqual(vocabulary.add('žžžž'), len(self.terms))
+        self.assertEqual(vocabulary.term(len(self.terms)), 'žžžž')
+        vocabulary.compact()
+        for term, term_id in ids.items():
+            self.assertEqual(vocabulary.get(term), term_id)
+            self.assertEqual(vocabulary.term(term_id), term)
+        self.assertEqual(vocabulary.get('žžžž'), len(self.terms))
+
+    def test_front_coding_is_smaller_than_terms(self):
+        vocabulary = Vocabulary(self.terms)
+        self.assertLess(len(vocabulary._data), sum(len(term.encode('utf-8')) for term in self.terms))
+
+
+if __name__ == '__main__':
+    unittest.main()